@@ -0,0 +1,383 @@
+"""A repeatable benchmark suite for the servers in this project.
+
+Each case starts a server as a subprocess, drives it with
+http_server.bench.run_benchmark, and stops it. The default server is run in
+each server mode against the same files, so the modes can be compared
+directly. Results can be saved as JSON and compared with the results of a
+previous run (e.g. from the last release) to catch performance regressions.
+
+Run from the project's root directory with ./run-benchmarks.
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+from typing import Optional, Sequence, Tuple  # noqa: F401
+
+from attr import attrs, attrib
+
+from http_server.bench import create_request, run_benchmark, BenchmarkResult
+from http_server.server import create_tcp_socket, DEFAULT_ADDR
+
+
+DEFAULT_DURATION = 5.0
+
+# By default, a case regresses if its throughput drops, or its 99th
+# percentile latency rises, by more than this fraction.
+DEFAULT_TOLERANCE = 0.1
+
+_SERVER_START_TIMEOUT = 10.0
+_SERVER_STOP_TIMEOUT = 10.0
+
+_SCRIPT_DIR = 'scripts'
+_TEST_SCRIPT_DIR = os.path.join('tests', 'scripts')
+
+# Server modes in which the default server is benchmarked, as command-line
+# arguments (see http_server.cli).
+_MODES = (
+    ('single', ()),
+    ('thread', ('--workers', '8')),
+    ('process', ('--workers', '4', '--mode', 'process')),
+    ('prefork', ('--workers', '4', '--mode', 'prefork')),
+)
+
+_GZIP = ('Accept-Encoding', 'gzip')
+
+
+@attrs(frozen=True)
+class _Case:
+    name = attrib()  # type: str
+
+    # The server's script and its command-line arguments. Scripts in
+    # _SCRIPT_DIR are run in the directory of files created by
+    # _create_files.
+    script = attrib()  # type: str
+    args = attrib()  # type: Sequence[str]
+
+    # The URIs to request, with the headers to send with each, or the data to
+    # send to a server that doesn't speak HTTP.
+    uris = attrib(default=())  # type: Sequence[str]
+    headers = attrib(default=())  # type: Sequence[Tuple[str, str]]
+    raw = attrib(default=())  # type: Sequence[bytes]
+
+    concurrency = attrib(default=8)  # type: int
+    keep_alive = attrib(default=True)  # type: bool
+
+
+def _get_cases() -> List[_Case]:
+    default_server = os.path.join(_SCRIPT_DIR, 'jth-default-server')
+    cases = []  # type: List[_Case]
+    for mode, mode_args in _MODES:
+        args = ('--quiet',) + tuple(mode_args)
+        cases.extend((
+            _Case(
+                'default/{}/small-file'.format(mode), default_server, args,
+                ['/index.html']
+            ),
+            _Case(
+                'default/{}/mixed-gzip'.format(mode), default_server, args,
+                ['/index.html', '/index.html', '/app.js', '/image.png'],
+                [_GZIP]
+            ),
+            _Case(
+                'default/{}/large-file'.format(mode), default_server, args,
+                ['/large.bin'], concurrency=4
+            ),
+            _Case(
+                'default/{}/listing'.format(mode), default_server, args,
+                ['/listing']
+            ),
+            _Case(
+                'default/{}/no-keep-alive'.format(mode), default_server,
+                args, ['/index.html'], keep_alive=False
+            ),
+        ))
+
+    cases.extend((
+        _Case(
+            'dynamic-css', os.path.join(_SCRIPT_DIR, 'jth-dynamic-css-server'),
+            ('--quiet', '--workers', '8'),
+            ['/', '/color/red/background-color/black', '/invalid']
+        ),
+        _Case(
+            'echo/single', _test_script('server_echo.py'), (),
+            raw=[b'hello', b'live long and prosper']
+        ),
+        _Case(
+            'echo/triple-caps', _test_script('server_triple_caps.py'), (),
+            raw=[b'dog dog CAT']
+        ),
+        _Case(
+            'echo/async-triple-caps',
+            _test_script('server_async_triple_caps.py'), (),
+            raw=[b'dog dog CAT']
+        ),
+        # The pool servers sleep for half a second per request and reject
+        # connections that would have to wait, so their throughput shows how
+        # many requests they serve in parallel.
+        _Case(
+            'echo/thread-pool', _test_script('server_thread_pool.py'), (),
+            raw=[b'hello'], concurrency=2
+        ),
+        _Case(
+            'echo/process-pool', _test_script('server_process_pool.py'), (),
+            raw=[b'hello'], concurrency=2
+        ),
+        _Case(
+            'echo/async', _test_script('server_async.py'), (),
+            raw=[b'hello'], concurrency=8
+        ),
+        _Case(
+            'echo/http', _test_script('server_http_echo.py'), (),
+            ['/hello', '/hello/world']
+        ),
+        _Case(
+            'echo/streaming', _test_script('server_streaming.py'), (),
+            ['/a/b/c/d/e/f/g/h']
+        ),
+        _Case(
+            'echo/prefork', _test_script('server_prefork.py'), (), ['/']
+        ),
+        # Requests forwarded to an upstream echo server over pooled
+        # connections (see http_server.proxy).
+        _Case(
+            'proxy/echo', _test_script('server_proxy.py'), (),
+            ['/hello', '/hello/world']
+        ),
+    ))
+    return cases
+
+
+def _test_script(name: str) -> str:
+    return os.path.join(_TEST_SCRIPT_DIR, name)
+
+
+def _create_files(root: str) -> None:
+    # Files for the default server: a small page, a script worth
+    # compressing, an image that isn't, a file too large to cache in memory
+    # (see http_server.static_cache), and a directory to list.
+    with open(os.path.join(root, 'index.html'), 'w') as f:
+        f.write('<!doctype html>\n<p>hello</p>\n' * 64)
+    with open(os.path.join(root, 'app.js'), 'w') as f:
+        f.write(''.join(
+            'function f{0}(x) {{ return x + {0}; }}\n'.format(i)
+            for i in range(2000)
+        ))
+    with open(os.path.join(root, 'image.png'), 'wb') as f:
+        f.write(os.urandom(128 * 1024))
+    with open(os.path.join(root, 'large.bin'), 'wb') as f:
+        f.write(os.urandom(4 * 1024 * 1024))
+    listing = os.path.join(root, 'listing')
+    os.mkdir(listing)
+    for i in range(500):
+        open(os.path.join(listing, 'file{:03}.txt'.format(i)), 'w').close()
+
+
+def _run_case(
+        case: _Case,
+        root: str,
+        duration: float,
+        processes: int) -> BenchmarkResult:
+
+    cwd = os.getcwd()
+    script = os.path.join(cwd, case.script)
+    env = dict(os.environ)
+    # Let the servers import http_server from this directory even when it
+    # isn't installed, or is installed from another version.
+    env['PYTHONPATH'] = os.pathsep.join(
+        path for path in (cwd, env.get('PYTHONPATH')) if path
+    )
+    server = subprocess.Popen(
+        (sys.executable, script) + tuple(case.args),
+        cwd=root if case.script.startswith(_SCRIPT_DIR) else cwd,
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    try:
+        _wait_for_server(server)
+        if case.raw:
+            requests = list(case.raw)
+        else:
+            requests = [
+                create_request(uri, case.keep_alive, case.headers)
+                for uri in case.uris
+            ]
+        return run_benchmark(
+            requests,
+            concurrency=case.concurrency,
+            duration=duration,
+            keep_alive=case.keep_alive,
+            raw=bool(case.raw),
+            processes=processes
+        )
+    finally:
+        server.terminate()
+        try:
+            server.wait(_SERVER_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+
+def _wait_for_server(server: 'subprocess.Popen[bytes]') -> None:
+    # Wait until the server accepts connections, rather than sleeping for a
+    # fixed time that might be too short on a slow machine.
+    deadline = time.monotonic() + _SERVER_START_TIMEOUT
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(
+                'The server exited with status {}. Is another process '
+                'listening at {}:{}?'.format(server.returncode, *DEFAULT_ADDR)
+            )
+        with create_tcp_socket() as client:
+            try:
+                client.connect(DEFAULT_ADDR)
+                return
+            except ConnectionRefusedError:
+                pass
+        if time.monotonic() > deadline:
+            raise RuntimeError('The server did not start.')
+        time.sleep(0.05)
+
+
+def _find_regressions(
+        results: Dict[str, BenchmarkResult],
+        baseline: Dict[str, Dict[str, Any]],
+        tolerance: float) -> Dict[str, List[str]]:
+
+    # Compare each case with the same case in the baseline (as saved by
+    # BenchmarkResult.to_dict), and describe how it got worse, if it did.
+    regressions = {}  # type: Dict[str, List[str]]
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        problems = []
+
+        old_rps = old['requests_per_second']
+        if old_rps > 0 and (
+                result.requests_per_second < old_rps * (1 - tolerance)):
+            problems.append('requests/sec {:.1f} -> {:.1f}'.format(
+                old_rps, result.requests_per_second
+            ))
+
+        old_p99 = old['p99']
+        new_p99 = result.latencies.percentile(99)
+        if old_p99 > 0 and new_p99 > old_p99 * (1 + tolerance):
+            problems.append('p99 {:.2f} ms -> {:.2f} ms'.format(
+                old_p99 * 1e3, new_p99 * 1e3
+            ))
+
+        if problems:
+            regressions[name] = problems
+    return regressions
+
+
+def _format_row(name: str, result: BenchmarkResult) -> str:
+    return '{:<34} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>7} {:>7}'.format(
+        name,
+        result.requests_per_second,
+        result.latencies.percentile(50) * 1e3,
+        result.latencies.percentile(99) * 1e3,
+        result.latencies.percentile(99.9) * 1e3,
+        result.error_count,
+        result.unsuccessful_count
+    )
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'patterns', metavar='PATTERN', nargs='*',
+        help='run only the cases whose names contain one of these'
+    )
+    parser.add_argument(
+        '-d', '--duration', type=float, default=DEFAULT_DURATION,
+        help='seconds to run each case for (default: %(default)s)'
+    )
+    parser.add_argument(
+        '-p', '--processes', type=int, default=1,
+        help='number of processes to divide the clients among '
+        '(default: %(default)s)'
+    )
+    parser.add_argument(
+        '--save', metavar='FILE', help='save the results as JSON'
+    )
+    parser.add_argument(
+        '--compare', metavar='FILE',
+        help='compare the results with results saved by --save, and exit '
+        'with status 1 if any case regressed'
+    )
+    parser.add_argument(
+        '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+        help='fraction by which a case may get worse before it counts as a '
+        'regression (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--list', action='store_true', help='list the cases and exit'
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = _parse_args()
+    cases = [
+        case for case in _get_cases()
+        if not args.patterns
+        or any(pattern in case.name for pattern in args.patterns)
+    ]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return 0
+
+    baseline = None  # type: Optional[Dict[str, Dict[str, Any]]]
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    print('{:<34} {:>10} {:>9} {:>9} {:>9} {:>7} {:>7}'.format(
+        'case', 'req/s', 'p50 ms', 'p99 ms', 'p999 ms', 'errors', '4xx/5xx'
+    ))
+    results = {}  # type: Dict[str, BenchmarkResult]
+    with tempfile.TemporaryDirectory() as root:
+        _create_files(root)
+        for case in cases:
+            results[case.name] = _run_case(
+                case, root, args.duration, args.processes
+            )
+            print(_format_row(case.name, results[case.name]), flush=True)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'duration': args.duration,
+                'results': {
+                    name: result.to_dict() for name, result in results.items()
+                }
+            }, f, indent=2)
+
+    if baseline is not None:
+        regressions = _find_regressions(results, baseline, args.tolerance)
+        print()
+        if not regressions:
+            print('No regressions.')
+            return 0
+        for name, problems in sorted(regressions.items()):
+            print('REGRESSION {}: {}'.format(name, '; '.join(problems)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,576 @@
+"""Tools for measuring the performance of a running server.
+
+run_benchmark drives a server with a number of concurrent clients for a fixed
+duration and collects the latency of every request. Each client sends one
+request at a time and waits for the complete response before sending the
+next, so the load adapts to the server's speed rather than overwhelming it
+(a "closed" load model). Clients reuse their connections between requests
+unless told not to, or unless the server closes them.
+
+Like the server, the clients use nothing but the socket module, so a
+benchmark needs no external tools. Note that the clients are themselves
+Python threads and compete with the server for CPU time; to keep a fast
+server busy, spread them across several processes.
+
+sources:
+- man 7 tcp
+- http://hdrhistogram.org/
+"""
+
+
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Sequence, Tuple
+from typing import Optional  # noqa: F401
+
+from attr import attrs, attrib
+
+from .server import create_tcp_socket, DEFAULT_ADDR
+from .tokens import GET_METHOD, HTTP_VERSION, CRLF
+
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_DURATION = 10.0
+DEFAULT_TIMEOUT = 10.0
+
+# The percentiles reported by format_report.
+PERCENTILES = (50.0, 95.0, 99.0, 99.9)
+
+# Kinds of errors counted by run_benchmark.
+CONNECT_ERROR = 'connect'
+TIMEOUT_ERROR = 'timeout'
+CONNECTION_ERROR = 'connection'
+PROTOCOL_ERROR = 'protocol'
+
+# Latencies are recorded in microseconds, rounded down to this many
+# significant digits, so a histogram's size depends only on the range of
+# latencies and not on the number of requests.
+_SIGNIFICANT_DIGITS = 3
+
+_RECV_SIZE = 65536
+
+
+class Histogram:
+    """A latency histogram.
+
+    Recorded latencies are rounded down to three significant digits (in
+    microseconds), so the percentiles computed from a histogram are within
+    0.1% of the exact ones. Histograms from separate clients can be merged.
+    """
+
+    def __init__(self) -> None:
+        self._counts = {}  # type: Dict[int, int]
+        self._count = 0
+        self._total = 0
+        self._max = 0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def mean(self) -> float:
+        if self._count == 0:
+            return 0.0
+        return self._total / self._count / 1e6
+
+    @property
+    def max(self) -> float:
+        return self._max / 1e6
+
+    def record(self, latency: float) -> None:
+        """Record a latency, in seconds."""
+
+        micros = int(latency * 1e6)
+        bucket = _round_down(micros)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self._count += 1
+        self._total += micros
+        self._max = max(self._max, micros)
+
+    def update(self, other: 'Histogram') -> None:
+        """Add the latencies recorded in another histogram."""
+
+        for bucket, count in other._counts.items():
+            self._counts[bucket] = self._counts.get(bucket, 0) + count
+        self._count += other._count
+        self._total += other._total
+        self._max = max(self._max, other._max)
+
+    def percentile(self, percentile: float) -> float:
+        """Get the latency, in seconds, below which the given percentage of
+        the recorded latencies fall."""
+
+        if self._count == 0:
+            return 0.0
+        # The rank of the latency among the recorded ones, counting from 1.
+        rank = max(int(percentile / 100 * self._count + 0.5), 1)
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                return bucket / 1e6
+        return self.max
+
+    def get_distribution(self) -> List[Tuple[float, int]]:
+        """Get the number of latencies below each power of two milliseconds
+        (and at least the previous one), as pairs of (upper bound in seconds,
+        count), up to the first bound above the maximum latency."""
+
+        distribution = []  # type: List[Tuple[float, int]]
+        bound = 1000
+        buckets = sorted(self._counts)
+        i = 0
+        while i < len(buckets):
+            count = 0
+            while i < len(buckets) and buckets[i] < bound:
+                count += self._counts[buckets[i]]
+                i += 1
+            distribution.append((bound / 1e6, count))
+            bound *= 2
+        return distribution
+
+
+@attrs
+class BenchmarkResult:
+    """The result of run_benchmark."""
+
+    # The time, in seconds, for which the clients sent requests.
+    duration = attrib()  # type: float
+
+    # The latencies of the requests that got complete responses.
+    latencies = attrib()  # type: Histogram
+
+    # The number of responses with each status code. Responses from a server
+    # that doesn't speak HTTP are counted under status code 0.
+    statuses = attrib()  # type: Dict[int, int]
+
+    # The number of requests that failed, by kind of error (e.g.
+    # CONNECT_ERROR).
+    errors = attrib()  # type: Dict[str, int]
+
+    # The number of connections opened, and of bytes received.
+    connections = attrib()  # type: int
+    bytes_received = attrib()  # type: int
+
+    @property
+    def requests(self) -> int:
+        return self.latencies.count
+
+    @property
+    def requests_per_second(self) -> float:
+        if self.duration <= 0:
+            return 0.0
+        return self.requests / self.duration
+
+    @property
+    def error_count(self) -> int:
+        return sum(self.errors.values())
+
+    @property
+    def unsuccessful_count(self) -> int:
+        # Responses with 4xx and 5xx status codes.
+        return sum(
+            count for status, count in self.statuses.items() if status >= 400
+        )
+
+    def update(self, other: 'BenchmarkResult') -> None:
+        """Add the requests counted in another result, which ran over the
+        same period."""
+
+        self.duration = max(self.duration, other.duration)
+        self.latencies.update(other.latencies)
+        _add_counts(self.statuses, other.statuses)
+        _add_counts(self.errors, other.errors)
+        self.connections += other.connections
+        self.bytes_received += other.bytes_received
+
+    def to_dict(self) -> Dict[str, object]:
+        """Summarize the result as a JSON-serializable dict."""
+
+        summary = {
+            'duration': self.duration,
+            'requests': self.requests,
+            'requests_per_second': self.requests_per_second,
+            'mean': self.latencies.mean,
+            'max': self.latencies.max,
+            'statuses': {
+                str(status): count for status, count in self.statuses.items()
+            },
+            'errors': dict(self.errors),
+            'connections': self.connections,
+            'bytes_received': self.bytes_received
+        }  # type: Dict[str, object]
+        for percentile in PERCENTILES:
+            summary[_percentile_name(percentile)] = (
+                self.latencies.percentile(percentile)
+            )
+        return summary
+
+
+def create_request(
+        uri: str,
+        keep_alive: bool = True,
+        headers: Sequence[Tuple[str, str]] = ()) -> bytes:
+    """Create a GET request for the given URI."""
+
+    lines = ['{} {} {}'.format(GET_METHOD, uri, HTTP_VERSION)]
+    lines.extend('{}: {}'.format(name, value) for name, value in headers)
+    if not keep_alive:
+        lines.append('Connection: close')
+    return (CRLF.join(lines) + CRLF + CRLF).encode()
+
+
+def run_benchmark(
+        requests: Sequence[bytes],
+        address: Tuple[str, int] = DEFAULT_ADDR,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        duration: float = DEFAULT_DURATION,
+        keep_alive: bool = True,
+        raw: bool = False,
+        timeout: float = DEFAULT_TIMEOUT,
+        processes: int = 1) -> BenchmarkResult:
+    """Send requests to the server at the given address for the given number
+    of seconds, from the given number of concurrent clients.
+
+    The clients cycle through the given requests (e.g. created by
+    create_request), each starting at a different one, so a request that
+    appears twice is sent twice as often. If keep_alive is true, each client
+    sends its requests over a single connection for as long as the server
+    keeps the connection open; otherwise, each request gets a new connection.
+
+    If raw is true, the server is not expected to speak HTTP: each request is
+    sent on a new connection, and the response is whatever the server sends
+    before closing the connection.
+
+    If processes is greater than one, the clients are divided among that many
+    processes.
+    """
+
+    if not requests or concurrency <= 0 or processes <= 0:
+        raise ValueError()
+
+    if processes == 1:
+        return _run_clients(
+            requests, address, 0, concurrency, duration, keep_alive, raw,
+            timeout
+        )
+
+    # Divide the clients among the processes as evenly as possible.
+    shares = [
+        concurrency // processes + (1 if i < concurrency % processes else 0)
+        for i in range(processes)
+    ]
+    with ProcessPoolExecutor(processes) as executor:
+        futures = []
+        first = 0
+        for share in shares:
+            if share > 0:
+                futures.append(executor.submit(
+                    _run_clients, requests, address, first, share, duration,
+                    keep_alive, raw, timeout
+                ))
+            first += share
+        result = futures[0].result()
+        for future in futures[1:]:
+            result.update(future.result())
+    return result
+
+
+def format_report(result: BenchmarkResult) -> str:
+    """Format a benchmark result for display."""
+
+    lines = [
+        'Requests:      {} in {:.2f} s'.format(
+            result.requests, result.duration
+        ),
+        'Requests/sec:  {:.2f}'.format(result.requests_per_second),
+        'Connections:   {}'.format(result.connections),
+        'Received:      {:.2f} MiB'.format(result.bytes_received / 2 ** 20),
+        '',
+        'Latency:',
+        '  mean  {}'.format(_format_latency(result.latencies.mean)),
+    ]
+    for percentile in PERCENTILES:
+        lines.append('  {:<5} {}'.format(
+            _percentile_name(percentile),
+            _format_latency(result.latencies.percentile(percentile))
+        ))
+    lines.append('  max   {}'.format(_format_latency(result.latencies.max)))
+
+    distribution = result.latencies.get_distribution()
+    if distribution:
+        lines.extend(('', 'Latency distribution:'))
+        most = max(count for _, count in distribution)
+        for bound, count in distribution:
+            bar = '#' * (round(40 * count / most) if most else 0)
+            lines.append('  < {:>9}  {:>9}  {}'.format(
+                _format_latency(bound), count, bar
+            ))
+
+    lines.extend(('', 'Status codes:'))
+    if result.statuses:
+        for status in sorted(result.statuses):
+            lines.append('  {:<5} {}'.format(
+                status if status else 'raw', result.statuses[status]
+            ))
+    else:
+        lines.append('  none')
+
+    lines.extend(('', 'Errors:        {}'.format(result.error_count)))
+    for kind in sorted(result.errors):
+        lines.append('  {:<10} {}'.format(kind, result.errors[kind]))
+
+    return '\n'.join(lines)
+
+
+def _run_clients(
+        requests: Sequence[bytes],
+        address: Tuple[str, int],
+        first: int,
+        concurrency: int,
+        duration: float,
+        keep_alive: bool,
+        raw: bool,
+        timeout: float) -> BenchmarkResult:
+
+    # Each client collects its own result, so that the clients never contend
+    # for a lock.
+    start = time.monotonic()
+    deadline = start + duration
+    clients = [
+        _Client(requests, address, first + i, keep_alive, raw, timeout)
+        for i in range(concurrency)
+    ]
+    threads = [
+        threading.Thread(target=client.run, args=(deadline,), daemon=True)
+        for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = clients[0].result
+    for client in clients[1:]:
+        result.update(client.result)
+    result.duration = time.monotonic() - start
+    return result
+
+
+class _Client:
+
+    def __init__(
+            self,
+            requests: Sequence[bytes],
+            address: Tuple[str, int],
+            index: int,
+            keep_alive: bool,
+            raw: bool,
+            timeout: float) -> None:
+
+        self._requests = requests
+        self._address = address
+        self._index = index
+        self._keep_alive = keep_alive and not raw
+        self._raw = raw
+        self._timeout = timeout
+        self.result = BenchmarkResult(0.0, Histogram(), {}, {}, 0, 0)
+
+        self._connection = None  # type: Optional[socket.socket]
+        self._buffer = b''
+
+    def run(self, deadline: float) -> None:
+        try:
+            while time.monotonic() < deadline:
+                request = self._requests[self._index % len(self._requests)]
+                self._index += 1
+                self._send(request)
+        finally:
+            self._close()
+
+    def _send(self, request: bytes) -> None:
+        start = time.perf_counter()
+        if self._connection is None:
+            try:
+                self._connect()
+            except OSError:
+                self._count_error(CONNECT_ERROR)
+                # Don't retry in a tight loop while the server is down.
+                time.sleep(0.01)
+                return
+
+        try:
+            assert self._connection is not None
+            self._connection.sendall(request)
+            if self._raw:
+                status, close = self._read_raw_response(), True
+            else:
+                status, close = self._read_response()
+        except socket.timeout:
+            self._count_error(TIMEOUT_ERROR)
+            self._close()
+            return
+        except ConnectionError:
+            self._count_error(CONNECTION_ERROR)
+            self._close()
+            return
+        except ValueError:
+            self._count_error(PROTOCOL_ERROR)
+            self._close()
+            return
+
+        self.result.latencies.record(time.perf_counter() - start)
+        self.result.statuses[status] = self.result.statuses.get(status, 0) + 1
+        if close or not self._keep_alive:
+            self._close()
+
+    def _connect(self) -> None:
+        connection = create_tcp_socket()
+        try:
+            connection.settimeout(self._timeout)
+            # Send small requests immediately rather than waiting to combine
+            # them with later data (see TCP_NODELAY in man 7 tcp).
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.connect(self._address)
+        except OSError:
+            connection.close()
+            raise
+        self._connection = connection
+        self._buffer = b''
+        self.result.connections += 1
+
+    def _close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _count_error(self, kind: str) -> None:
+        self.result.errors[kind] = self.result.errors.get(kind, 0) + 1
+
+    def _recv(self) -> bytes:
+        assert self._connection is not None
+        data = self._connection.recv(_RECV_SIZE)
+        self.result.bytes_received += len(data)
+        return data
+
+    def _read_raw_response(self) -> int:
+        # Raw servers close the connection after responding. Even a server
+        # that doesn't speak HTTP may reject a connection with an HTTP error
+        # response (see http_server.server.SERVICE_UNAVAILABLE), so return
+        # the status code of such a response, or 0 for any other response.
+        self._fill()
+        start = self._buffer[:16].split(b' ')
+        status = 0
+        if len(start) > 1 and start[0].startswith(b'HTTP/') and (
+                start[1].isdigit()):
+            status = int(start[1])
+        self._read_until_closed()
+        return status
+
+    def _read_until_closed(self) -> None:
+        self._buffer = b''
+        while self._recv():
+            pass
+
+    def _read_response(self) -> Tuple[int, bool]:
+        # Read a complete response and return its status code and whether
+        # the server is closing the connection. Raise ValueError if the
+        # response is malformed.
+
+        head = self._read_until(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status_line = lines[0].split(' ', 2)
+        if len(status_line) < 2 or not status_line[0].startswith('HTTP/'):
+            raise ValueError()
+        status = int(status_line[1])
+
+        headers = {}  # type: Dict[str, str]
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        close = headers.get('connection') == 'close'
+
+        # https://tools.ietf.org/html/rfc2616#section-4.4
+        if status < 200 or status in (204, 304):
+            pass
+        elif 'chunked' in headers.get('transfer-encoding', ''):
+            self._read_chunked_body()
+        elif 'content-length' in headers:
+            self._read_exactly(int(headers['content-length']))
+        else:
+            # Like a real client, read the body until the server closes the
+            # connection (https://tools.ietf.org/html/rfc7230#section-3.3.3),
+            # so a server that omits the length of a keep-alive response
+            # stalls the benchmark as it would stall a browser.
+            self._read_until_closed()
+            close = True
+        return status, close
+
+    def _read_chunked_body(self) -> None:
+        # https://tools.ietf.org/html/rfc2616#section-3.6.1
+        while True:
+            size_line = self._read_until(b'\r\n')
+            size = int(size_line.split(b';', 1)[0], 16)
+            if size == 0:
+                # Skip the trailer, which ends with an empty line.
+                while self._read_until(b'\r\n'):
+                    pass
+                return
+            self._read_exactly(size)
+            if self._read_until(b'\r\n'):
+                raise ValueError()
+
+    def _read_until(self, delimiter: bytes) -> bytes:
+        # Return the data before the delimiter, and consume the delimiter.
+        while True:
+            index = self._buffer.find(delimiter)
+            if index >= 0:
+                data = self._buffer[:index]
+                self._buffer = self._buffer[index + len(delimiter):]
+                return data
+            self._fill()
+
+    def _read_exactly(self, length: int) -> None:
+        while len(self._buffer) < length:
+            # Discard the data received so far, so that a large body is never
+            # held in memory all at once.
+            length -= len(self._buffer)
+            self._buffer = b''
+            self._fill()
+        self._buffer = self._buffer[length:]
+
+    def _fill(self) -> None:
+        data = self._recv()
+        if not data:
+            # The server closed the connection in the middle of a response.
+            raise ValueError()
+        self._buffer += data
+
+
+def _round_down(micros: int) -> int:
+    digits = len(str(micros))
+    if digits <= _SIGNIFICANT_DIGITS:
+        return micros
+    scale = 10 ** (digits - _SIGNIFICANT_DIGITS)  # type: int
+    return micros // scale * scale
+
+
+def _add_counts(counts: Dict[Any, int], other: Dict[Any, int]) -> None:
+    for key, count in other.items():
+        counts[key] = counts.get(key, 0) + count
+
+
+def _percentile_name(percentile: float) -> str:
+    # e.g. 99.9 -> 'p999'
+    return 'p' + '{:g}'.format(percentile).replace('.', '')
+
+
+def _format_latency(seconds: float) -> str:
+    if seconds < 1e-3:
+        return '{:.0f} us'.format(seconds * 1e6)
+    if seconds < 1:
+        return '{:.2f} ms'.format(seconds * 1e3)
+    return '{:.2f} s'.format(seconds)
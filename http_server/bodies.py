@@ -0,0 +1,132 @@
+"""Tools for reading the message bodies of requests.
+
+A request's body (see Request.body) isn't read when the request is parsed.
+Instead, run_server gives the handler a RequestBody that reads the body from
+the connection as the handler consumes it, starting with any part of the body
+that arrived along with the headers. A handler can therefore process a large
+upload a piece at a time (by iterating over the body), or spool it to a
+temporary file (see RequestBody.spool), rather than holding all of it in
+memory.
+
+A body whose length is given by its Content-Length header is read up to that
+length, and one sent using the chunked transfer coding is decoded as it is
+read. run_server rejects a request whose Content-Length exceeds its
+max_body_length before the handler is called, and stops reading a chunked
+body once it exceeds max_body_length.
+
+sources:
+- https://tools.ietf.org/html/rfc7230#section-3.3
+- https://tools.ietf.org/html/rfc7230#section-4.1
+"""
+
+
+import tempfile
+from typing import BinaryIO, Iterator, Optional, cast
+from typing import List  # noqa: F401
+
+
+# How much of a body is read at a time when iterating over it.
+DEFAULT_READ_SIZE = 64 * 1024
+
+# How much of a spooled body is held in memory before it is written to a
+# temporary file instead (see RequestBody.spool).
+DEFAULT_SPOOL_SIZE = 1024 * 1024
+
+
+class RequestBody:
+    """The message body of a request, which is read from the connection as it
+    is consumed (see http_server.bodies).
+
+    The body can be consumed only once, by any combination of read,
+    iteration, spool, copy_to and discard. Reading the body may raise
+    http_server.connections.RequestError if the body is invalid, exceeds the
+    server's limit, doesn't arrive in time, or is cut short by the client
+    closing the connection. Handlers should let the error propagate: the
+    server then responds with the error's status code instead.
+
+    A request without a body has an empty RequestBody.
+    """
+
+    @property
+    def length(self) -> Optional[int]:
+        """The length of the body, or None if it is sent using the chunked
+        transfer coding, in which case the length isn't known until the
+        whole body has been read."""
+        return 0
+
+    @property
+    def complete(self) -> bool:
+        """Whether the whole body has been read."""
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        """Read up to size bytes of the body, or the rest of the body if size
+        is negative. Fewer bytes are returned only at the end of the body, so
+        an empty result means that the whole body has been read."""
+
+        if size < 0:
+            return b''.join(self)
+        parts = []  # type: List[bytes]
+        while size > 0:
+            data = self._read_some(size)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        return b''.join(parts)
+
+    def __iter__(self) -> Iterator[bytes]:
+        # Yield the rest of the body as it arrives, up to DEFAULT_READ_SIZE
+        # bytes at a time.
+        while True:
+            data = self._read_some(DEFAULT_READ_SIZE)
+            if not data:
+                return
+            yield data
+
+    def spool(self, max_memory_size: int = DEFAULT_SPOOL_SIZE) -> BinaryIO:
+        """Read the rest of the body into a file object, positioned at its
+        start, which the caller must close.
+
+        The file is held in memory until it grows beyond max_memory_size
+        bytes, and is then moved to a temporary file on disk (see
+        tempfile.SpooledTemporaryFile), so a small body costs no system calls
+        and a large one costs no more memory than a small one.
+        """
+
+        spooled = cast(
+            BinaryIO, tempfile.SpooledTemporaryFile(max_size=max_memory_size)
+        )
+        try:
+            for data in self:
+                spooled.write(data)
+            spooled.seek(0)
+        except:  # noqa: E722
+            spooled.close()
+            raise
+        return spooled
+
+    def copy_to(self, file: BinaryIO) -> int:
+        """Write the rest of the body to an open file, returning the number
+        of bytes written."""
+
+        written = 0
+        for data in self:
+            file.write(data)
+            written += len(data)
+        return written
+
+    def discard(self) -> None:
+        """Read and discard the rest of the body."""
+
+        for _ in self:
+            pass
+
+    def _read_some(self, size: int) -> bytes:
+        # Read between 1 and size bytes of the body, or return b'' at the end
+        # of the body. size is positive.
+        return b''
+
+
+# Shared by every request without a body, since an empty body has no state.
+EMPTY_BODY = RequestBody()
@@ -0,0 +1,190 @@
+"""Command-line options shared by the server scripts."""
+
+
+import argparse
+from typing import Callable, List, Optional, Sequence
+from typing import TextIO  # noqa: F401
+
+from .connections import DEFAULT_BODY_TIMEOUT, DEFAULT_HEADER_TIMEOUT
+from .connections import DEFAULT_MIN_RATE
+from .handlers import create_handler, Handler
+from .logs import AccessLog, COMMON_FORMAT, FORMATS
+from .metrics import Metrics
+from .requests import Request
+from .server import run_server
+from .server import DEFAULT_BACKLOG, DEFAULT_RETRY_AFTER
+from .server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_WRITE_TIMEOUT
+from .server import PREFORK_MODE, PROCESS_MODE, THREAD_MODE
+
+
+def run_server_from_command_line(
+        handler: Handler,
+        description: str,
+        get_route: Optional[Callable[[Request], Optional[str]]] = None,
+        args: Optional[List[str]] = None) -> None:
+    """Run a server with the given handler, configured by command-line
+    arguments (see run_server for the meaning of each option).
+
+    With --metrics, the server also serves metrics at /metrics, labeling
+    requests by route with get_route (see http_server.metrics). Unless
+    --quiet is given, the server logs requests to standard output or to
+    --log-file (see http_server.logs).
+    """
+
+    parser = create_parser(description)
+    options = parser.parse_args(args)
+    run_server_from_options(handler, parser, options, get_route)
+
+
+def create_parser(
+        description: str,
+        parents: Sequence[argparse.ArgumentParser] = ()) -> argparse.ArgumentParser:  # noqa: E501
+    """Create a parser for the options shared by the server scripts.
+
+    A script with options of its own can pass a parser for them (created
+    with add_help=False) in parents, then create its handler from the parsed
+    options and call run_server_from_options.
+    """
+
+    parser = argparse.ArgumentParser(
+        description=description, parents=parents
+    )
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        '--workers', type=int, default=0,
+        help='number of worker threads or processes (default: none)'
+    )
+    parser.add_argument(
+        '--mode', choices=(THREAD_MODE, PROCESS_MODE, PREFORK_MODE),
+        default=THREAD_MODE
+    )
+    parser.add_argument(
+        '--threads', type=int, default=0,
+        help='number of threads in each prefork worker (default: none)'
+    )
+    parser.add_argument(
+        '--backlog', type=int, default=DEFAULT_BACKLOG,
+        help='maximum number of connections waiting to be accepted '
+        '(default: %(default)s)'
+    )
+    parser.add_argument(
+        '--max-queue-time', type=float, metavar='SECONDS',
+        help='reject connections that waited longer than this for a worker '
+        '(default: no limit)'
+    )
+    parser.add_argument(
+        '--max-in-flight', type=int, metavar='REQUESTS',
+        help='maximum number of requests handled at once in each process '
+        '(default: no limit)'
+    )
+    parser.add_argument(
+        '--retry-after', type=int, default=DEFAULT_RETRY_AFTER,
+        metavar='SECONDS',
+        help='Retry-After value of 503 responses (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--quiet', action='store_true',
+        help="don't log requests"
+    )
+    parser.add_argument(
+        '--log-format', choices=FORMATS, default=COMMON_FORMAT,
+        help='format of the access log (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--log-sample', type=float, default=1.0, metavar='RATE',
+        help='fraction of requests to log; responses with 5xx status codes '
+        'are always logged (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--log-file', metavar='FILE',
+        help='append the access log to FILE instead of standard output'
+    )
+    parser.add_argument(
+        '--header-timeout', type=float, default=DEFAULT_HEADER_TIMEOUT,
+        metavar='SECONDS',
+        help='time allowed for receiving a request line and headers '
+        '(default: %(default)s)'
+    )
+    parser.add_argument(
+        '--body-timeout', type=float, default=DEFAULT_BODY_TIMEOUT,
+        metavar='SECONDS',
+        help='time allowed for receiving a message body '
+        '(default: %(default)s)'
+    )
+    parser.add_argument(
+        '--handler-timeout', type=float, metavar='SECONDS',
+        help='time allowed for handling a request (default: no limit)'
+    )
+    parser.add_argument(
+        '--write-timeout', type=float, default=DEFAULT_WRITE_TIMEOUT,
+        metavar='SECONDS',
+        help='time allowed for sending a response (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--min-rate', type=float, default=DEFAULT_MIN_RATE,
+        metavar='BYTES',
+        help='extra second allowed for every this many bytes transferred '
+        '(default: %(default)s)'
+    )
+    parser.add_argument(
+        '--metrics', action='store_true',
+        help='serve request counts and timings at /metrics'
+    )
+    return parser
+
+
+def run_server_from_options(
+        handler: Handler,
+        parser: argparse.ArgumentParser,
+        options: argparse.Namespace,
+        get_route: Optional[Callable[[Request], Optional[str]]] = None) -> None:  # noqa: E501
+    """Run a server with the given handler, configured by options parsed by
+    a parser from create_parser (see run_server_from_command_line)."""
+
+    if not 0 <= options.log_sample <= 1:
+        parser.error('--log-sample must be between 0 and 1')
+
+    metrics = None  # type: Optional[Metrics]
+    if options.metrics:
+        metrics = Metrics(get_route)
+        # The wrapped handler keeps responding (and caching its responses)
+        # as it did, and the new one accepts the same methods, so e.g. a
+        # handler that accepts POST still does.
+        handler = create_handler(
+            metrics.wrap(handler.handle), methods=handler.methods
+        )
+
+    log_file = None  # type: Optional[TextIO]
+    access_log = None  # type: Optional[AccessLog]
+    if not options.quiet:
+        if options.log_file:
+            log_file = open(options.log_file, 'a')
+        access_log = AccessLog(
+            log_file, options.log_format, options.log_sample
+        )
+
+    try:
+        run_server(
+            handler,
+            address=(options.host, options.port),
+            verbose=not options.quiet,
+            workers=options.workers,
+            mode=options.mode,
+            threads=options.threads,
+            backlog=options.backlog,
+            max_queue_time=options.max_queue_time,
+            max_in_flight=options.max_in_flight,
+            retry_after=options.retry_after,
+            header_timeout=options.header_timeout,
+            body_timeout=options.body_timeout,
+            handler_timeout=options.handler_timeout,
+            write_timeout=options.write_timeout,
+            min_rate=options.min_rate,
+            metrics=metrics,
+            access_log=access_log
+        )
+    finally:
+        # run_server closes the access log, writing what's left of it, first.
+        if log_file is not None:
+            log_file.close()
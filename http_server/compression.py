@@ -0,0 +1,214 @@
+"""Tools for compressing responses.
+
+A client lists the content codings it can decode in the Accept-Encoding
+header. If one of them is a compression format that the server supports, the
+server may compress the message body and name the coding in the
+Content-Encoding header. Text typically compresses to a third or less of its
+original size.
+
+sources:
+- https://tools.ietf.org/html/rfc7231#section-5.3.4
+- https://tools.ietf.org/html/rfc7231#section-3.1.2.2
+- https://tools.ietf.org/html/rfc7230#section-4.2
+- https://developer.mozilla.org/en-US/docs/Web/HTTP/Compression
+"""
+
+
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+from .media_types import MEDIA_TYPES
+from .requests import Request
+from .responses import Response, StreamingResponse
+
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+
+# The supported content codings, in order of preference.
+ENCODINGS = (GZIP, DEFLATE)
+
+# Compressible media types. Images and audio are already compressed, so
+# compressing them again would cost CPU time and save nothing.
+COMPRESSIBLE_MEDIA_TYPES = frozenset(
+    MEDIA_TYPES[name] for name in ('plain', 'html', 'css', 'javascript')
+)
+
+# Message bodies shorter than this aren't compressed. The savings would be a
+# few hundred bytes at most, and may be negative, since compression adds a
+# header and a trailer.
+MIN_LENGTH = 1024
+
+# zlib's default compression level, which is a good trade-off between speed
+# and size.
+_LEVEL = 6
+
+# Window sizes (see zlib.compressobj) that select the gzip and zlib formats.
+# HTTP's "deflate" coding is the zlib format, not raw DEFLATE
+# (https://tools.ietf.org/html/rfc7230#section-4.2.2).
+_WBITS = {GZIP: 16 + zlib.MAX_WBITS, DEFLATE: zlib.MAX_WBITS}
+
+# Aliases of the supported content codings
+# (https://tools.ietf.org/html/rfc7230#section-4.2.3).
+_ALIASES = {'x-gzip': GZIP}
+
+
+def is_compressible(
+        content_type: Optional[Tuple[str, str]], length: int) -> bool:
+    """Determine whether a message body of the given content type and length
+    is worth compressing."""
+
+    return content_type in COMPRESSIBLE_MEDIA_TYPES and length >= MIN_LENGTH
+
+
+def negotiate_encoding(
+        request: Request,
+        encodings: Sequence[str] = ENCODINGS) -> Optional[str]:
+    """Choose which of the given content codings to use for a response to the
+    request, or return None if the response shouldn't be compressed.
+
+    The client's preferred coding (the one with the highest quality value in
+    the Accept-Encoding header) is chosen, with ties broken by the order of
+    the given codings.
+    """
+
+    accept_encoding = request.headers.get('Accept-Encoding')
+    if accept_encoding is None:
+        # The client may accept any coding, but it is safer to assume that it
+        # doesn't.
+        return None
+
+    qualities = _parse_accept_encoding(accept_encoding)
+    best = None  # type: Optional[str]
+    best_quality = 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(message_body: bytes, encoding: str) -> bytes:
+    """Compress a message body using the given content coding (one of
+    ENCODINGS)."""
+
+    # The gzip header written by zlib has no file name or modification time,
+    # so the same body always compresses to the same bytes.
+    compressor = zlib.compressobj(_LEVEL, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(message_body) + compressor.flush()
+
+
+def compress_response(request: Request, response: Response) -> Response:
+    """Compress a response's message body if the response is compressible and
+    the client accepts a supported content coding.
+
+    A StreamingResponse is compressed as it is sent, whatever its length.
+    Return the response itself if it isn't compressed. Other responses whose
+    message bodies aren't held in memory (e.g. FileResponses) are never
+    compressed.
+    """
+
+    if isinstance(response, StreamingResponse):
+        return _compress_streaming_response(request, response)
+
+    message_body = response.message_body
+    if message_body is None or not is_compressible(
+            response.content_type, len(message_body)):
+        return response
+
+    headers = response.headers + (_VARY,)
+    encoding = negotiate_encoding(request)
+    if encoding is not None:
+        compressed = compress(message_body, encoding)
+        if len(compressed) < len(message_body):
+            return Response(
+                response.status_code,
+                response.content_type,
+                compressed,
+                headers + (('Content-Encoding', encoding),)
+            )
+
+    return Response(
+        response.status_code, response.content_type, message_body, headers
+    )
+
+
+def compress_chunks(
+        chunks: Iterable[Union[bytes, str]],
+        encoding: str) -> Iterator[bytes]:
+    """Compress a message body given as an iterable of chunks (see
+    StreamingResponse) using the given content coding, yielding compressed
+    chunks as they become available."""
+
+    compressor = zlib.compressobj(_LEVEL, zlib.DEFLATED, _WBITS[encoding])
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            # The compressor buffers its input, so this is often empty.
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def get_variant_etag(etag: str, encoding: str) -> str:
+    """Get the entity tag of a resource's representation that is compressed
+    with the given content coding, given the resource's entity tag.
+
+    Each representation of a resource needs its own entity tag
+    (https://tools.ietf.org/html/rfc7232#section-2.3.3).
+    """
+
+    return '{}-{}"'.format(etag[:-1], encoding)
+
+
+def _compress_streaming_response(
+        request: Request, response: StreamingResponse) -> Response:
+    if response.content_type not in COMPRESSIBLE_MEDIA_TYPES:
+        return response
+
+    headers = response.headers + (_VARY,)
+    encoding = negotiate_encoding(request)
+    if encoding is None:
+        return StreamingResponse(
+            response.status_code,
+            response.content_type,
+            response.chunks,
+            headers
+        )
+    return StreamingResponse(
+        response.status_code,
+        response.content_type,
+        compress_chunks(response.chunks, encoding),
+        headers + (('Content-Encoding', encoding),)
+    )
+
+
+def _parse_accept_encoding(value: str) -> Dict[str, float]:
+    # https://tools.ietf.org/html/rfc7231#section-5.3.4
+    # https://tools.ietf.org/html/rfc7231#section-5.3.1
+    qualities = {}  # type: Dict[str, float]
+    for element in value.split(','):
+        coding, _, params = element.partition(';')
+        coding = coding.strip().lower()
+        if coding == '':
+            continue
+        quality = 1.0
+        name, _, param_value = params.partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                quality = float(param_value)
+            except ValueError:
+                quality = 0.0
+        qualities[_ALIASES.get(coding, coding)] = quality
+    return qualities
+
+
+# Tells caches that the response depends on the request's Accept-Encoding
+# header (https://tools.ietf.org/html/rfc7231#section-7.1.4).
+_VARY = ('Vary', 'Accept-Encoding')
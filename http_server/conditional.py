@@ -0,0 +1,109 @@
+"""Tools for responding to conditional requests.
+
+A client that has cached a response can ask the server to send it again only
+if it has changed, by including the validators (ETag and Last-Modified
+headers) of the cached response in the request. If the resource has not
+changed, the server responds with 304 Not Modified and no message body.
+
+sources:
+- https://tools.ietf.org/html/rfc7232
+- https://tools.ietf.org/html/rfc2616#section-10.3.5
+"""
+
+
+import email.utils
+import os
+from typing import List, Tuple
+
+from .requests import Request
+from .tokens import GET_METHOD, HEAD_METHOD
+
+
+def get_validators(file_stat: os.stat_result) -> List[Tuple[str, str]]:
+    """Get the ETag and Last-Modified headers for a file.
+
+    The entity tag is derived from the file's inode number, size, and
+    modification time, so computing it doesn't require reading the file.
+    """
+
+    # https://tools.ietf.org/html/rfc7232#section-2.3
+    etag = '"{:x}-{:x}-{:x}"'.format(
+        file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns
+    )
+
+    # https://tools.ietf.org/html/rfc7232#section-2.2
+    # https://tools.ietf.org/html/rfc7231#section-7.1.1.1
+    last_modified = email.utils.formatdate(file_stat.st_mtime, usegmt=True)
+
+    return [('ETag', etag), ('Last-Modified', last_modified)]
+
+
+def is_not_modified(
+        request: Request, etag: str, last_modified: float) -> bool:
+    """Determine whether the client already has the current version of a
+    resource with the given entity tag and modification time (a timestamp),
+    in which case the server should respond with 304 Not Modified.
+    If-Modified-Since is honored only for GET and HEAD requests."""
+
+    # If-None-Match takes precedence over If-Modified-Since
+    # (https://tools.ietf.org/html/rfc7232#section-6).
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # https://tools.ietf.org/html/rfc7232#section-3.2
+        if if_none_match.strip() == '*':
+            return True
+        weak_etag = _weaken(etag)
+        return any(
+            _weaken(tag.strip()) == weak_etag
+            for tag in if_none_match.split(',')
+        )
+
+    # If-Modified-Since must be ignored unless the method is GET or HEAD
+    # (https://tools.ietf.org/html/rfc7232#section-3.3).
+    if request.method not in (GET_METHOD, HEAD_METHOD):
+        return False
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since is not None:
+        date = email.utils.parsedate_tz(if_modified_since)
+        if date is None:
+            # An invalid date is ignored.
+            return False
+        # HTTP dates have a resolution of one second.
+        return int(last_modified) <= email.utils.mktime_tz(date)
+
+    return False
+
+
+def is_range_current(
+        request: Request, etag: str, last_modified: float) -> bool:
+    """Determine whether the server should honor the request's Range header
+    for a resource with the given entity tag and modification time.
+
+    If the request has an If-Range header, the client only wants part of the
+    resource if it has not changed; otherwise, the whole resource should be
+    sent (https://tools.ietf.org/html/rfc7233#section-3.2).
+    """
+
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # If-Range uses the strong comparison function, so a weak entity tag
+        # never matches.
+        return if_range == etag and not etag.startswith('W/')
+
+    date = email.utils.parsedate_tz(if_range)
+    return date is not None and email.utils.mktime_tz(date) == int(
+        last_modified
+    )
+
+
+def _weaken(etag: str) -> str:
+    # If-None-Match uses the weak comparison function, which ignores whether
+    # either entity tag is weak
+    # (https://tools.ietf.org/html/rfc7232#section-2.3.2).
+    return etag[2:] if etag.startswith('W/') else etag
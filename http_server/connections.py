@@ -0,0 +1,602 @@
+"""Tools for reading requests from connections."""
+
+
+import re
+import socket
+import time
+from typing import Optional
+
+from .bodies import EMPTY_BODY, RequestBody
+from .requests import Headers, check_request_line, is_request_line_prefix
+from .tokens import HTTP_VERSION, CRLF
+
+
+# HTTP doesn't specify maximum lengths for any part of a request, but servers
+# must be able to reject requests that are longer than they are willing to
+# handle. The defaults below are in line with those of other servers.
+#
+# sources:
+# - https://tools.ietf.org/html/rfc2616#section-3.2.1
+# - https://tools.ietf.org/html/rfc6585#section-5
+# - https://stackoverflow.com/a/2660036
+# - https://serverfault.com/a/151092
+DEFAULT_MAX_REQUEST_LINE_LENGTH = 4096
+DEFAULT_MAX_HEADERS_LENGTH = 8192
+
+# How long (in seconds) a client may take to send a request's request line and
+# headers, once it has sent the first byte, and to send its message body. A
+# client that sends data slowly but steadily gets an extra second for every
+# DEFAULT_MIN_RATE bytes (see Deadline). Without these limits, a client that
+# trickles a request a byte at a time could occupy a worker indefinitely.
+#
+# sources:
+# - https://httpd.apache.org/docs/2.4/mod/mod_reqtimeout.html
+# - https://en.wikipedia.org/wiki/Slowloris_(computer_security)
+DEFAULT_HEADER_TIMEOUT = 10.0
+DEFAULT_BODY_TIMEOUT = 10.0
+DEFAULT_MIN_RATE = 500.0
+
+_CRLF = CRLF.encode()
+
+# Marks the end of a request's headers
+# (https://tools.ietf.org/html/rfc2616#section-5).
+_HEADERS_END = (CRLF + CRLF).encode()
+
+# Sent to a client that asked to be told to go ahead before sending a
+# request's body (https://tools.ietf.org/html/rfc7231#section-5.1.1).
+_CONTINUE = '{} 100 Continue{}{}'.format(HTTP_VERSION, CRLF, CRLF).encode()
+
+# Matches the line that begins a chunk of a chunked body: the size of the
+# chunk in hexadecimal, optionally followed by chunk extensions, which are
+# ignored. The size is matched strictly (unlike by int), since a server and a
+# proxy in front of it that disagree about where a body ends can be tricked
+# into treating part of a body as a separate request.
+#
+# sources:
+# - https://tools.ietf.org/html/rfc7230#section-4.1
+# - https://tools.ietf.org/html/rfc7230#section-9.5
+_CHUNK_SIZE_LINE = re.compile(rb'([0-9A-Fa-f]{1,16})[ \t]*(?:;[^\r\n]*)?')
+
+
+class RequestError(Exception):
+    """Raised when a request cannot be read. The server should respond with
+    the given status code and close the connection.
+
+    If the request was rejected because of its request line, request_line is
+    the part of it that was received, without the CRLF that ends it, for
+    logging.
+    """
+
+    def __init__(self, status_code: int, request_line: bytes = b'') -> None:
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.request_line = request_line
+
+
+class Deadline:
+    """The time by which a transfer over a connection must be finished.
+
+    The transfer may take timeout seconds (or forever, if timeout is None),
+    plus one second for every min_rate bytes transferred (see Deadline.extend),
+    so that a large transfer at a reasonable rate isn't cut short, but a client
+    that sends or receives data slowly can't hold the connection for long.
+    """
+
+    __slots__ = ('_time', '_min_rate')
+
+    def __init__(self, timeout: Optional[float], min_rate: float = 0) -> None:
+        self._time = None if timeout is None else time.monotonic() + timeout
+        self._min_rate = min_rate
+
+    def extend(self, length: int) -> None:
+        """Allow time for transferring the given number of bytes."""
+
+        if self._time is not None and self._min_rate > 0:
+            self._time += length / self._min_rate
+
+    def apply(self, connection: socket.socket) -> None:
+        """Set the connection's timeout to the time remaining, so that the
+        next call to e.g. recv or sendall raises socket.timeout once the
+        deadline has passed. Raise socket.timeout if it already has."""
+
+        if self._time is None:
+            set_timeout(connection, None)
+            return
+        remaining = self._time - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout('timed out')
+        connection.settimeout(remaining)
+
+
+def set_timeout(connection: socket.socket, timeout: Optional[float]) -> None:
+    """Set a connection's timeout, unless it is already set to that value.
+
+    socket.socket.settimeout makes a system call (man 2 ioctl, FIONBIO) even
+    if the timeout doesn't change, so this saves one for most requests.
+    """
+
+    if connection.gettimeout() != timeout:
+        connection.settimeout(timeout)
+
+
+class ConnectionReader:
+    """Reads requests from a connected socket.
+
+    Data is received directly into a buffer that is allocated once per
+    connection, rather than into a new bytes object for every call to recv.
+    The buffer may hold the beginning of the next request (e.g. if the client
+    pipelines requests), which is kept for the next call to read_request.
+
+    The reader waits for the first byte of each request for as long as the
+    connection's timeout (see socket.socket.settimeout) when the reader was
+    created. Once the first byte has arrived, the rest of the request line and
+    headers must arrive within header_timeout seconds, and a message body
+    within body_timeout seconds, each extended for clients that send at least
+    min_rate bytes per second (see Deadline).
+
+    The request line is checked as it arrives (see
+    http_server.requests.check_request_line), so a request that the server
+    can't handle is rejected without waiting for its headers, and most
+    garbage (e.g. from scanners and bots) is rejected as soon as its first
+    bytes arrive, rather than holding a worker until the request times out.
+    """
+
+    def __init__(
+            self,
+            connection: socket.socket,
+            max_request_line_length: int = DEFAULT_MAX_REQUEST_LINE_LENGTH,
+            max_headers_length: int = DEFAULT_MAX_HEADERS_LENGTH,
+            header_timeout: Optional[float] = DEFAULT_HEADER_TIMEOUT,
+            body_timeout: Optional[float] = DEFAULT_BODY_TIMEOUT,
+            min_rate: float = DEFAULT_MIN_RATE) -> None:
+
+        self._connection = connection
+        self._max_request_line_length = max_request_line_length
+        self._max_headers_length = max_headers_length
+        self._idle_timeout = connection.gettimeout()
+        self._header_timeout = header_timeout
+        self._body_timeout = body_timeout
+        self._min_rate = min_rate
+
+        self._buffer = bytearray(max_headers_length)
+        self._view = memoryview(self._buffer)
+
+        # The received but not yet consumed data is self._buffer[start:end].
+        # Everything before self._scanned is known not to contain the end of
+        # the headers.
+        self._start = 0
+        self._end = 0
+        self._scanned = 0
+
+        # Whether the current request's request line has been received and
+        # checked.
+        self._line_checked = False
+
+        # When the first byte of the request being read, or last read, was
+        # received (see time.perf_counter).
+        self.request_started = 0.0
+
+    def read_request(self) -> Optional[bytes]:
+        """Read the next request's request line and headers, including the
+        empty line that ends them.
+
+        Return None if the client closes the connection before sending a
+        complete request. Raise RequestError if the request line is invalid
+        (see http_server.requests.check_request_line), the request exceeds
+        the reader's limits, or it takes too long to arrive (408), and
+        socket.timeout if no request arrives before the connection's timeout.
+        """
+
+        # The request started arriving either with an earlier recv (e.g. if
+        # it was pipelined) or with the next one. Waiting for the next
+        # request on an idle connection doesn't count.
+        waiting = self._end == self._start
+        if not waiting:
+            self.request_started = time.perf_counter()
+            deadline = Deadline(self._header_timeout, self._min_rate)
+
+        end = self._find_headers_end()
+        while end == -1:
+            self._check_lengths()
+            if waiting:
+                set_timeout(self._connection, self._idle_timeout)
+                received = self._receive()
+                self.request_started = time.perf_counter()
+                deadline = Deadline(self._header_timeout, self._min_rate)
+                waiting = False
+            else:
+                received = self._receive_before(deadline)
+            if received == 0:
+                return None
+            deadline.extend(received)
+            end = self._find_headers_end()
+
+        self._check_lengths(end)
+
+        request = bytes(self._view[self._start:end])
+        self._consume(end)
+        return request
+
+    def get_body(self, headers: Headers, max_length: int) -> RequestBody:
+        """Get the message body of the request last read by read_request,
+        given its headers. The body is read from the connection as it is
+        consumed (see http_server.bodies), and must be consumed or discarded
+        before the next request is read.
+
+        The body is delimited by the request's Transfer-Encoding or
+        Content-Length header
+        (https://tools.ietf.org/html/rfc7230#section-3.3.3). Raise
+        RequestError if they are invalid or contradict each other (400), if
+        the Content-Length exceeds max_length (413), or if the body uses a
+        transfer coding other than chunked (501). Reading the body raises
+        RequestError if a chunked body exceeds max_length (413) or is
+        malformed (400), if the client closes the connection before sending
+        the whole body (400), or if the body takes too long to arrive (408,
+        see body_timeout).
+
+        If the client asked to be told to go ahead before sending the body
+        (with "Expect: 100-continue"), the reader does so when the body is
+        first read.
+        """
+
+        transfer_encoding = headers.get('Transfer-Encoding')
+        content_length = headers.get('Content-Length')
+        if transfer_encoding is None and content_length is None:
+            return EMPTY_BODY
+
+        # A request with both headers may be an attempt to smuggle a request
+        # past a proxy that uses the other one, so it's rejected rather than
+        # letting Transfer-Encoding win.
+        # https://tools.ietf.org/html/rfc7230#section-3.3.3
+        if transfer_encoding is not None and content_length is not None:
+            raise RequestError(400)
+
+        deadline = Deadline(self._body_timeout, self._min_rate)
+        expect_continue = (
+            headers.get('Expect', '').strip().lower() == '100-continue'
+        )
+
+        if transfer_encoding is not None:
+            codings = [
+                coding.strip().lower()
+                for coding in transfer_encoding.split(',')
+            ]
+            if codings != ['chunked']:
+                # https://tools.ietf.org/html/rfc7230#section-3.3.1
+                raise RequestError(501)
+            return _ChunkedBody(self, deadline, expect_continue, max_length)
+
+        # Multiple Content-Length headers are combined into one
+        # comma-separated value, which isn't valid.
+        assert content_length is not None
+        if not (content_length.isdigit() and content_length.isascii()):
+            raise RequestError(400)
+        length = int(content_length)
+        if length > max_length:
+            # https://tools.ietf.org/html/rfc2616#section-10.4.14
+            raise RequestError(413)
+        if length == 0:
+            return EMPTY_BODY
+        # The whole length is known in advance, so the time allowed for it is
+        # too.
+        deadline.extend(length)
+        return _FixedLengthBody(self, deadline, expect_continue, length)
+
+    def finish_body(self, body: RequestBody) -> bool:
+        """Discard whatever hasn't been read of a body returned by get_body,
+        so that the next request can be read.
+
+        Return False if the connection can't be reused instead because the
+        client is still waiting to be told to send the body, in which case
+        it's impossible to tell whether the client will send it anyway
+        (https://tools.ietf.org/html/rfc7231#section-5.1.1). Raise
+        RequestError if the rest of the body can't be read (see
+        RequestBody).
+        """
+
+        if body.complete:
+            return True
+        if isinstance(body, _ConnectionBody) and body.awaiting_continue:
+            return False
+        body.discard()
+        return True
+
+    def _find_headers_end(self) -> int:
+        # Resume searching where the previous search left off, backing up in
+        # case the first part of the delimiter was received last time.
+        search_start = max(
+            self._start, self._scanned - (len(_HEADERS_END) - 1)
+        )
+        index = self._buffer.find(_HEADERS_END, search_start, self._end)
+        if index == -1:
+            self._scanned = self._end
+            return -1
+        return index + len(_HEADERS_END)
+
+    def _check_lengths(self, end: Optional[int] = None) -> None:
+        # Check the current request's request line, and the lengths of its
+        # request line and headers, which end at the given index, or have not
+        # been completely received if no index is given.
+
+        if not self._line_checked:
+            self._check_request_line()
+
+        if end is None:
+            end = self._end
+            complete = False
+        else:
+            complete = True
+        length = end - self._start
+        if length > self._max_headers_length or (
+                not complete and length == len(self._buffer)):
+            # https://tools.ietf.org/html/rfc6585#section-5
+            raise RequestError(431)
+
+    def _check_request_line(self) -> None:
+        # The search is bounded, so it's cheap even when repeated after every
+        # recv.
+        line_end = self._buffer.find(
+            _CRLF,
+            self._start,
+            min(self._end,
+                self._start + self._max_request_line_length + len(_CRLF))
+        )
+        if line_end == -1:
+            if (self._end - self._start
+                    >= self._max_request_line_length + len(_CRLF)):
+                # https://tools.ietf.org/html/rfc2616#section-10.4.15
+                raise RequestError(414)
+            if self._end > self._start and not is_request_line_prefix(
+                    self._buffer, self._start, self._end):
+                # https://tools.ietf.org/html/rfc2616#section-10.4.1
+                raise RequestError(
+                    400, bytes(self._view[self._start:self._end])
+                )
+            return
+
+        status_code = check_request_line(
+            self._buffer, self._start, line_end + len(_CRLF)
+        )
+        if status_code is not None:
+            raise RequestError(
+                status_code, bytes(self._view[self._start:line_end])
+            )
+        self._line_checked = True
+
+    def _read_body_data(self, size: int, deadline: Deadline) -> bytes:
+        # Read between 1 and size bytes of a body: from the buffer, if part of
+        # the body was received along with what preceded it, or else straight
+        # from the connection, so a large body isn't copied through the
+        # buffer. Nothing beyond the requested size is received, so the next
+        # request stays on the connection.
+        buffered = self._end - self._start
+        if buffered > 0:
+            end = self._start + min(size, buffered)
+            data = bytes(self._view[self._start:end])
+            self._consume(end)
+            return data
+
+        try:
+            deadline.apply(self._connection)
+            data = self._connection.recv(size)
+        except socket.timeout:
+            # https://tools.ietf.org/html/rfc2616#section-10.4.9
+            raise RequestError(408) from None
+        if not data:
+            raise RequestError(400)
+        return data
+
+    def _read_body_line(
+            self,
+            max_length: int,
+            deadline: Deadline,
+            status_code: int = 400) -> bytes:
+        # Read a line of a chunked body (a chunk's size line, the CRLF after
+        # its data, or a trailer field), without the CRLF that ends it.
+        # Raise RequestError with status_code if the line is too long.
+        max_length = min(max_length, len(self._buffer) - len(_CRLF))
+        while True:
+            index = self._buffer.find(_CRLF, self._start, self._end)
+            if index != -1:
+                if index - self._start > max_length:
+                    raise RequestError(status_code)
+                line = bytes(self._view[self._start:index])
+                self._consume(index + len(_CRLF))
+                return line
+            if self._end - self._start >= max_length + len(_CRLF):
+                raise RequestError(status_code)
+
+            received = self._receive_before(deadline)
+            if received == 0:
+                raise RequestError(400)
+            deadline.extend(received)
+
+    def _send_continue(self, deadline: Deadline) -> None:
+        # A client that has already started sending the body isn't waiting
+        # to be told to.
+        if self._end > self._start:
+            return
+        try:
+            deadline.apply(self._connection)
+            self._connection.sendall(_CONTINUE)
+        except socket.timeout:
+            raise RequestError(408) from None
+
+    def _receive_before(self, deadline: Deadline) -> int:
+        # Receive the rest of a request that has started to arrive, raising
+        # RequestError if the deadline passes first.
+        try:
+            deadline.apply(self._connection)
+            return self._receive()
+        except socket.timeout:
+            # https://tools.ietf.org/html/rfc2616#section-10.4.9
+            raise RequestError(408) from None
+
+    def _receive(self) -> int:
+        # Receive more data, returning the number of bytes received, which is
+        # 0 if the client closed the connection.
+
+        if self._end == len(self._buffer):
+            self._compact()
+
+        # Like recv, but the data is written into an existing buffer instead
+        # of a new bytes object (man 2 recv).
+        received = self._connection.recv_into(self._view[self._end:])
+        self._end += received
+        return received
+
+    def _compact(self) -> None:
+        # Move the unconsumed data to the start of the buffer to make room for
+        # more. The data is copied first because the source and destination
+        # may overlap.
+        length = self._end - self._start
+        self._buffer[:length] = bytes(self._view[self._start:self._end])
+        self._scanned -= self._start
+        self._start = 0
+        self._end = length
+
+    def _consume(self, end: int) -> None:
+        self._start = end
+        self._scanned = end
+        self._line_checked = False
+        if self._start == self._end:
+            self._start = self._end = self._scanned = 0
+
+
+class _ConnectionBody(RequestBody):
+    # A request's body, read from the connection by a ConnectionReader (see
+    # ConnectionReader.get_body).
+
+    def __init__(
+            self,
+            reader: ConnectionReader,
+            deadline: Deadline,
+            expect_continue: bool) -> None:
+
+        self._reader = reader
+        self._deadline = deadline
+        self._expect_continue = expect_continue
+
+    @property
+    def awaiting_continue(self) -> bool:
+        """Whether the client is waiting to be told to send the body, which
+        it may never send if it isn't."""
+        return self._expect_continue
+
+    def _start(self) -> None:
+        if self._expect_continue:
+            self._expect_continue = False
+            self._reader._send_continue(self._deadline)
+
+
+class _FixedLengthBody(_ConnectionBody):
+    # A body whose length is given by its Content-Length header.
+
+    def __init__(
+            self,
+            reader: ConnectionReader,
+            deadline: Deadline,
+            expect_continue: bool,
+            length: int) -> None:
+
+        super().__init__(reader, deadline, expect_continue)
+        self._length = length
+        self._remaining = length
+
+    @property
+    def length(self) -> Optional[int]:
+        return self._length
+
+    @property
+    def complete(self) -> bool:
+        return self._remaining == 0
+
+    def _read_some(self, size: int) -> bytes:
+        if self._remaining == 0:
+            return b''
+        self._start()
+        data = self._reader._read_body_data(
+            min(size, self._remaining), self._deadline
+        )
+        self._remaining -= len(data)
+        return data
+
+
+class _ChunkedBody(_ConnectionBody):
+    # A body sent using the chunked transfer coding, which is decoded as it
+    # is read (https://tools.ietf.org/html/rfc7230#section-4.1.3).
+
+    def __init__(
+            self,
+            reader: ConnectionReader,
+            deadline: Deadline,
+            expect_continue: bool,
+            max_length: int) -> None:
+
+        super().__init__(reader, deadline, expect_continue)
+        self._max_length = max_length
+
+        # The number of bytes of the body read so far, and the number left in
+        # the current chunk.
+        self._read = 0
+        self._remaining = 0
+        self._complete = False
+
+    @property
+    def length(self) -> Optional[int]:
+        return None
+
+    @property
+    def complete(self) -> bool:
+        return self._complete
+
+    def _read_some(self, size: int) -> bytes:
+        if self._complete:
+            return b''
+        self._start()
+        reader = self._reader
+
+        if self._remaining == 0:
+            line = reader._read_body_line(
+                reader._max_request_line_length, self._deadline
+            )
+            match = _CHUNK_SIZE_LINE.fullmatch(line)
+            if match is None:
+                raise RequestError(400)
+            chunk_size = int(match.group(1), 16)
+            if chunk_size == 0:
+                self._read_trailer()
+                self._complete = True
+                return b''
+            if self._read + chunk_size > self._max_length:
+                # https://tools.ietf.org/html/rfc2616#section-10.4.14
+                raise RequestError(413)
+            self._remaining = chunk_size
+
+        data = reader._read_body_data(
+            min(size, self._remaining), self._deadline
+        )
+        self._deadline.extend(len(data))
+        self._read += len(data)
+        self._remaining -= len(data)
+        if self._remaining == 0:
+            # The chunk's data is followed by a CRLF.
+            if reader._read_body_line(0, self._deadline) != b'':
+                raise RequestError(400)
+        return data
+
+    def _read_trailer(self) -> None:
+        # Skip the trailer fields that follow the last chunk, up to the empty
+        # line that ends the body. They are limited in total like headers.
+        reader = self._reader
+        length = 0
+        while True:
+            # https://tools.ietf.org/html/rfc6585#section-5
+            line = reader._read_body_line(
+                reader._max_headers_length, self._deadline, 431
+            )
+            if line == b'':
+                return
+            length += len(line) + len(_CRLF)
+            if length > reader._max_headers_length:
+                raise RequestError(431)
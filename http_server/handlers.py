@@ -1,34 +1,381 @@
 """Tools for creating request handlers."""
 
 
-from functools import wraps
-from typing import Callable
+from functools import update_wrapper, wraps
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List
+from typing import Optional, Sequence, Tuple
 
-from .requests import Request, parse
-from .responses import Response
+from attr import attrs, attrib
 
+from .connections import RequestError
+from .logs import log_exception
+from .requests import Request, check_request_line, parse
+from .response_cache import ResponseCache
+from .responses import FrozenResponse, Response, get_error_response
+from .tokens import GET_METHOD, HEAD_METHOD
+
+
+# The methods that a handler accepts unless it is told otherwise. Handler
+# functions written before other methods were supported only ever saw these.
+DEFAULT_METHODS = (GET_METHOD, HEAD_METHOD)
+
+# What create_async_handler returns: a coroutine function, so that its
+# results can be awaited or passed to asyncio.run.
+_AsyncWrapper = Callable[[bytes], Coroutine[Any, Any, bytes]]
+
+
+class Handler:
+    """A request handler created by create_handler.
+
+    Calling the handler converts a request to the bytes of the response.
+    run_server recognizes handlers of this type, parses requests itself, and
+    serves multiple requests over each connection (see Handler.handle).
+    """
+
+    def __init__(
+            self,
+            handler_func: Callable[[Request], Response],
+            cache: Optional[ResponseCache] = None,
+            methods: Sequence[str] = DEFAULT_METHODS) -> None:
+
+        self._handler_func = handler_func
+        self._cache = cache
+        self._methods = _get_methods(methods)
+        self._method_not_allowed = _get_method_not_allowed(self._methods)
+        update_wrapper(self, handler_func)
+
+    @property
+    def methods(self) -> Tuple[str, ...]:
+        """The methods that the handler accepts."""
+        return self._methods
+
+    def __call__(self, request: bytes) -> bytes:
+        parsed_request = parse(request)
+        if parsed_request is None:
+            response = _reject(request)
+        else:
+            response = self.handle(parsed_request)
+        try:
+            return _get_bytes(parsed_request, response)
+        finally:
+            response.close()
+
+    def respond(self, request: bytes) -> Response:
+        """Respond to a request."""
+
+        parsed_request = parse(request)
+        if parsed_request is None:
+            return _reject(request)
+        return self.handle(parsed_request)
+
+    def handle(self, request: Request) -> Response:
+        """Respond to a parsed request.
+
+        Raise RequestError if the handler function fails to read the
+        request's body (see http_server.bodies), so that the server can
+        respond with the error's status code.
+        """
+
+        if request.method not in self._methods:
+            return self._method_not_allowed
+
+        try:
+            if self._cache is not None:
+                return self._cache.get(request, self._handler_func)
+            return self._handler_func(request)
+        except RequestError:
+            raise
+        except:  # noqa: E722
+            log_exception('Handler failed to respond to {} /{}'.format(
+                request.method, '/'.join(request.uri)
+            ))
+            # https://tools.ietf.org/html/rfc2616#section-10.5.1
+            return get_error_response(500)
 
-# TODO:
-# - Return 501 Not Implemented for methods other than GET.
-# - Return 505 HTTP Version Not Supported for versions other than HTTP/1.1.
 
 def create_handler(
-        handler_func: Callable[[Request], Response]) -> Callable[[bytes], bytes]:  # noqa: E501
-    """Create a request handler."""
+        handler_func: Callable[[Request], Response],
+        cache: Optional[ResponseCache] = None,
+        methods: Sequence[str] = DEFAULT_METHODS) -> Handler:
+    """Create a request handler.
+
+    If the handler function raises an exception, the handler logs it (see
+    http_server.logs.log_exception) and responds with 500 Internal Server
+    Error. Requests that can't be parsed get 400 Bad Request, or 501 Not
+    Implemented or 505 HTTP Version Not Supported if they use a method or
+    version that the server doesn't support (see
+    http_server.requests.check_request_line).
+
+    The handler function is called only for requests whose methods are in
+    methods (by default, GET and HEAD); other requests get 405 Method Not
+    Allowed. A handler that accepts GET accepts HEAD too, and the server
+    sends the head of its response without the body, so handler functions
+    needn't treat HEAD differently. A handler function that accepts e.g.
+    POST or PUT can read the request's body from Request.body (see
+    http_server.bodies).
+
+    If the handler function is pure, i.e. its response depends only on the
+    request (and not on e.g. the time or the filesystem), its responses can
+    be memoized by passing a cache (see
+    http_server.response_cache.ResponseCache). The cache is consulted after
+    the request is parsed and its method is checked, since its key is
+    computed from the parsed request, so a hit skips the handler function
+    and serialization but not parsing.
+    """
+
+    return Handler(handler_func, cache, methods)
+
+
+def create_async_handler(
+        handler_func: Callable[[Request], Awaitable[Response]],
+        methods: Sequence[str] = DEFAULT_METHODS) -> _AsyncWrapper:
+    """Create an asynchronous request handler for run_async_server. Methods
+    are handled as by create_handler, but run_async_server doesn't read
+    request bodies."""
+
+    allowed = _get_methods(methods)
+    method_not_allowed = _get_method_not_allowed(allowed)
 
     @wraps(handler_func)
-    def wrapper(request: bytes) -> bytes:
+    async def wrapper(request: bytes) -> bytes:
+        parsed_request = parse(request)
         try:
-            parsed_request = parse(request.decode())
             if parsed_request is None:
-                # https://tools.ietf.org/html/rfc2616#section-10.4.1
-                response = Response(400)
+                response = _reject(request)
+            elif parsed_request.method not in allowed:
+                response = method_not_allowed
             else:
-                response = handler_func(parsed_request)
+                response = await handler_func(parsed_request)
         except:  # noqa: E722
-            # TODO: log exception
+            log_exception('Async handler failed')
             # https://tools.ietf.org/html/rfc2616#section-10.5.1
-            response = Response(500)
-        return response.get_bytes()
+            response = get_error_response(500)
+        try:
+            return _get_bytes(parsed_request, response)
+        finally:
+            response.close()
 
     return wrapper
+
+
+def _get_methods(methods: Sequence[str]) -> Tuple[str, ...]:
+    # A resource that supports GET supports HEAD
+    # (https://tools.ietf.org/html/rfc7231#section-4.3.2).
+    if GET_METHOD in methods and HEAD_METHOD not in methods:
+        return tuple(methods) + (HEAD_METHOD,)
+    return tuple(methods)
+
+
+def _get_method_not_allowed(methods: Tuple[str, ...]) -> Response:
+    # A 405 response must list the allowed methods
+    # (https://tools.ietf.org/html/rfc7231#section-6.5.5). The prebuilt one
+    # lists the default methods; others are built once per handler.
+    if set(methods) == set(DEFAULT_METHODS):
+        return get_error_response(405)
+    return FrozenResponse(405, None, b'', [('Allow', ', '.join(methods))])
+
+
+def _get_bytes(request: Optional[Request], response: Response) -> bytes:
+    # A response to HEAD is sent without its body
+    # (https://tools.ietf.org/html/rfc7231#section-4.3.2).
+    if request is not None and request.method == HEAD_METHOD:
+        return response.get_head()
+    return response.get_bytes()
+
+
+def _reject(request: bytes) -> Response:
+    # Respond to a request that parse rejected. Error responses are prebuilt,
+    # so rejecting garbage costs little more than the failed parse.
+    return get_error_response(check_request_line(request) or 400)
+
+
+# A handler function for a Router, which is called with the request and the
+# values of the route's path parameters as keyword arguments.
+RouteHandler = Callable[..., Response]
+
+
+class Router:
+    """Dispatches requests to handler functions according to the requested
+    URI.
+
+    Each handler function is registered for a path pattern, such as
+    '/users/{id}' or '/static/{path*}'. A segment of the form '{name}' matches
+    any one URI part, and a final segment of the form '{name*}' matches the
+    rest of the URI (possibly nothing). The matched parts are passed to the
+    handler function as keyword arguments: for example, a request for
+    /users/42 is handled by calling handler_func(request, id='42'). If several
+    patterns match, literal segments take precedence over parameters, which
+    take precedence over '{name*}'. Requests that match no pattern get a 404
+    response.
+
+    The patterns are compiled into a trie with one level per URI part, so the
+    time it takes to find a request's route depends on the length of the URI
+    rather than on the number of routes.
+
+    A router is itself a handler function, so it can be passed to
+    create_handler:
+
+        router = Router()
+
+        @router.route('/users/{id}')
+        def user_handler(request: Request, id: str) -> Response:
+            ...
+
+        handler = create_handler(router)
+    """
+
+    def __init__(self) -> None:
+        self._root = _Node()
+
+    def __call__(self, request: Request) -> Response:
+        match = self.match(request.uri)
+        if match is None:
+            # https://tools.ietf.org/html/rfc2616#section-10.4.5
+            return get_error_response(404)
+        handler_func, params = match
+        return handler_func(request, **params)
+
+    def route(self, pattern: str) -> Callable[[RouteHandler], RouteHandler]:
+        """Return a decorator that registers a handler function for the given
+        pattern (see Router.add_route)."""
+
+        def decorator(handler_func: RouteHandler) -> RouteHandler:
+            self.add_route(pattern, handler_func)
+            return handler_func
+
+        return decorator
+
+    def add_route(self, pattern: str, handler_func: RouteHandler) -> None:
+        """Register a handler function for the given pattern. Raise ValueError
+        if the pattern is invalid or already registered."""
+
+        segments = _split_pattern(pattern)
+        names = []  # type: List[str]
+        node = self._root
+        for index, segment in enumerate(segments):
+            name = _get_param_name(segment)
+            if name is None:
+                node = node.children.setdefault(segment, _Node())
+            elif name.endswith('*'):
+                if index != len(segments) - 1:
+                    raise ValueError(
+                        '{{{}}} must be the last segment of {}'.format(
+                            name, pattern
+                        )
+                    )
+                if node.rest is not None:
+                    raise ValueError('duplicate route: {}'.format(pattern))
+                node.rest = _Route(
+                    handler_func, names + [name[:-1]], pattern
+                )
+                return
+            else:
+                names.append(name)
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+
+        if node.route is not None:
+            raise ValueError('duplicate route: {}'.format(pattern))
+        node.route = _Route(handler_func, names, pattern)
+
+    def match(
+            self,
+            uri: List[str]) -> Optional[Tuple[RouteHandler, Dict[str, str]]]:
+        """Find the handler function for a URI (see Request.uri) and the
+        values of its path parameters, or return None if no pattern
+        matches."""
+
+        values = []  # type: List[str]
+        route = _match(self._root, uri, 0, values)
+        if route is None:
+            return None
+        return route.handler_func, dict(zip(route.names, values))
+
+    def get_route(self, request: Request) -> Optional[str]:
+        """Get the pattern that matches the requested URI, or None if no
+        pattern matches. Useful for labeling requests by route (see
+        http_server.metrics.Metrics)."""
+
+        route = _match(self._root, request.uri, 0, [])
+        return None if route is None else route.pattern
+
+
+@attrs(frozen=True)
+class _Route:
+    handler_func = attrib()  # type: RouteHandler
+
+    # The names of the route's path parameters, in order.
+    names = attrib()  # type: List[str]
+
+    pattern = attrib()  # type: str
+
+
+class _Node:
+    # A node of a Router's trie, which matches a URI part.
+
+    def __init__(self) -> None:
+        # The children that match literal URI parts, the child that matches
+        # any URI part (a '{name}' segment), the route that matches the rest
+        # of the URI (a '{name*}' segment), and the route that ends here.
+        self.children = {}  # type: Dict[str, _Node]
+        self.param = None  # type: Optional[_Node]
+        self.rest = None  # type: Optional[_Route]
+        self.route = None  # type: Optional[_Route]
+
+
+def _match(
+        node: _Node,
+        uri: List[str],
+        index: int,
+        values: List[str]) -> Optional[_Route]:
+
+    # Match uri[index:] against the subtrie rooted at node, appending the
+    # values of path parameters to values. Backtrack from a literal to a
+    # parameter to the rest of the URI only when the more specific branch
+    # fails, which is rare, so a match usually visits one node per URI part.
+
+    if index == len(uri):
+        if node.route is not None:
+            return node.route
+    else:
+        part = uri[index]
+        child = node.children.get(part)
+        if child is not None:
+            route = _match(child, uri, index + 1, values)
+            if route is not None:
+                return route
+        if node.param is not None and part != '':
+            values.append(part)
+            route = _match(node.param, uri, index + 1, values)
+            if route is not None:
+                return route
+            values.pop()
+
+    if node.rest is not None:
+        values.append('/'.join(uri[index:]))
+        return node.rest
+    return None
+
+
+def _split_pattern(pattern: str) -> List[str]:
+    # Split a pattern into segments the same way that requests.parse splits
+    # URIs into parts.
+    if not pattern.startswith('/'):
+        raise ValueError('pattern must start with /: {}'.format(pattern))
+    segments = [segment for segment in pattern.split('/') if segment]
+    if pattern.endswith('/'):
+        segments.append('')
+    return segments
+
+
+def _get_param_name(segment: str) -> Optional[str]:
+    # Get the name of a '{name}' or '{name*}' segment, or None if the segment
+    # is literal.
+    if segment.startswith('{') and segment.endswith('}'):
+        name = segment[1:-1]
+        if name.rstrip('*').isidentifier() and name.count('*') <= 1:
+            return name
+    if '{' in segment or '}' in segment:
+        raise ValueError('invalid segment: {}'.format(segment))
+    return None
@@ -0,0 +1,337 @@
+"""Tools for listing the contents of directories.
+
+A DirectoryListingCache keeps the entries of recently listed directories in
+memory, so that listing a directory again costs a single stat of the
+directory (or nothing at all, within the revalidation interval) rather than
+reading the whole directory again. Directories are read with os.scandir,
+which gets each entry's type from the directory itself on most platforms
+(d_type, see man 3 readdir), so a directory is read without a stat per entry.
+
+A directory's modification time changes whenever an entry is added to it,
+removed from it, or renamed within it, so a listing is read again once the
+directory's modification time changes. Since a filesystem may only record
+modification times to the nearest second (or worse), a directory modified too
+recently to tell whether it changed again in the same tick is read again
+every time it is revalidated until that is no longer the case. (Git solves
+its "racy" index entries the same way.)
+
+Listings can be sorted by name, size or modification time and divided into
+pages. Sizes and modification times are read (with a stat per entry) only
+when a listing is first sorted by them, and are kept until the directory
+itself changes, so a file that is modified in place may briefly be sorted by
+its old size or time.
+
+sources:
+- https://docs.python.org/3/library/os.html#os.scandir
+- https://www.python.org/dev/peps/pep-0471/
+- https://git-scm.com/docs/racy-git
+"""
+
+
+import os
+import time
+import urllib.parse
+from typing import Dict, List, Optional, Tuple
+
+from attr import attrs, attrib
+
+from .lru import LRUCache
+from .requests import Request
+
+
+NAME_SORT = 'name'
+SIZE_SORT = 'size'
+MTIME_SORT = 'mtime'
+SORTS = (NAME_SORT, SIZE_SORT, MTIME_SORT)
+
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_REVALIDATE_INTERVAL = 1.0
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# A listing of a directory that was modified less than this many seconds
+# before it was read may be missing changes made in the same tick of the
+# directory's modification time (see http_server.listings).
+_RACY_INTERVAL = 2.0
+
+
+@attrs(frozen=True)
+class DirectoryEntry:
+    """An entry in a directory listing."""
+
+    name = attrib()  # type: str
+
+    # Whether the entry is a directory, or a symbolic link to one.
+    is_dir = attrib()  # type: bool
+
+
+@attrs(frozen=True)
+class ListingOptions:
+    """How to sort and divide a directory listing, as requested by the
+    query parameters 'sort' (one of SORTS), 'order' ('asc' or 'desc'), 'page'
+    (starting at 1) and 'per_page'.
+    """
+
+    sort = attrib(default=NAME_SORT)  # type: str
+    reverse = attrib(default=False)  # type: bool
+    page = attrib(default=1)  # type: int
+    page_size = attrib(default=DEFAULT_PAGE_SIZE)  # type: int
+
+    def get_query(self, **changes: object) -> str:
+        """Get a query string for these options, with the given attributes
+        changed (e.g. page=2), omitting defaults."""
+
+        options = {
+            'sort': self.sort,
+            'reverse': self.reverse,
+            'page': self.page,
+            'page_size': self.page_size
+        }
+        options.update(changes)
+        params = []  # type: List[Tuple[str, object]]
+        if options['sort'] != NAME_SORT:
+            params.append(('sort', options['sort']))
+        if options['reverse']:
+            params.append(('order', 'desc'))
+        if options['page'] != 1:
+            params.append(('page', options['page']))
+        if options['page_size'] != DEFAULT_PAGE_SIZE:
+            params.append(('per_page', options['page_size']))
+        return urllib.parse.urlencode(params)
+
+
+@attrs(frozen=True)
+class Page:
+    """A page of a directory listing."""
+
+    entries = attrib()  # type: List[DirectoryEntry]
+    number = attrib()  # type: int
+    count = attrib()  # type: int
+
+
+@attrs(frozen=True)
+class _Listing:
+    # The directory's device, inode and modification time in nanoseconds.
+    # If any of these change, the directory must be read again.
+    signature = attrib()  # type: Tuple[int, int, int]
+
+    # Sorted by name.
+    entries = attrib()  # type: List[DirectoryEntry]
+
+    # Whether the directory was modified too recently before it was read for
+    # its signature to be trusted (see _RACY_INTERVAL).
+    racy = attrib()  # type: bool
+
+    # Other orderings of the entries that have been requested so far, by
+    # sort and reverse.
+    orderings = attrib()  # type: Dict[Tuple[str, bool], List[DirectoryEntry]]
+
+    # When the listing was last checked against the directory (see
+    # time.monotonic).
+    checked = attrib()  # type: float
+
+
+class DirectoryListingCache(LRUCache[str, _Listing]):
+    """An in-memory cache of directory listings (see http_server.listings).
+
+    A cached listing is used without checking the directory for up to
+    revalidate_interval seconds. When the cached listings hold more than
+    max_entries entries in total, the least recently used are evicted.
+    Directories with more than max_entries entries are read every time.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            revalidate_interval: float = DEFAULT_REVALIDATE_INTERVAL) -> None:
+
+        # A listing's size is its number of entries.
+        super().__init__(_get_entry_count, max_entries)
+        self._revalidate_interval = revalidate_interval
+
+    @property
+    def entry_count(self) -> int:
+        """The total number of entries in the cached listings."""
+        return self._size
+
+    def get(
+            self,
+            path: str,
+            sort: str = NAME_SORT,
+            reverse: bool = False) -> Optional[List[DirectoryEntry]]:
+        """Get the entries of the directory at the given path, sorted by
+        sort (one of SORTS) and reversed if reverse is true, or None if there
+        is no directory at that path.
+
+        The returned list is shared with the cache and must not be modified.
+        """
+
+        if sort not in SORTS:
+            raise ValueError()
+
+        listing = self._get_listing(path)
+        if listing is None:
+            return None
+        if sort == NAME_SORT and not reverse:
+            return listing.entries
+
+        entries = listing.orderings.get((sort, reverse))
+        if entries is None:
+            # Two threads may sort the listing at once, in which case the
+            # last one's ordering is kept.
+            entries = _sort(path, listing.entries, sort, reverse)
+            with self._lock:
+                listing.orderings[(sort, reverse)] = entries
+        return entries
+
+    def _get_listing(self, path: str) -> Optional[_Listing]:
+        now = time.monotonic()
+        with self._lock:
+            listing = self._entries.get(path)
+            if listing is not None and (
+                    now - listing.checked < self._revalidate_interval):
+                self._hit(path)
+                return listing
+
+        try:
+            dir_stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._remove(path)
+            return None
+
+        signature = _get_signature(dir_stat)
+        if listing is not None and (
+                listing.signature == signature and not listing.racy):
+            with self._lock:
+                self._replace(path, listing, _Listing(
+                    listing.signature,
+                    listing.entries,
+                    False,
+                    listing.orderings,
+                    now
+                ))
+                self.hits += 1
+            return listing
+
+        with self._lock:
+            self.misses += 1
+
+        entries = _scan(path)
+        if entries is None:
+            with self._lock:
+                self._remove(path)
+            return None
+
+        # The directory's modification time is compared with the time just
+        # after it was read, with a margin for clocks that disagree slightly.
+        racy = time.time() - dir_stat.st_mtime < _RACY_INTERVAL
+        listing = _Listing(signature, entries, racy, {}, now)
+        with self._lock:
+            self._put(path, listing)
+        return listing
+
+
+def get_listing_options(request: Request) -> ListingOptions:
+    """Get the listing options requested by a request's query (see
+    ListingOptions). Missing or invalid parameters get their defaults."""
+
+    if not request.query:
+        return ListingOptions()
+
+    params = urllib.parse.parse_qs(request.query)
+
+    sort = params.get('sort', [NAME_SORT])[-1]
+    if sort not in SORTS:
+        sort = NAME_SORT
+    reverse = params.get('order', [''])[-1] == 'desc'
+    page = _get_int_param(params, 'page', 1)
+    page_size = min(
+        _get_int_param(params, 'per_page', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE
+    )
+    return ListingOptions(sort, reverse, page, page_size)
+
+
+def get_page(entries: List[DirectoryEntry], options: ListingOptions) -> Page:
+    """Get the page of a listing's entries requested by options. A page past
+    the end is the last page."""
+
+    count = max(1, -(-len(entries) // options.page_size))
+    number = min(options.page, count)
+    start = (number - 1) * options.page_size
+    return Page(entries[start:start + options.page_size], number, count)
+
+
+def _get_entry_count(listing: _Listing) -> int:
+    return len(listing.entries)
+
+
+def _scan(path: str) -> Optional[List[DirectoryEntry]]:
+    # Read the directory at the given path, or return None if there is no
+    # such directory.
+    try:
+        with os.scandir(path) as scanned:
+            entries = [
+                DirectoryEntry(entry.name, _is_dir(entry))
+                for entry in scanned
+            ]
+    except OSError:
+        return None
+    entries.sort(key=lambda entry: entry.name)
+    return entries
+
+
+def _is_dir(entry):  # type: (os.DirEntry[str]) -> bool
+    # os.DirEntry can't be subscripted at runtime before Python 3.9, so the
+    # signature is given as a type comment.
+    # is_dir needs a stat only for symbolic links, or on filesystems that
+    # don't report entry types.
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _sort(
+        path: str,
+        entries: List[DirectoryEntry],
+        sort: str,
+        reverse: bool) -> List[DirectoryEntry]:
+
+    # entries are sorted by name, and sorted is stable, so entries with equal
+    # sizes or times stay in order by name.
+    if sort == NAME_SORT:
+        return entries[::-1] if reverse else entries
+
+    keys = {}  # type: Dict[str, float]
+    for entry in entries:
+        try:
+            entry_stat = os.stat(os.path.join(path, entry.name))
+        except OSError:
+            # E.g. a broken symbolic link.
+            keys[entry.name] = 0
+            continue
+        keys[entry.name] = (
+            entry_stat.st_size if sort == SIZE_SORT
+            else entry_stat.st_mtime
+        )
+    return sorted(
+        entries, key=lambda entry: keys[entry.name], reverse=reverse
+    )
+
+
+def _get_int_param(
+        params: Dict[str, List[str]],
+        name: str,
+        default: int) -> int:
+
+    try:
+        value = int(params[name][-1])
+    except (KeyError, ValueError):
+        return default
+    return value if value >= 1 else default
+
+
+def _get_signature(dir_stat: os.stat_result) -> Tuple[int, int, int]:
+    return dir_stat.st_dev, dir_stat.st_ino, dir_stat.st_mtime_ns
@@ -0,0 +1,294 @@
+"""Tools for logging requests and errors.
+
+An AccessLog writes one line per request in the Common Log Format, the
+Combined Log Format, or as JSON lines. Logging a request only records its
+details in a queue; a background thread formats the queued requests and
+writes them in batches, so the cost on the request path is small and fixed,
+however slow the log's file is. If the queue fills up (e.g. because the file
+can't keep up), requests are dropped from the log rather than delayed. For
+busy servers, an AccessLog can also log only a sample of the requests.
+
+log_exception logs an unexpected exception, such as one raised by a handler,
+through the standard logging module (logger 'http_server'), but no more than
+a few times per minute, so that a handler that fails on every request can't
+flood the log.
+
+sources:
+- https://httpd.apache.org/docs/2.4/logs.html#accesslog
+- https://jsonlines.org/
+- https://docs.python.org/3/library/logging.html
+"""
+
+
+import collections
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Optional, TextIO, Tuple
+from typing import Deque, List  # noqa: F401
+
+from .requests import Request
+
+
+COMMON_FORMAT = 'common'
+COMBINED_FORMAT = 'combined'
+JSON_FORMAT = 'json'
+FORMATS = (COMMON_FORMAT, COMBINED_FORMAT, JSON_FORMAT)
+
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_QUEUE_SIZE = 10000
+
+# By default, log_exception logs at most this many exceptions per this many
+# seconds.
+DEFAULT_EXCEPTION_LIMIT = 10
+DEFAULT_EXCEPTION_INTERVAL = 60.0
+
+logger = logging.getLogger('http_server')
+
+# The longest request line that is logged in full.
+_MAX_REQUEST_LINE_LENGTH = 1024
+
+# (time, peer host, request line, status code, body length, duration, referer,
+# user agent), as queued by AccessLog.log.
+_Record = Tuple[
+    float, str, bytes, Optional[int], Optional[int], Optional[float],
+    Optional[str], Optional[str]
+]
+
+_CRLF = b'\r\n'
+
+
+class AccessLog:
+    """Writes a line to a file (by default, standard output) for each logged
+    request (see http_server.logs).
+
+    sample_rate is the fraction of requests to log; responses with 5xx status
+    codes are always logged. At most queue_size requests wait to be written,
+    and the background thread writes them every flush_interval seconds.
+    """
+
+    def __init__(
+            self,
+            file: Optional[TextIO] = None,
+            log_format: str = COMMON_FORMAT,
+            sample_rate: float = 1.0,
+            flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+            queue_size: int = DEFAULT_QUEUE_SIZE) -> None:
+
+        if log_format not in FORMATS or not 0 <= sample_rate <= 1:
+            raise ValueError()
+
+        self._file = file
+        self._format = log_format
+        self._sample_rate = sample_rate
+        self._flush_interval = flush_interval
+        self._queue_size = queue_size
+
+        # The number of requests dropped because the queue was full.
+        self.dropped = 0
+
+        # Appending to and popping from a deque are atomic, so the request
+        # path takes no lock. The writer lock keeps flushes in order.
+        self._queue = collections.deque()  # type: Deque[_Record]
+        self._writer_lock = threading.Lock()
+        self._closed = threading.Event()
+
+        # The background thread doesn't survive a fork, so each process
+        # starts its own (see _ensure_thread).
+        self._thread = None  # type: Optional[threading.Thread]
+        self._pid = None  # type: Optional[int]
+        self._thread_lock = threading.Lock()
+
+    def log(
+            self,
+            peer: Any,
+            request_line: bytes,
+            status_code: Optional[int],
+            body_length: Optional[int] = None,
+            duration: Optional[float] = None,
+            request: Optional[Request] = None) -> None:
+        """Log a request, given the peer's address, the request line (or b''
+        if it isn't known), the response's status code and body length (if
+        known), and the time it took to serve, in seconds.
+
+        The request, if given, supplies the headers logged in the combined
+        and JSON formats.
+        """
+
+        if self._sample_rate < 1 and (
+                status_code is None or status_code < 500) and (
+                random.random() >= self._sample_rate):
+            return
+
+        referer = user_agent = None  # type: Optional[str]
+        if request is not None and self._format != COMMON_FORMAT:
+            referer = request.headers.get('Referer')
+            user_agent = request.headers.get('User-Agent')
+
+        self._ensure_thread()
+        if len(self._queue) >= self._queue_size:
+            self.dropped += 1
+            return
+        self._queue.append((
+            time.time(),
+            peer[0] if isinstance(peer, tuple) else str(peer),
+            request_line[:_MAX_REQUEST_LINE_LENGTH],
+            status_code,
+            body_length,
+            duration,
+            referer,
+            user_agent
+        ))
+
+    def flush(self) -> None:
+        """Write every queued request now."""
+
+        with self._writer_lock:
+            lines = []  # type: List[str]
+            while self._queue:
+                lines.append(self._format_record(self._queue.popleft()))
+            if lines:
+                file = self._file if self._file is not None else sys.stdout
+                file.write(''.join(lines))
+                file.flush()
+
+    def close(self) -> None:
+        """Stop the background thread and write every queued request."""
+
+        self._closed.set()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join()
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._thread_lock:
+            if self._pid == pid:
+                return
+            if self._pid is not None:
+                # In a child process forked after logging started. The parent
+                # writes what it queued before the fork.
+                self._queue.clear()
+                self._writer_lock = threading.Lock()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+    def _run(self) -> None:
+        # Write the queued requests in batches, so that each flush costs one
+        # write to the file however many requests arrived since the last.
+        while not self._closed.wait(self._flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                log_exception('Failed to write the access log')
+
+    def _format_record(self, record: _Record) -> str:
+        (timestamp, host, request_line, status_code, body_length, duration,
+         referer, user_agent) = record
+
+        if self._format == JSON_FORMAT:
+            entry = {
+                'time': time.strftime(
+                    '%Y-%m-%dT%H:%M:%S%z', time.localtime(timestamp)
+                ),
+                'remote_addr': host,
+                'request': request_line.decode('latin-1'),
+                'status': status_code,
+                'body_bytes': body_length,
+                'duration': None if duration is None else round(duration, 6),
+                'referer': referer,
+                'user_agent': user_agent
+            }
+            return json.dumps(entry, separators=(',', ':')) + '\n'
+
+        # host ident authuser [date] "request line" status bytes, where
+        # unknown fields are '-'
+        line = '{} - - [{}] "{}" {} {}'.format(
+            host,
+            time.strftime('%d/%b/%Y:%H:%M:%S %z', time.localtime(timestamp)),
+            _escape(request_line.decode('latin-1')),
+            '-' if status_code is None else status_code,
+            '-' if body_length is None else body_length
+        )
+        if self._format == COMBINED_FORMAT:
+            line += ' "{}" "{}"'.format(
+                _escape(referer or '-'), _escape(user_agent or '-')
+            )
+        return line + '\n'
+
+
+def get_request_line(request: bytes) -> bytes:
+    """Get the request line of a request, without the CRLF that ends it."""
+
+    end = request.find(_CRLF, 0, _MAX_REQUEST_LINE_LENGTH)
+    return request[:end] if end != -1 else request[:_MAX_REQUEST_LINE_LENGTH]
+
+
+class _RateLimiter:
+    # Allows a number of events per interval (a fixed window), and counts the
+    # events that weren't allowed.
+
+    def __init__(self, limit: int, interval: float) -> None:
+        self._limit = limit
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._window_start = -interval
+        self._count = 0
+        self._suppressed = 0
+
+    def acquire(self) -> Tuple[bool, int]:
+        # Return whether the event is allowed and, if so, the number of
+        # events that weren't allowed since the last one that was.
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self._interval:
+                self._window_start = now
+                self._count = 0
+            if self._count >= self._limit:
+                self._suppressed += 1
+                return False, 0
+            self._count += 1
+            suppressed = self._suppressed
+            self._suppressed = 0
+            return True, suppressed
+
+
+_exception_limiter = _RateLimiter(
+    DEFAULT_EXCEPTION_LIMIT, DEFAULT_EXCEPTION_INTERVAL
+)
+
+
+def log_exception(message: str) -> None:
+    """Log the exception currently being handled, with its traceback, unless
+    too many exceptions have been logged recently (see http_server.logs)."""
+
+    allowed, suppressed = _exception_limiter.acquire()
+    if not allowed:
+        return
+    if suppressed:
+        message += ' ({} more exceptions were not logged)'.format(suppressed)
+    logger.exception(message)
+
+
+def _escape(value: str) -> str:
+    # Escape quotes, backslashes and control characters, so that a client
+    # can't break the log's format (e.g. by sending a newline).
+    if value.isprintable() and '"' not in value and '\\' not in value:
+        return value
+    escaped = []  # type: List[str]
+    for char in value:
+        if char in '"\\':
+            escaped.append('\\' + char)
+        elif ' ' <= char <= '~':
+            escaped.append(char)
+        else:
+            escaped.append('\\x{:02x}'.format(ord(char)))
+    return ''.join(escaped)
@@ -0,0 +1,93 @@
+"""A base class for the server's in-memory caches."""
+
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+
+_K = TypeVar('_K', bound=Hashable)
+_V = TypeVar('_V')
+
+
+class LRUCache(Generic[_K, _V]):
+    """A cache that evicts its least recently used values when they exceed
+    max_size in total (as measured by get_size) or, unless max_entries is
+    None, when there are more than max_entries of them. A value larger than
+    max_size isn't cached at all.
+
+    Subclasses look values up and count hits and misses themselves, holding
+    the lock, since each decides differently whether a cached value may be
+    used.
+    """
+
+    def __init__(
+            self,
+            get_size: Callable[[_V], int],
+            max_size: int,
+            max_entries: Optional[int] = None) -> None:
+
+        self._get_size = get_size
+        self._max_size = max_size
+        self._max_entries = max_entries
+
+        # Ordered from least to most recently used.
+        self._entries = OrderedDict()  # type: OrderedDict[_K, _V]
+        self._size = 0
+
+        # Worker threads (see run_server) may use the cache concurrently.
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached values."""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Remove every cached value."""
+
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _hit(self, key: _K) -> None:
+        # Count a hit for the cached value with the given key, which becomes
+        # the most recently used. The caller must hold the lock.
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+    def _put(self, key: _K, value: _V) -> None:
+        # The caller must hold the lock.
+        self._remove(key)
+        size = self._get_size(value)
+        if size > self._max_size:
+            return
+
+        self._entries[key] = value
+        self._size += size
+
+        while self._size > self._max_size or (
+                self._max_entries is not None
+                and len(self._entries) > self._max_entries):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= self._get_size(evicted)
+            self.evictions += 1
+
+    def _replace(self, key: _K, old_value: _V, new_value: _V) -> None:
+        # Replace the cached value with the given key, unless another thread
+        # has already replaced or removed it. The caller must hold the lock.
+        if self._entries.get(key) is old_value:
+            self._put(key, new_value)
+
+    def _remove(self, key: _K) -> None:
+        # The caller must hold the lock.
+        value = self._entries.pop(key, None)
+        if value is not None:
+            self._size -= self._get_size(value)
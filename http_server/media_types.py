@@ -18,5 +18,12 @@ MEDIA_TYPES = {
     # https://www.iana.org/assignments/media-types/image/png
     'png': ('image', 'png'),
 
-    # TODO: add audio media types?
+    # https://tools.ietf.org/html/rfc3003
+    'mp3': ('audio', 'mpeg'),
+
+    # https://tools.ietf.org/html/rfc5334#section-10.1
+    'ogg': ('audio', 'ogg'),
+
+    # https://developer.mozilla.org/en-US/docs/Web/Media/Formats/Containers#wave_wav  # noqa: E501
+    'wav': ('audio', 'wav'),
 }
@@ -0,0 +1,421 @@
+"""Tools for measuring what the server spends its time on.
+
+Pass a Metrics object to run_server, and the server times each request as it
+passes through the following phases:
+
+- read: receiving the request line and headers, from the arrival of the first
+  byte (time spent waiting for an idle persistent connection's next request
+  is not counted)
+- parse: parsing the request
+- handle: reading the message body, if any, and running the handler
+- serialize: building the response's head (and, for a Response, gathering its
+  message body)
+- send: sending the response, including generating the chunks of a
+  StreamingResponse
+
+Separately, the accept phase is the time an accepted connection waits for a
+worker to start serving it, which grows when the server is overloaded.
+
+The server also counts requests that it rejects because it is overloaded,
+by reason, and timeouts by kind: a client that took too long to send
+a request's headers or body, a handler that took too long to respond (see
+run_server's handler_timeout), or a client that took too long to receive a
+response.
+
+The server records each request's phases with one call to
+Metrics.observe_request, which takes a lock once. Metrics.handle serves the
+collected counters and histograms in the Prometheus text format, so a router
+can expose them at /metrics:
+
+    metrics = Metrics(get_route=router.get_route)
+    router.add_route('/metrics', metrics.handle)
+    run_server(create_handler(router), metrics=metrics)
+
+A Metrics object lives in the memory of the process that uses it. In
+PROCESS_MODE and PREFORK_MODE, each worker process counts only the requests
+that it serves, and a request for /metrics reports the counts of whichever
+worker serves it.
+
+sources:
+- https://prometheus.io/docs/instrumenting/exposition_formats/
+- https://prometheus.io/docs/practices/histograms/
+- https://prometheus.io/docs/practices/naming/
+"""
+
+
+import bisect
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+from typing import Dict  # noqa: F401
+
+from .media_types import MEDIA_TYPES
+from .requests import Request
+from .responses import Response
+
+
+ACCEPT_PHASE = 'accept'
+READ_PHASE = 'read'
+PARSE_PHASE = 'parse'
+HANDLE_PHASE = 'handle'
+SERIALIZE_PHASE = 'serialize'
+SEND_PHASE = 'send'
+
+# The phases of a request, in order (see RequestTimer).
+REQUEST_PHASES = (
+    READ_PHASE, PARSE_PHASE, HANDLE_PHASE, SERIALIZE_PHASE, SEND_PHASE
+)
+
+# Kinds of timeouts (see Metrics.observe_timeout).
+HEADER_TIMEOUT = 'header'
+BODY_TIMEOUT = 'body'
+HANDLER_TIMEOUT = 'handler'
+WRITE_TIMEOUT = 'write'
+TIMEOUTS = (HEADER_TIMEOUT, BODY_TIMEOUT, HANDLER_TIMEOUT, WRITE_TIMEOUT)
+
+# Reasons for rejecting a request because the server is overloaded (see
+# Metrics.observe_rejection and run_server): every worker was busy and the
+# queue of waiting connections was full, a connection waited in the queue for
+# too long, or too many requests were already being handled.
+QUEUE_FULL = 'queue_full'
+QUEUE_TIME = 'queue_time'
+IN_FLIGHT = 'in_flight'
+REJECTIONS = (QUEUE_FULL, QUEUE_TIME, IN_FLIGHT)
+
+# The upper bounds, in seconds, of the histograms' buckets. Parsing takes
+# microseconds and sending a large file may take seconds, so the buckets grow
+# exponentially to cover both with the same number of buckets per decade.
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005,
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0,
+    10.0
+)
+
+# The route label of requests that weren't matched to a route (e.g. because
+# they couldn't be parsed), or of every request if Metrics has no get_route.
+NO_ROUTE = ''
+
+_PREFIX = 'http_server_'
+
+
+class RequestTimer:
+    """Records when a request finishes each of its phases.
+
+    The server creates a timer when the first byte of a request arrives and
+    calls mark at the end of each phase in REQUEST_PHASES. A request that
+    fails early (e.g. because it can't be parsed) has fewer marks.
+    """
+
+    __slots__ = ('start', 'marks')
+
+    def __init__(self, start: float) -> None:
+        # Times as returned by time.perf_counter.
+        self.start = start
+        self.marks = []  # type: List[float]
+
+    def mark(self) -> None:
+        self.marks.append(time.perf_counter())
+
+    @property
+    def duration(self) -> float:
+        if not self.marks:
+            return 0.0
+        return self.marks[-1] - self.start
+
+
+class Histogram:
+    """A histogram with fixed buckets, as exposed to Prometheus: a count of
+    observations no greater than each bucket's upper bound, and the sum and
+    count of all observations."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+
+        # The number of observations in each bucket (not cumulative), with
+        # one more for observations greater than the last bound.
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> List[Tuple[str, int]]:
+        """Get the number of observations no greater than each bound, as
+        pairs of (formatted bound, count), ending with '+Inf'."""
+
+        cumulative = []  # type: List[Tuple[str, int]]
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            cumulative.append((_format_value(bound), total))
+        cumulative.append(('+Inf', self.count))
+        return cumulative
+
+
+class Metrics:
+    """Counters and latency histograms for a server (see
+    http_server.metrics).
+
+    get_route labels each request with the route that handled it (e.g.
+    Router.get_route). Labels should come from a small fixed set, since each
+    distinct label gets its own histogram; labeling requests with their URIs
+    would let clients create histograms without limit.
+    """
+
+    def __init__(
+            self,
+            get_route: Optional[Callable[[Request], Optional[str]]] = None,
+            buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+
+        self._get_route = get_route
+        self._buckets = buckets
+        self._lock = threading.Lock()
+
+        self.connections = 0
+        self._phases = {
+            phase: Histogram(buckets)
+            for phase in (ACCEPT_PHASE,) + REQUEST_PHASES
+        }  # type: Dict[str, Histogram]
+
+        # Requests by (status code, route).
+        self._requests = {}  # type: Dict[Tuple[int, str], Histogram]
+
+        self._timeouts = dict.fromkeys(TIMEOUTS, 0)  # type: Dict[str, int]
+        self._rejections = dict.fromkeys(
+            REJECTIONS, 0
+        )  # type: Dict[str, int]
+
+        # The URI at which Metrics.wrap serves the metrics, and its parts (see
+        # Request.uri).
+        self._uri = None  # type: Optional[str]
+        self._uri_parts = None  # type: Optional[List[str]]
+
+    def get_route(self, request: Optional[Request]) -> str:
+        """Get the route label of a request (see Metrics)."""
+
+        if request is None:
+            return NO_ROUTE
+        if self._uri is not None and request.uri == self._uri_parts:
+            return self._uri
+        if self._get_route is None:
+            return NO_ROUTE
+        route = self._get_route(request)
+        return NO_ROUTE if route is None else route
+
+    def observe_connection(self, wait: float) -> None:
+        """Count a connection that waited for the given number of seconds
+        between being accepted and being served."""
+
+        with self._lock:
+            self.connections += 1
+            self._phases[ACCEPT_PHASE].observe(wait)
+
+    def observe_request(
+            self,
+            timer: RequestTimer,
+            status_code: int,
+            route: str = NO_ROUTE) -> None:
+        """Count a request and record the durations of its phases."""
+
+        with self._lock:
+            previous = timer.start
+            for phase, mark in zip(REQUEST_PHASES, timer.marks):
+                self._phases[phase].observe(mark - previous)
+                previous = mark
+
+            key = (status_code, route)
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = Histogram(self._buckets)
+            histogram.observe(timer.duration)
+
+    def observe_timeout(self, kind: str) -> None:
+        """Count a timeout of the given kind (e.g. HEADER_TIMEOUT)."""
+
+        with self._lock:
+            self._timeouts[kind] += 1
+
+    def get_timeout_count(self, kind: str) -> int:
+        """Get the number of timeouts of the given kind."""
+
+        with self._lock:
+            return self._timeouts[kind]
+
+    def observe_rejection(self, reason: str) -> None:
+        """Count a request rejected for the given reason (e.g. QUEUE_FULL)."""
+
+        with self._lock:
+            self._rejections[reason] += 1
+
+    def get_rejection_count(self, reason: str) -> int:
+        """Get the number of requests rejected for the given reason."""
+
+        with self._lock:
+            return self._rejections[reason]
+
+    def get_request_count(
+            self,
+            status_code: Optional[int] = None,
+            route: Optional[str] = None) -> int:
+        """Get the number of requests counted with the given status code and
+        route, or with any if not given."""
+
+        with self._lock:
+            return sum(
+                histogram.count
+                for (status, label), histogram in self._requests.items()
+                if status_code in (None, status) and route in (None, label)
+            )
+
+    def get_phase(self, phase: str) -> Histogram:
+        """Get the histogram of the given phase's durations."""
+
+        return self._phases[phase]
+
+    def export(self) -> str:
+        """Format the metrics in the Prometheus text format."""
+
+        with self._lock:
+            lines = [
+                '# HELP {}connections_total Connections served.'.format(
+                    _PREFIX
+                ),
+                '# TYPE {}connections_total counter'.format(_PREFIX),
+                '{}connections_total {}'.format(_PREFIX, self.connections),
+            ]
+
+            name = _PREFIX + 'requests_total'
+            lines.extend((
+                '# HELP {} Requests served, by status code and route.'.format(
+                    name
+                ),
+                '# TYPE {} counter'.format(name),
+            ))
+            for (status, route), histogram in sorted(self._requests.items()):
+                lines.append('{}{} {}'.format(
+                    name, _format_labels(_get_labels(status, route)),
+                    histogram.count
+                ))
+
+            name = _PREFIX + 'timeouts_total'
+            lines.extend((
+                '# HELP {} Requests that timed out, by kind.'.format(name),
+                '# TYPE {} counter'.format(name),
+            ))
+            for kind in TIMEOUTS:
+                lines.append('{}{} {}'.format(
+                    name, _format_labels((('kind', kind),)),
+                    self._timeouts[kind]
+                ))
+
+            name = _PREFIX + 'rejections_total'
+            lines.extend((
+                '# HELP {} Requests rejected because the server was '
+                'overloaded, by reason.'.format(name),
+                '# TYPE {} counter'.format(name),
+            ))
+            for reason in REJECTIONS:
+                lines.append('{}{} {}'.format(
+                    name, _format_labels((('reason', reason),)),
+                    self._rejections[reason]
+                ))
+
+            name = _PREFIX + 'request_duration_seconds'
+            lines.extend((
+                '# HELP {} Time from the first byte of a request to the end '
+                'of its response, by status code and route.'.format(name),
+                '# TYPE {} histogram'.format(name),
+            ))
+            for (status, route), histogram in sorted(self._requests.items()):
+                lines.extend(_format_histogram(
+                    name, _get_labels(status, route), histogram
+                ))
+
+            name = _PREFIX + 'phase_duration_seconds'
+            lines.extend((
+                '# HELP {} Time spent in each phase of serving a '
+                'request.'.format(name),
+                '# TYPE {} histogram'.format(name),
+            ))
+            for phase in (ACCEPT_PHASE,) + REQUEST_PHASES:
+                lines.extend(_format_histogram(
+                    name, (('phase', phase),), self._phases[phase]
+                ))
+
+        return '\n'.join(lines) + '\n'
+
+    def handle(self, request: Request) -> Response:
+        """A handler function (see create_handler) that responds with the
+        metrics."""
+
+        return Response(200, MEDIA_TYPES['plain'], self.export())
+
+    def wrap(
+            self,
+            handler_func: Callable[[Request], Response],
+            uri: str = '/metrics') -> Callable[[Request], Response]:
+        """Wrap a handler function so that requests for the given URI get
+        the metrics (see Metrics.handle) and other requests are passed on to
+        the handler function. Requests for the URI are labeled with it as
+        their route."""
+
+        parts = uri.strip('/').split('/')
+        self._uri = uri
+        self._uri_parts = parts
+
+        def wrapper(request: Request) -> Response:
+            if request.uri == parts:
+                return self.handle(request)
+            return handler_func(request)
+
+        return wrapper
+
+
+def _get_labels(status_code: int, route: str) -> Tuple[Tuple[str, str], ...]:
+    return (('route', route), ('status', str(status_code)))
+
+
+def _format_histogram(
+        name: str,
+        labels: Tuple[Tuple[str, str], ...],
+        histogram: Histogram) -> List[str]:
+
+    lines = [
+        '{}_bucket{} {}'.format(
+            name, _format_labels(labels + (('le', bound),)), count
+        )
+        for bound, count in histogram.get_cumulative_counts()
+    ]
+    lines.append('{}_sum{} {}'.format(
+        name, _format_labels(labels), _format_value(histogram.sum)
+    ))
+    lines.append('{}_count{} {}'.format(
+        name, _format_labels(labels), histogram.count
+    ))
+    return lines
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    return '{' + ','.join(
+        '{}="{}"'.format(name, _escape(value)) for name, value in labels
+    ) + '}'
+
+
+def _escape(value: str) -> str:
+    # Label values may contain any characters, but backslashes, double
+    # quotes and line feeds must be escaped.
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+def _format_value(value: float) -> str:
+    # repr gives the shortest string that parses back to the same float.
+    return repr(float(value))
@@ -0,0 +1,342 @@
+"""Tools for running a pre-forking server.
+
+A pre-forking server consists of a master process and a fixed number of worker
+processes forked from it. Each worker accepts and serves connections on its
+own, so the workers run on separate cores without contending for the GIL. The
+master serves no connections; it only supervises the workers.
+
+If the platform supports SO_REUSEPORT, each worker listens on a socket of its
+own, and the kernel distributes incoming connections evenly among the
+workers' sockets. Otherwise, the workers share a single listening socket
+created by the master, and whichever worker is waiting for a connection when
+one arrives accepts it.
+
+The master responds to signals as follows:
+- SIGTERM or SIGINT: Shut down gracefully. Each worker stops accepting
+  connections, finishes serving the connections it has already accepted, and
+  exits. Workers that haven't exited after the graceful timeout are killed.
+- SIGHUP: Replace every worker. New workers are started, and the old ones are
+  stopped gracefully.
+- SIGCHLD (sent by the kernel when a worker exits): Start a new worker in
+  place of any worker that exited unexpectedly, e.g. because it crashed.
+
+sources:
+- man 2 fork
+- man 7 signal
+- man 2 sigwaitinfo
+- man 7 socket (SO_REUSEPORT)
+- https://lwn.net/Articles/542629/
+- https://docs.gunicorn.org/en/stable/signals.html
+"""
+
+
+import os
+import selectors
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Any, Callable, Iterator, Optional, Set, Tuple
+from typing import Dict  # noqa: F401
+
+
+# If a worker exits unexpectedly within this many seconds of starting, the
+# master waits this long before starting its replacement, so that a worker
+# that crashes immediately (e.g. because it cannot bind its socket) doesn't
+# make the master fork continuously. The master still responds to signals in
+# the meantime.
+_MIN_WORKER_LIFETIME = 1.0
+
+# How often (in seconds) an idle worker checks whether the master still
+# exists. A worker whose master was killed (e.g. with SIGKILL) exits on its
+# own rather than serving connections forever.
+_MASTER_CHECK_INTERVAL = 1.0
+
+# The signals that the master handles.
+_MASTER_SIGNALS = {
+    signal.SIGCHLD, signal.SIGTERM, signal.SIGINT, signal.SIGHUP
+}
+
+# Set in a worker process when it receives SIGTERM (see is_stopping).
+_stopping = False
+
+
+def is_stopping() -> bool:
+    """Determine whether the current process is a worker that has been told
+    to stop. A stopping worker accepts no more connections and should close
+    each of its persistent connections after its current request."""
+
+    return _stopping
+
+
+def run_prefork(
+        create_listener: Callable[[], socket.socket],
+        run_worker: Callable[[Iterator[Tuple[socket.socket, Any]]], None],
+        workers: int,
+        graceful_timeout: float,
+        reuse_port: bool,
+        verbose: bool) -> None:
+    """Run a pre-forking server with the given number of worker processes.
+
+    create_listener creates a listening socket. If reuse_port is true, each
+    worker calls it to create its own socket (which must have the
+    SO_REUSEPORT option); otherwise, the master calls it once. run_worker
+    serves an iterator of (connection, peer address) pairs, which ends when
+    the worker is told to stop.
+    """
+
+    if reuse_port:
+        # Create and immediately close a listening socket so that the server
+        # fails right away, rather than in every worker, if the address is
+        # unavailable.
+        create_listener().close()
+        listener = None  # type: Optional[socket.socket]
+    else:
+        listener = create_listener()
+
+    try:
+        _Master(
+            listener, create_listener, run_worker, workers, graceful_timeout,
+            verbose
+        ).run()
+    finally:
+        if listener is not None:
+            listener.close()
+
+
+class _Master:
+
+    def __init__(
+            self,
+            listener: Optional[socket.socket],
+            create_listener: Callable[[], socket.socket],
+            run_worker: Callable[[Iterator[Tuple[socket.socket, Any]]], None],
+            workers: int,
+            graceful_timeout: float,
+            verbose: bool) -> None:
+
+        self._listener = listener
+        self._create_listener = create_listener
+        self._run_worker = run_worker
+        self._workers = workers
+        self._graceful_timeout = graceful_timeout
+        self._verbose = verbose
+
+        # The process IDs of the running workers, with their start times (see
+        # time.monotonic), and of the workers that have been told to stop.
+        self._started = {}  # type: Dict[int, float]
+        self._retiring = set()  # type: Set[int]
+
+        # The signal mask to restore in each worker.
+        self._worker_mask = set()  # type: Set[int]
+
+        # When to replace workers that exited soon after starting (see
+        # _MIN_WORKER_LIFETIME), if any have.
+        self._respawn_at = None  # type: Optional[float]
+
+    def run(self) -> None:
+        # Block the signals that the master handles, and instead wait for
+        # them synchronously (man 2 sigwaitinfo). Unlike a signal handler,
+        # this can't interrupt the master in the middle of starting or
+        # reaping a worker.
+        self._worker_mask = signal.pthread_sigmask(
+            signal.SIG_BLOCK, _MASTER_SIGNALS
+        )
+        try:
+            self._supervise()
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, self._worker_mask)
+
+    def _supervise(self) -> None:
+        for _ in range(self._workers):
+            self._spawn()
+
+        while True:
+            if self._respawn_at is None:
+                info = signal.sigwaitinfo(
+                    _MASTER_SIGNALS
+                )  # type: Optional[signal.struct_siginfo]
+            else:
+                info = signal.sigtimedwait(
+                    _MASTER_SIGNALS,
+                    max(self._respawn_at - time.monotonic(), 0)
+                )
+
+            if info is None:
+                # The time to start the delayed replacements has come.
+                self._respawn_at = None
+                self._replace_exited()
+            elif info.si_signo == signal.SIGCHLD:
+                if self._reap() and self._respawn_at is None:
+                    self._respawn_at = (
+                        time.monotonic() + _MIN_WORKER_LIFETIME
+                    )
+                if self._respawn_at is None:
+                    self._replace_exited()
+            elif info.si_signo == signal.SIGHUP:
+                self._reload()
+            else:
+                self._shut_down()
+                return
+
+    def _spawn(self) -> None:
+        # Flush buffered output so that it isn't written by both processes.
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid == 0:
+            # In the worker. Never return to the caller, which belongs to the
+            # master.
+            status = 1
+            try:
+                _run_worker(
+                    self._listener,
+                    self._create_listener,
+                    self._run_worker,
+                    self._worker_mask
+                )
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+
+        self._started[pid] = time.monotonic()
+        if self._verbose:
+            print('Started worker {}'.format(pid))
+
+    def _reap(self) -> bool:
+        # Collect the exit statuses of any workers that have exited, so that
+        # they don't remain as zombies (man 2 waitpid). Return whether any
+        # worker exited unexpectedly soon after starting.
+        exited_early = False
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+            started = self._started.pop(pid, None)
+            if pid in self._retiring:
+                self._retiring.remove(pid)
+            elif started is not None and (
+                    time.monotonic() - started < _MIN_WORKER_LIFETIME):
+                exited_early = True
+            if self._verbose:
+                print('Worker {} exited with status {}'.format(pid, status))
+        return exited_early
+
+    def _replace_exited(self) -> None:
+        missing = self._workers - (len(self._started) - len(self._retiring))
+        for _ in range(missing):
+            self._spawn()
+
+    def _reload(self) -> None:
+        old = set(self._started) - self._retiring
+        for _ in range(self._workers):
+            self._spawn()
+        for pid in old:
+            self._stop(pid)
+
+    def _shut_down(self) -> None:
+        for pid in set(self._started) - self._retiring:
+            self._stop(pid)
+
+        deadline = time.monotonic() + self._graceful_timeout
+        while self._started:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or signal.sigtimedwait(
+                    _MASTER_SIGNALS, timeout) is None:
+                break
+            self._reap()
+
+        for pid in self._started:
+            # The worker didn't finish in time.
+            os.kill(pid, signal.SIGKILL)
+        for pid in list(self._started):
+            os.waitpid(pid, 0)
+            del self._started[pid]
+
+    def _stop(self, pid: int) -> None:
+        self._retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def _run_worker(
+        listener: Optional[socket.socket],
+        create_listener: Callable[[], socket.socket],
+        run_worker: Callable[[Iterator[Tuple[socket.socket, Any]]], None],
+        mask: Set[int]) -> None:
+
+    # SIGINT (e.g. from pressing Ctrl-C in a terminal, which signals every
+    # process in the foreground process group) and SIGHUP are meant for the
+    # master, which relays them to the workers as appropriate.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, _stop)
+
+    # When a signal arrives, Python writes a byte to the wakeup file
+    # descriptor, which wakes up the worker if it is waiting for a
+    # connection.
+    wakeup_reader, wakeup_writer = socket.socketpair()
+    wakeup_reader.setblocking(False)
+    wakeup_writer.setblocking(False)
+    signal.set_wakeup_fd(wakeup_writer.fileno())
+
+    signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+    if listener is None:
+        listener = create_listener()
+    with listener, wakeup_reader, wakeup_writer:
+        run_worker(_accept_until_stopped(listener, wakeup_reader))
+
+
+def _stop(signum: int, frame: Any) -> None:
+    global _stopping
+    _stopping = True
+
+
+def _accept_until_stopped(
+        listener: socket.socket,
+        wakeup: socket.socket) -> Iterator[Tuple[socket.socket, Any]]:
+
+    # Wait for either a connection or a signal (see man 7 epoll). The
+    # listening socket is nonblocking, since another worker sharing it may
+    # accept a connection between the wakeup and the call to accept.
+    master = os.getppid()
+    listener.setblocking(False)
+    with selectors.DefaultSelector() as selector:
+        selector.register(listener, selectors.EVENT_READ)
+        selector.register(wakeup, selectors.EVENT_READ)
+
+        while not _stopping and os.getppid() == master:
+            for key, _ in selector.select(_MASTER_CHECK_INTERVAL):
+                if key.fileobj is wakeup:
+                    _drain(wakeup)
+                    continue
+                try:
+                    connection, peer = listener.accept()
+                except BlockingIOError:
+                    continue
+                connection.setblocking(True)
+                yield connection, peer
+                if _stopping:
+                    break
+
+
+def _drain(wakeup: socket.socket) -> None:
+    try:
+        while wakeup.recv(4096):
+            pass
+    except BlockingIOError:
+        pass
@@ -0,0 +1,615 @@
+"""A handler function that forwards requests to upstream servers.
+
+A Proxy is a handler function (see create_handler) that forwards each request
+to one of a list of upstream servers, e.g. local backend processes, and
+relays the upstream server's response back to the client:
+
+    proxy = Proxy([('127.0.0.1', 8081), ('127.0.0.1', 8082)])
+    run_server(create_handler(proxy), workers=16)
+
+The proxy forwards requests with any method, so it should be created with
+methods=METHODS (see http_server.tokens) to forward more than GET and HEAD.
+
+Opening a TCP connection to an upstream server costs a round trip before the
+request can even be sent, so the proxy keeps a pool of idle persistent
+connections to each upstream server and reuses them (see
+https://tools.ietf.org/html/rfc7230#section-6.3). An idle connection that the
+upstream server has closed in the meantime is detected when the request is
+sent on it, and the request is retried once on a new connection. Requests
+that can't safely be sent twice, because their method isn't idempotent
+(POST) or their body has already been streamed to the upstream server, are
+never retried, so they are always sent on new connections (which are then
+kept for reuse).
+
+A request's body is streamed to the upstream server as it is read from the
+client (see http_server.bodies), with its Content-Length if it had one, and
+using the chunked transfer coding otherwise.
+
+Requests are spread across the upstream servers either in turn
+(ROUND_ROBIN) or by sending each request to the server with the fewest
+requests in progress (LEAST_CONNECTIONS), which suits requests that take very
+different amounts of time. If an upstream server refuses connections, the
+next one is tried.
+
+The upstream response's body is streamed to the client as it arrives (see
+http_server.responses.StreamingResponse), so a large response is never held
+in memory, and a slow client slows down reading from the upstream server
+rather than letting the body pile up. A body of known length is relayed with
+its Content-Length; any other body is relayed using the chunked transfer
+coding. Hop-by-hop headers, which describe a single connection, are not
+forwarded in either direction.
+
+An upstream server that can't be reached or sends an invalid response gets
+the client a 502 Bad Gateway response, and one that doesn't respond within
+timeout seconds, a 504 Gateway Timeout response.
+
+sources:
+- https://tools.ietf.org/html/rfc7230#section-3.3.3
+- https://tools.ietf.org/html/rfc7230#section-4.1
+- https://tools.ietf.org/html/rfc7230#section-5.7
+- https://tools.ietf.org/html/rfc7230#section-6.1
+- https://tools.ietf.org/html/rfc7230#section-6.3.1
+"""
+
+
+import collections
+import itertools
+import re
+import socket
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+from typing import Tuple, cast
+from typing import Deque  # noqa: F401
+
+from .bodies import RequestBody
+from .connections import RequestError
+from .requests import Request
+from .responses import Response, StreamingResponse, get_error_response
+from .server import create_tcp_socket
+from .tokens import DELETE_METHOD, GET_METHOD, HEAD_METHOD, PUT_METHOD
+from .tokens import HTTP_VERSION, CRLF
+
+
+ROUND_ROBIN = 'round_robin'
+LEAST_CONNECTIONS = 'least_connections'
+BALANCERS = (ROUND_ROBIN, LEAST_CONNECTIONS)
+
+DEFAULT_MAX_IDLE = 32
+DEFAULT_TIMEOUT = 30.0
+
+# The maximum length of an upstream response's status line and headers.
+MAX_HEAD_LENGTH = 64 * 1024
+
+# How much of a response's body is read from the upstream server at a time.
+_READ_SIZE = 64 * 1024
+
+# Headers that apply only to a single connection, and so are never forwarded
+# (https://tools.ietf.org/html/rfc7230#section-6.1). Content-Length is
+# replaced by the proxy's own framing of the body.
+_HOP_BY_HOP = frozenset((
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'proxy-connection', 'te', 'trailer', 'transfer-encoding', 'upgrade',
+    'content-length'
+))
+
+# Requests with these methods may be sent more than once
+# (https://tools.ietf.org/html/rfc7231#section-4.2.2).
+_IDEMPOTENT_METHODS = (GET_METHOD, HEAD_METHOD, PUT_METHOD, DELETE_METHOD)
+
+# Identifies the proxy in the Via header of forwarded messages
+# (https://tools.ietf.org/html/rfc7230#section-5.7.1).
+_VIA = '1.1 http_server'
+
+_STATUS_LINE = re.compile(rb'HTTP/1\.([0-9]) ([0-9]{3})(?: [^\r\n]*)?\r\n')
+
+_CRLF = CRLF.encode()
+_HEAD_END = _CRLF + _CRLF
+
+# The empty chunk that ends a chunked body, followed by an empty trailer.
+_LAST_CHUNK = b'0' + _HEAD_END
+
+
+class _UpstreamError(Exception):
+    # The upstream server closed the connection unexpectedly or sent an
+    # invalid response.
+    pass
+
+
+class Proxy:
+    """Forwards requests to upstream servers (see http_server.proxy).
+
+    At most max_idle idle connections to each upstream server are kept open.
+    balancer is one of BALANCERS.
+    """
+
+    def __init__(
+            self,
+            upstreams: Sequence[Tuple[str, int]],
+            balancer: str = ROUND_ROBIN,
+            max_idle: int = DEFAULT_MAX_IDLE,
+            timeout: Optional[float] = DEFAULT_TIMEOUT) -> None:
+
+        if not upstreams or balancer not in BALANCERS:
+            raise ValueError()
+
+        self._upstreams = [
+            _Upstream(address, max_idle, timeout) for address in upstreams
+        ]
+        self._balancer = balancer
+        self._turns = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def upstreams(self) -> List[Tuple[str, int]]:
+        """The addresses of the upstream servers."""
+        return [upstream.address for upstream in self._upstreams]
+
+    def get_connection_counts(self) -> List[Tuple[int, int]]:
+        """Get the number of requests in progress and of idle connections
+        for each upstream server, in order."""
+
+        with self._lock:
+            return [
+                (upstream.active, len(upstream.idle))
+                for upstream in self._upstreams
+            ]
+
+    def __call__(self, request: Request) -> Response:
+        request_bytes = _get_request_bytes(request)
+        retry = (
+            request.method in _IDEMPOTENT_METHODS and request.body.length == 0
+        )
+
+        # Try each upstream server at most once, in the order chosen by the
+        # balancer, until one accepts a connection.
+        for upstream in self._choose():
+            lease = _Lease(self, upstream)
+            try:
+                return lease.forward(
+                    request_bytes, request.body,
+                    request.method == HEAD_METHOD, retry
+                )
+            except RequestError:
+                # The client's body couldn't be read. The server responds
+                # with the error instead.
+                lease.release(False)
+                raise
+            except ConnectionRefusedError:
+                lease.release(False)
+            except socket.timeout:
+                lease.release(False)
+                # https://tools.ietf.org/html/rfc7231#section-6.6.5
+                return get_error_response(504)
+            except (OSError, _UpstreamError):
+                lease.release(False)
+                break
+        # https://tools.ietf.org/html/rfc7231#section-6.6.3
+        return get_error_response(502)
+
+    def _choose(self) -> Iterator['_Upstream']:
+        with self._lock:
+            first = next(self._turns) % len(self._upstreams)
+            order = self._upstreams[first:] + self._upstreams[:first]
+            if self._balancer == LEAST_CONNECTIONS:
+                # sorted is stable, so servers with equally many requests in
+                # progress are still chosen in turn.
+                order.sort(key=lambda upstream: upstream.active)
+            upstream = order[0]
+            upstream.active += 1
+        yield upstream
+        for upstream in order[1:]:
+            with self._lock:
+                upstream.active += 1
+            yield upstream
+
+    def _finish(self, upstream: '_Upstream') -> None:
+        with self._lock:
+            upstream.active -= 1
+
+
+class _Upstream:
+    # An upstream server and its idle connections.
+
+    def __init__(
+            self,
+            address: Tuple[str, int],
+            max_idle: int,
+            timeout: Optional[float]) -> None:
+
+        self.address = address
+        self.max_idle = max_idle
+        self.timeout = timeout
+
+        # The number of requests in progress, guarded by the Proxy's lock.
+        self.active = 0
+
+        # Appending to and popping from a deque are atomic. The most recently
+        # used connection is reused first, since it's the least likely to
+        # have been closed by the server.
+        self.idle = collections.deque()  # type: Deque[socket.socket]
+
+    def connect(self) -> socket.socket:
+        connection = create_tcp_socket()
+        try:
+            connection.settimeout(self.timeout)
+            # Send small requests immediately rather than waiting to combine
+            # them with more data (Nagle's algorithm, see man 7 tcp).
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.connect(self.address)
+        except:  # noqa: E722
+            connection.close()
+            raise
+        return connection
+
+    def pop_idle(self) -> Optional[socket.socket]:
+        try:
+            return self.idle.pop()
+        except IndexError:
+            return None
+
+    def put_idle(self, connection: socket.socket) -> None:
+        if len(self.idle) < self.max_idle:
+            self.idle.append(connection)
+        else:
+            connection.close()
+
+
+class _Lease:
+    # The use of an upstream server for one request, from choosing the server
+    # until the response has been relayed. Releasing the lease returns the
+    # connection to the pool or closes it.
+
+    def __init__(self, proxy: Proxy, upstream: _Upstream) -> None:
+        self._proxy = proxy
+        self._upstream = upstream
+        self._connection = None  # type: Optional[socket.socket]
+        self._released = False
+
+    def forward(
+            self,
+            request_bytes: bytes,
+            body: RequestBody,
+            head: bool,
+            retry: bool) -> Response:
+
+        # Send the request and read the head of the response. An idle
+        # connection may have been closed by the server (which is allowed to
+        # close it at any time), in which case nothing at all is received;
+        # the request is then sent again on a new connection if retry is
+        # true, and otherwise only new connections are used. head is whether
+        # the request is a HEAD request, whose response has no body.
+        reader = None  # type: Optional[_Reader]
+        while reader is None:
+            self._connection = self._upstream.pop_idle() if retry else None
+            reused = self._connection is not None
+            if self._connection is None:
+                self._connection = self._upstream.connect()
+
+            try:
+                self._connection.sendall(request_bytes)
+                _send_body(self._connection, body)
+                reader = _Reader(self._connection)
+                status_code, version, headers = reader.read_head()
+            except (ConnectionError, _UpstreamError) as error:
+                self._connection.close()
+                self._connection = None
+                if not reused or (reader is not None and reader.received):
+                    if isinstance(error, ConnectionError):
+                        raise _UpstreamError() from error
+                    raise
+                reader = None
+
+        assert reader is not None
+        keep_alive = version >= 1 and not _has_token(
+            headers, 'connection', 'close'
+        )
+        length, chunks = _get_body(reader, status_code, headers, head)
+        if head:
+            # There's no body to relay, so the connection can be reused at
+            # once.
+            self.release(keep_alive)
+        elif length is None and not _has_token(
+                headers, 'transfer-encoding', 'chunked'):
+            # The body ends when the server closes the connection.
+            keep_alive = False
+
+        try:
+            return ProxyResponse(
+                status_code,
+                _get_end_to_end_headers(headers),
+                length,
+                chunks if head else self._relay(chunks, keep_alive),
+                self.release
+            )
+        except ValueError as error:
+            # A status code that Response doesn't know.
+            raise _UpstreamError() from error
+
+    def release(self, reusable: bool) -> None:
+        if self._released:
+            return
+        self._released = True
+        if self._connection is not None:
+            if reusable:
+                self._upstream.put_idle(self._connection)
+            else:
+                self._connection.close()
+            self._connection = None
+        self._proxy._finish(self._upstream)
+
+    def _relay(
+            self,
+            chunks: Iterator[bytes],
+            keep_alive: bool) -> Iterator[bytes]:
+
+        # Relay the body, and release the connection once it has been read
+        # completely. If it isn't (e.g. because the client went away), the
+        # response releases the connection without reusing it.
+        yield from chunks
+        self.release(keep_alive)
+
+
+class ProxyResponse(StreamingResponse):
+    """A response relayed from an upstream server by a Proxy.
+
+    The message body is produced by an iterator of bytes. If its length is
+    known, it is sent with a Content-Length header; if not, it is sent using
+    the chunked transfer coding. release is called with False when the
+    response is closed, in case the body wasn't relayed completely.
+    """
+
+    def __init__(
+            self,
+            status_code: int,
+            headers: Sequence[Tuple[str, str]],
+            length: Optional[int],
+            chunks: Iterator[bytes],
+            release: Callable[[bool], None]) -> None:
+
+        super().__init__(status_code, None, chunks, headers)
+        self._length = length
+        self._has_body = status_code not in _NO_BODY_STATUS_CODES
+        self._release = release
+
+    def get_chunks(self) -> Iterator[List[bytes]]:
+        if self._length is None and self._has_body:
+            yield from super().get_chunks()
+            return
+        # The body is delimited by its Content-Length, so it is sent as it
+        # is.
+        for chunk in self.chunks:
+            if chunk:
+                # The chunks are read from the upstream server, so they're
+                # always bytes.
+                yield [cast(bytes, chunk)]
+
+    def close(self) -> None:
+        super().close()
+        self._release(False)
+
+    def _get_content_length(self) -> bytes:
+        if not self._has_body:
+            return b''
+        if self._length is None:
+            return super()._get_content_length()
+        return Response._get_content_length(self)
+
+    def _get_body_length(self) -> Optional[int]:
+        return self._length if self._has_body else None
+
+
+class _Reader:
+    # Reads an upstream response from a connection.
+
+    def __init__(self, connection: socket.socket) -> None:
+        self._connection = connection
+        self._buffer = b''
+
+        # Whether any data has been received.
+        self.received = False
+
+    def read_head(self) -> Tuple[int, int, List[Tuple[str, str]]]:
+        # Read the status line and headers of the response, skipping any
+        # interim (1xx) responses, and return the status code, the minor HTTP
+        # version and the headers.
+        while True:
+            head = self._read_until(_HEAD_END, MAX_HEAD_LENGTH)
+            match = _STATUS_LINE.match(head)
+            if match is None:
+                raise _UpstreamError()
+            status_code = int(match.group(2))
+            if not 100 <= status_code < 200:
+                break
+        headers = []  # type: List[Tuple[str, str]]
+        for line in head[match.end():-len(_HEAD_END)].split(_CRLF):
+            if line[:1] in (b' ', b'\t'):
+                # An obsolete line continuation
+                # (https://tools.ietf.org/html/rfc7230#section-3.2.4).
+                if headers:
+                    name, value = headers.pop()
+                    value += ' ' + line.strip().decode('latin-1')
+                    headers.append((name, value))
+                continue
+            name_bytes, colon, value_bytes = line.partition(b':')
+            if colon:
+                headers.append((
+                    name_bytes.strip().decode('latin-1'),
+                    value_bytes.strip().decode('latin-1')
+                ))
+        return status_code, int(match.group(1)), headers
+
+    def read_length(self, length: int) -> Iterator[bytes]:
+        # Read exactly length bytes.
+        while length > 0:
+            data = self._read(length)
+            length -= len(data)
+            yield data
+
+    def read_chunked(self) -> Iterator[bytes]:
+        # Read a body in the chunked transfer coding, yielding the data of
+        # each chunk (https://tools.ietf.org/html/rfc7230#section-4.1).
+        while True:
+            line = self._read_until(_CRLF, MAX_HEAD_LENGTH)
+            try:
+                # Ignore any chunk extensions.
+                size = int(line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise _UpstreamError()
+            if size == 0:
+                break
+            yield from self.read_length(size)
+            if self._read_until(_CRLF, len(_CRLF)) != _CRLF:
+                raise _UpstreamError()
+        # Skip the trailer.
+        while self._read_until(_CRLF, MAX_HEAD_LENGTH) != _CRLF:
+            pass
+
+    def read_to_end(self) -> Iterator[bytes]:
+        if self._buffer:
+            yield self._buffer
+            self._buffer = b''
+        while True:
+            data = self._connection.recv(_READ_SIZE)
+            if not data:
+                return
+            yield data
+
+    def _read(self, max_length: int) -> bytes:
+        # Read up to max_length bytes, from the buffer if it isn't empty.
+        if not self._buffer:
+            self._receive()
+        data = self._buffer[:max_length]
+        self._buffer = self._buffer[max_length:]
+        return data
+
+    def _read_until(self, delimiter: bytes, max_length: int) -> bytes:
+        # Read up to and including the delimiter.
+        start = 0
+        while True:
+            end = self._buffer.find(delimiter, start)
+            if end != -1:
+                end += len(delimiter)
+                data = self._buffer[:end]
+                self._buffer = self._buffer[end:]
+                return data
+            if len(self._buffer) >= max_length:
+                raise _UpstreamError()
+            start = max(0, len(self._buffer) - len(delimiter) + 1)
+            self._receive()
+
+    def _receive(self) -> None:
+        data = self._connection.recv(_READ_SIZE)
+        if not data:
+            raise ConnectionResetError()
+        self.received = True
+        self._buffer += data
+
+
+# Responses to these status codes never have a body
+# (https://tools.ietf.org/html/rfc7230#section-3.3.3).
+_NO_BODY_STATUS_CODES = frozenset((204, 304))
+
+
+def _get_request_bytes(request: Request) -> bytes:
+    # Serialize the head of the request to forward. Its body, if any, is
+    # sent separately (see _send_body).
+    uri = '/' + '/'.join(request.uri)
+    if request.query:
+        uri += '?' + request.query
+    lines = ['{} {} {}'.format(request.method, uri, HTTP_VERSION)]
+    connection_tokens = _get_tokens(request.headers.get_all('Connection'))
+    for name in request.headers:
+        # The server has already dealt with "Expect: 100-continue" (see
+        # http_server.connections.ConnectionReader.get_body), and the body
+        # is sent without waiting for the upstream server to agree.
+        if (name in _HOP_BY_HOP or name in connection_tokens
+                or name in ('via', 'expect')):
+            continue
+        for value in request.headers.get_all(name):
+            lines.append('{}: {}'.format(name, value))
+    lines.append('Via: {}'.format(', '.join(
+        request.headers.get_all('Via') + [_VIA]
+    )))
+
+    length = request.body.length
+    if length is None:
+        lines.append('Transfer-Encoding: chunked')
+    elif length > 0 or 'Content-Length' in request.headers:
+        lines.append('Content-Length: {}'.format(length))
+    return (CRLF.join(lines) + CRLF + CRLF).encode('latin-1')
+
+
+def _send_body(connection: socket.socket, body: RequestBody) -> None:
+    # Stream a request's body to the upstream server as it is read from the
+    # client, encoding it with the chunked transfer coding if its length
+    # isn't known.
+    if body.length is None:
+        for data in body:
+            connection.sendall(b'%x\r\n%s\r\n' % (len(data), data))
+        connection.sendall(_LAST_CHUNK)
+    else:
+        for data in body:
+            connection.sendall(data)
+
+
+def _get_body(
+        reader: _Reader,
+        status_code: int,
+        headers: List[Tuple[str, str]],
+        head: bool) -> Tuple[Optional[int], Iterator[bytes]]:
+
+    # Get the length of the response's body, if it's known, and an iterator
+    # of its data (https://tools.ietf.org/html/rfc7230#section-3.3.3). The
+    # response to a HEAD request has no body, but its headers give the
+    # length that the body would have.
+    if status_code in _NO_BODY_STATUS_CODES:
+        return 0, iter(())
+    if _has_token(headers, 'transfer-encoding', 'chunked'):
+        return None, iter(()) if head else reader.read_chunked()
+    lengths = {
+        value.strip() for name, value in headers
+        if name.lower() == 'content-length'
+    }
+    if lengths:
+        if len(lengths) != 1 or not next(iter(lengths)).isdigit():
+            raise _UpstreamError()
+        length = int(lengths.pop())
+        return length, iter(()) if head else reader.read_length(length)
+    return None, iter(()) if head else reader.read_to_end()
+
+
+def _get_end_to_end_headers(
+        headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+
+    connection_tokens = _get_tokens(
+        value for name, value in headers if name.lower() == 'connection'
+    )
+    forwarded = [
+        (name, value) for name, value in headers
+        if name.lower() not in _HOP_BY_HOP
+        and name.lower() not in connection_tokens
+        and name.lower() != 'via'
+    ]
+    vias = [value for name, value in headers if name.lower() == 'via']
+    forwarded.append(('Via', ', '.join(vias + [_VIA])))
+    return forwarded
+
+
+def _has_token(
+        headers: List[Tuple[str, str]],
+        name: str,
+        token: str) -> bool:
+
+    return token in _get_tokens(
+        value for header_name, value in headers
+        if header_name.lower() == name
+    )
+
+
+def _get_tokens(values: Iterable[str]) -> List[str]:
+    # Split comma-separated header values into lowercase tokens.
+    return [
+        token.strip().lower()
+        for value in values for token in value.split(',')
+        if token.strip()
+    ]
@@ -0,0 +1,117 @@
+"""Tools for responding to range requests.
+
+A client that wants only part of a resource, e.g. to seek within a media file
+or to resume an interrupted download, can ask for one or more ranges of bytes
+with the Range header. The server responds with 206 Partial Content and only
+those bytes.
+
+sources:
+- https://tools.ietf.org/html/rfc7233
+- https://developer.mozilla.org/en-US/docs/Web/HTTP/Range_requests
+"""
+
+
+from typing import BinaryIO, List, Optional, Sequence, Tuple
+
+from .responses import FileResponse, MultipartFileResponse, Response
+
+
+# Requests for more ranges than this are treated as requests for the whole
+# resource. Many small ranges cost far more to send than the bytes they
+# contain, and can be used to make the server do a lot of work
+# (https://tools.ietf.org/html/rfc7233#section-6.1).
+MAX_RANGES = 32
+
+_BYTES_UNIT = 'bytes'
+
+
+def parse_range(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse the value of a Range header, given the size of the resource, into
+    a list of (offset, count) pairs.
+
+    Return None if the header should be ignored, i.e. if it is invalid, uses
+    a unit other than bytes, or has too many ranges. Return an empty list if
+    none of the ranges are satisfiable.
+    """
+
+    # https://tools.ietf.org/html/rfc7233#section-2.1
+    unit, equals, ranges = value.partition('=')
+    if equals == '' or unit.strip().lower() != _BYTES_UNIT:
+        return None
+
+    specs = [spec.strip() for spec in ranges.split(',')]
+    specs = [spec for spec in specs if spec != '']
+    if specs == [] or len(specs) > MAX_RANGES:
+        return None
+
+    parsed = []
+    for spec in specs:
+        first, dash, last = spec.partition('-')
+        if dash == '' or not _is_digits(first, last):
+            return None
+
+        if first == '':
+            # A suffix range: the last so many bytes.
+            if last == '':
+                return None
+            suffix_length = int(last)
+            if suffix_length > 0 and size > 0:
+                offset = max(size - suffix_length, 0)
+                parsed.append((offset, size - offset))
+            continue
+
+        offset = int(first)
+        if last == '':
+            end = size
+        else:
+            end = int(last) + 1
+            if end <= offset:
+                return None
+        if offset < size:
+            parsed.append((offset, min(end, size) - offset))
+
+    return parsed
+
+
+def get_range_response(
+        content_type: Tuple[str, str],
+        file: BinaryIO,
+        size: int,
+        ranges: Sequence[Tuple[int, int]],
+        headers: Sequence[Tuple[str, str]] = ()) -> Response:
+    """Get a response containing the given ranges (see parse_range) of an open
+    file of the given size.
+
+    The given headers are included in a 206 response. If there are no ranges,
+    the file is closed and the response is 416 Requested Range Not
+    Satisfiable.
+    """
+
+    if len(ranges) == 0:
+        # https://tools.ietf.org/html/rfc7233#section-4.4
+        file.close()
+        # The empty body is explicit, so the response has a Content-Length
+        # and the connection can be reused.
+        return Response(416, None, b'', [
+            ('Content-Range', '{} */{}'.format(_BYTES_UNIT, size))
+        ])
+
+    if len(ranges) == 1:
+        # https://tools.ietf.org/html/rfc7233#section-4.2
+        offset, count = ranges[0]
+        return FileResponse(
+            206, content_type, file, offset, count, tuple(headers) + ((
+                'Content-Range',
+                '{} {}-{}/{}'.format(
+                    _BYTES_UNIT, offset, offset + count - 1, size
+                )
+            ),)
+        )
+
+    return MultipartFileResponse(content_type, file, ranges, size, headers)
+
+
+def _is_digits(*values: str) -> bool:
+    # Unlike int, don't accept signs, whitespace, or underscores.
+    return all(value == '' or (value.isdigit() and value.isascii())
+               for value in values)
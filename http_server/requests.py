@@ -11,33 +11,153 @@ Conventions:
 - Uppercase identifiers refer to terminals defined as global constants.
 - Terminals may also be described using natural language.
 
-<request>       = <request-line> {any char}
+<request>       = <request-line> {<header>} {any char}
 <request-line>  = <method> ' ' <uri> ' ' <version> CRLF
-<method>        = GET_METHOD
-<uri>           = <uri-part> {<uri-part>}
+<method>        = any of METHODS
+<uri>           = <uri-part> {<uri-part>} ['?' <query>]
 <uri-part>      = '/' {'/'} <uri-part-body>
-<uri-part-body> = {any non-'/' char in range 0x21-0x7E}
+<uri-part-body> = {any non-'/', non-'?' char in range 0x21-0x7E}
+<query>         = {any char in range 0x21-0x7E}
 <version>       = HTTP_VERSION
+<header>        = <field-name> ':' <field-value> CRLF
+<field-name>    = {any non-':' char}
+<field-value>   = {any char} {CRLF (' ' | '\t') {any char}}
+
+Headers are parsed lazily (see Headers), so a malformed header does not make
+the request invalid; it is simply ignored. The message body, if any, is not
+part of the input to parse; run_server reads it from the connection as the
+handler consumes it (see http_server.bodies).
 """
 
 
-from typing import List  # noqa: F401
-from typing import Optional, Tuple
+import re
+from typing import Dict, Iterator, List, Optional, Tuple, Union, overload
 
 from attr import attrs, attrib
 
-from .tokens import GET_METHOD, HTTP_VERSION, CRLF
+from .bodies import EMPTY_BODY
+from .bodies import RequestBody  # noqa: F401
+from .tokens import METHODS, HTTP_VERSION, CRLF
 
 
 # TODO:
-# - Allow other methods (e.g. POST) and HTTP versions. Currently, any request
-#   that does not use GET and HTTP/1.1 is treated as a bad request.
-# - Parse the Accept request-header so that handlers can set the value of the
-#   response's Content-Type entity-header appropriately.
+# - Allow other HTTP versions. Currently, any request that does not use
+#   HTTP/1.1 is rejected (see check_request_line).
+# - Interpret the Accept request-header (available from Request.headers) so
+#   that handlers can set the value of the response's Content-Type
+#   entity-header appropriately.
 #   - https://tools.ietf.org/html/rfc2616#section-14.1
 #   - https://tools.ietf.org/html/rfc2616#section-14.17
 
 
+# Maps each lowercase field name to the start and end offsets of its values.
+_Index = Dict[bytes, List[Tuple[int, int]]]
+
+
+class Headers:
+    """The headers of a request, as a case-insensitive multimap from field
+    names to field values.
+
+    Headers are not parsed until they are first accessed. Even then, only the
+    offsets of each header within the request are recorded; a field value is
+    decoded only when it is looked up. Requests whose handlers never look at
+    the headers therefore cost almost nothing extra to parse.
+    """
+
+    def __init__(self, inpt: bytes = b'', start: int = 0) -> None:
+        # The headers are the lines of inpt that begin at index start and end
+        # at the first empty line (or the end of inpt).
+        self._inpt = inpt
+        self._start = start
+        self._index = None  # type: Optional[_Index]
+
+    @overload
+    def get(self, name: str) -> Optional[str]:
+        ...
+
+    @overload
+    def get(self, name: str, default: str) -> str:
+        ...
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """Get the value of the named header, or default if there is no such
+        header.
+
+        If the header occurs multiple times, its values are combined into a
+        single comma-separated list
+        (https://tools.ietf.org/html/rfc2616#section-4.2).
+        """
+
+        values = self.get_all(name)
+        return ', '.join(values) if values != [] else default
+
+    def get_all(self, name: str) -> List[str]:
+        """Get every value of the named header, in order."""
+
+        offsets = self._get_index().get(name.lower().encode(), [])
+        return [self._decode(start, end) for start, end in offsets]
+
+    def __contains__(self, name: object) -> bool:
+        return (isinstance(name, str)
+                and name.lower().encode() in self._get_index())
+
+    def __iter__(self) -> Iterator[str]:
+        # Iterate over the (lowercase) names of the headers.
+        return (name.decode('latin-1') for name in self._get_index())
+
+    def __len__(self) -> int:
+        return len(self._get_index())
+
+    def _decode(self, start: int, end: int) -> str:
+        # Field values are ISO-8859-1
+        # (https://tools.ietf.org/html/rfc2616#section-2.2).
+        value = self._inpt[start:end]
+        if _CRLF in value:
+            # Replace each line continuation with a single space
+            # (https://tools.ietf.org/html/rfc2616#section-4.2).
+            value = _CONTINUATION.sub(b' ', value)
+        return value.decode('latin-1')
+
+    def _get_index(self) -> _Index:
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index
+
+    def _build_index(self) -> _Index:
+        # Index the headers in a single pass.
+        index = {}  # type: _Index
+        inpt = self._inpt
+        last = None  # type: Optional[List[Tuple[int, int]]]
+        line_start = self._start
+
+        while line_start < len(inpt):
+            line_end = inpt.find(_CRLF, line_start)
+            if line_end == -1:
+                line_end = len(inpt)
+            if line_end == line_start:
+                break
+
+            if inpt[line_start] in _WHITESPACE:
+                # A continuation of the previous header's value.
+                if last is not None:
+                    value_start, _ = last[-1]
+                    last[-1] = (value_start, _strip_end(inpt, line_end))
+            else:
+                colon = inpt.find(b':', line_start, line_end)
+                if colon == -1:
+                    last = None
+                else:
+                    name = inpt[line_start:colon].strip().lower()
+                    value_start = _strip_start(inpt, colon + 1, line_end)
+                    value_end = _strip_end(inpt, line_end, value_start)
+                    last = index.setdefault(name, [])
+                    last.append((value_start, value_end))
+
+            line_start = line_end + len(_CRLF)
+
+        return index
+
+
 @attrs(frozen=True)
 class Request:
     """A parsed request."""
@@ -45,105 +165,169 @@ class Request:
     method = attrib()  # type: str
     uri = attrib()  # type: List[str]
     version = attrib()  # type: str
-
-
-# TODO: refactor to not use global _pos
-
-_pos = 0
-
-
-def parse(inpt: str) -> Optional[Request]:
-    """Parse a request."""
-
-    global _pos
-    _pos = 0
-
-    request_line = _parse_request_line(inpt)
-    if request_line is None:
-        return None
-
-    return Request(*request_line)
-
-
-def _parse_request_line(inpt: str) -> Optional[Tuple[str, List[str], str]]:
-    global _pos
-
-    method = _parse_method(inpt)
-    if method is None:
-        return None
-
-    if _pos == len(inpt) or inpt[_pos] != ' ':
-        return None
-    _pos += 1
-
-    uri = _parse_uri(inpt)
-    if uri is None:
-        return None
-
-    if _pos == len(inpt) or inpt[_pos] != ' ':
-        return None
-    _pos += 1
-
-    version = _parse_version(inpt)
-    if version is None:
-        return None
-
-    if not inpt[_pos:].startswith(CRLF):
-        return None
-    _pos += len(CRLF)
-
-    return method, uri, version
-
-
-def _parse_method(inpt: str) -> Optional[str]:
-    global _pos
-
-    if not inpt[_pos:].startswith(GET_METHOD):
-        return None
-
-    _pos += len(GET_METHOD)
-    return GET_METHOD
-
-
-def _parse_uri(inpt: str) -> Optional[List[str]]:
-    parts = []
-
-    while _pos != len(inpt) and inpt[_pos] == '/':
-        uri_part = _parse_uri_part(inpt)
-        parts.append(uri_part)
-
-    return parts if parts != [] else None
-
-
-def _parse_uri_part(inpt: str) -> str:
-    global _pos
-    assert inpt[_pos] == '/'
-
-    while _pos != len(inpt) and inpt[_pos] == '/':
-        _pos += 1
-
-    return _parse_uri_part_body(inpt)
-
-
-def _parse_uri_part_body(inpt: str) -> str:
-    global _pos
-    if _pos != len(inpt):
-        assert inpt[_pos] != '/'
-
-    part_body = ''
-    while (_pos != len(inpt)
-           and inpt[_pos] != '/' and 0x21 <= ord(inpt[_pos]) <= 0x7E):
-        part_body += inpt[_pos]
-        _pos += 1
-
-    return part_body
-
-
-def _parse_version(inpt: str) -> Optional[str]:
-    global _pos
-
-    if not inpt[_pos:].startswith(HTTP_VERSION):
+    headers = attrib(
+        default=Headers(), eq=False, repr=False
+    )  # type: Headers
+
+    # The query component of the URI, without the '?' that begins it
+    # (https://tools.ietf.org/html/rfc3986#section-3.4). Use
+    # urllib.parse.parse_qs to get its parameters.
+    query = attrib(default='')  # type: str
+
+    # The message body, read from the connection as it is consumed (see
+    # http_server.bodies).
+    body = attrib(
+        default=EMPTY_BODY, eq=False, repr=False
+    )  # type: RequestBody
+
+
+# Matches <request-line>. Since '/' is itself in the range 0x21-0x7E, <uri> is
+# simply a '/' followed by any number of characters in that range; the
+# <query> and <uri-part>s are separated afterwards by splitting on '?' and '/'.
+# The methods are tried longest first, so that none is matched as the prefix
+# of another.
+#
+# The regular expression is compiled once and is matched directly against the
+# bytes received from the client, so parsing a request involves no decoding and
+# no state outside of the call to parse, which makes it safe to parse requests
+# in multiple threads at once.
+_REQUEST_LINE = re.compile(
+    b'('
+    + b'|'.join(
+        re.escape(method.encode())
+        for method in sorted(METHODS, key=len, reverse=True)
+    )
+    + b') (/[\x21-\x7E]*) '
+    + re.escape(HTTP_VERSION.encode())
+    + re.escape(CRLF.encode())
+)
+
+# Matches any syntactically valid request line, whatever its method and
+# version, so that a request that parse rejects can be told apart from one
+# that is simply malformed. A method is a token, and a version is 'HTTP/'
+# followed by a major and a minor version number.
+#
+# sources:
+# - https://tools.ietf.org/html/rfc7230#section-3.1.1
+# - https://tools.ietf.org/html/rfc7230#section-3.2.6
+# - https://tools.ietf.org/html/rfc7230#section-2.6
+_ANY_REQUEST_LINE = re.compile(
+    rb"([!#$%&'*+\-.^_`|~0-9A-Za-z]+) /[\x21-\x7E]* (HTTP/[0-9]\.[0-9])"
+    + re.escape(CRLF.encode())
+)
+
+# Matches the beginning of a request line that hasn't been completely
+# received yet, as long as it could still turn out to be valid as far as a
+# cheap check can tell: it must begin with a method and contain only
+# printable ASCII characters. Most garbage (e.g. a TLS handshake sent to an
+# HTTP port) fails this check at its first byte.
+_REQUEST_LINE_PREFIX = re.compile(
+    rb"[!#$%&'*+\-.^_`|~0-9A-Za-z][\x20-\x7E]*\r?"
+)
+
+# Maps each method, as received, to its (interned) string, so that parsing a
+# request doesn't decode its method.
+_METHODS = {method.encode(): method for method in METHODS}
+
+_HTTP_VERSION = HTTP_VERSION.encode()
+
+_SLASH = b'/'
+
+_QUESTION_MARK = b'?'
+
+_CRLF = CRLF.encode()
+
+# Byte values of the whitespace characters that may begin a header line
+# continuation or surround a field value.
+_WHITESPACE = b' \t'
+
+_CONTINUATION = re.compile(b'\r\n[ \t]+')
+
+
+def parse(inpt: Union[bytes, memoryview, str]) -> Optional[Request]:
+    """Parse a request, given as a bytes-like object (e.g. a memoryview of a
+    connection's buffer) or a string."""
+
+    if isinstance(inpt, str):
+        inpt = inpt.encode()
+    elif not isinstance(inpt, bytes):
+        inpt = bytes(inpt)
+
+    match = _REQUEST_LINE.match(inpt)
+    if match is None:
         return None
 
-    _pos += len(HTTP_VERSION)
-    return HTTP_VERSION
+    uri, _, query = match.group(2).partition(_QUESTION_MARK)
+    return Request(
+        _METHODS[match.group(1)],
+        _parse_uri(uri),
+        HTTP_VERSION,
+        Headers(inpt, match.end()),
+        query.decode('ascii')
+    )
+
+
+def check_request_line(
+        inpt: Union[bytes, bytearray],
+        start: int = 0,
+        end: Optional[int] = None) -> Optional[int]:
+    """Check the request line of a request, which begins at index start of
+    inpt, without decoding or copying anything. Searching stops at index end,
+    if given, so the request line can be checked within a larger buffer.
+
+    Return the status code of the error response to send if the request
+    can't be handled: 400 (Bad Request) if the request line is malformed, 505
+    (HTTP Version Not Supported) if the version isn't HTTP_VERSION, or 501
+    (Not Implemented) if the method isn't one of METHODS. Otherwise, return
+    None, in which case parse accepts the request line.
+
+    sources:
+    - https://tools.ietf.org/html/rfc2616#section-10.4.1
+    - https://tools.ietf.org/html/rfc2616#section-10.5.2
+    - https://tools.ietf.org/html/rfc2616#section-10.5.6
+    """
+
+    match = _ANY_REQUEST_LINE.match(
+        inpt, start, len(inpt) if end is None else end
+    )
+    if match is None:
+        return 400
+    if match.group(2) != _HTTP_VERSION:
+        return 505
+    if match.group(1) not in _METHODS:
+        return 501
+    return None
+
+
+def is_request_line_prefix(
+        inpt: Union[bytes, bytearray],
+        start: int,
+        end: int) -> bool:
+    """Check whether inpt[start:end], the beginning of a request line that
+    hasn't been completely received, could still be the beginning of a valid
+    one. A request that fails this check can be rejected with 400 (Bad
+    Request) without waiting for the rest of it."""
+
+    return _REQUEST_LINE_PREFIX.fullmatch(inpt, start, end) is not None
+
+
+def _parse_uri(uri: bytes) -> List[str]:
+    # Each <uri-part> begins with one or more '/', so empty strings between
+    # consecutive '/' are discarded. A trailing '/' begins a final <uri-part>
+    # with an empty <uri-part-body>.
+    parts = [part.decode('ascii') for part in uri.split(_SLASH) if part]
+    if uri.endswith(_SLASH):
+        parts.append('')
+    return parts
+
+
+def _strip_start(inpt: bytes, start: int, end: int) -> int:
+    while start < end and inpt[start] in _WHITESPACE:
+        start += 1
+    return start
+
+
+def _strip_end(inpt: bytes, end: int, start: int = 0) -> int:
+    while end > start and inpt[end - 1] in _WHITESPACE:
+        end -= 1
+    return end
@@ -0,0 +1,128 @@
+"""Tools for caching the responses of pure handler functions."""
+
+
+import time
+from typing import Callable, Hashable, Optional
+
+from attr import attrs, attrib
+
+from .lru import LRUCache
+from .requests import Request
+from .responses import FrozenResponse, Response
+from .tokens import GET_METHOD, HEAD_METHOD
+
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+# https://tools.ietf.org/html/rfc7231#section-4.2.3
+_CACHED_METHODS = (GET_METHOD, HEAD_METHOD)
+
+
+def get_request_key(request: Request) -> Hashable:
+    """Get a key that identifies the requested resource: the method, URI and
+    query. A Request isn't hashable itself, since its URI is a list.
+
+    HEAD requests get the same key as GET requests, since the response to
+    HEAD is the response to GET without the body, which the server omits.
+    """
+
+    method = GET_METHOD if request.method == HEAD_METHOD else request.method
+    return method, tuple(request.uri), request.query
+
+
+@attrs(frozen=True)
+class _Entry:
+    response = attrib()  # type: Response
+
+    # The length of the serialized response.
+    size = attrib()  # type: int
+
+    # When the entry expires (see time.monotonic), or None if it doesn't.
+    expires = attrib()  # type: Optional[float]
+
+
+class ResponseCache(LRUCache[Hashable, _Entry]):
+    """An in-memory cache of responses, for handler functions whose responses
+    depend only on the request's key (see create_handler).
+
+    By default, the key is the request's method, URI and query (see
+    get_request_key), so the cache suits a handler that ignores headers. A
+    handler whose response depends on a header (e.g. compression, which
+    depends on Accept-Encoding) needs a get_key function that includes it.
+    get_key may return None for a request that mustn't be cached.
+
+    Responses are cached frozen (see Response.freeze), so a cached response
+    is sent without calling the handler function or serializing anything.
+    Only responses to GET and HEAD requests whose message bodies are held in
+    memory are cached, and never responses with 5xx status codes, which may
+    be caused by a temporary failure. Other methods (e.g. POST) are meant to
+    have side effects, so their requests always reach the handler function.
+
+    A response is cached for ttl seconds, or until it is evicted if ttl is
+    None. When more than max_entries responses or max_size bytes of
+    serialized responses are cached, the least recently used are evicted.
+    Two threads that miss the same key at once both call the handler
+    function.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = DEFAULT_MAX_ENTRIES,
+            max_size: int = DEFAULT_MAX_SIZE,
+            ttl: Optional[float] = None,
+            get_key: Callable[[Request], Optional[Hashable]] = get_request_key) -> None:  # noqa: E501
+
+        super().__init__(_get_size, max_size, max_entries)
+        self._ttl = ttl
+        self._get_key = get_key
+        self.expirations = 0
+
+    @property
+    def size(self) -> int:
+        """The total length in bytes of the cached responses."""
+        return self._size
+
+    def get(
+            self,
+            request: Request,
+            handler_func: Callable[[Request], Response]) -> Response:
+        """Get the cached response to the request, or call handler_func to
+        get it and cache it if it may be cached."""
+
+        key = (
+            self._get_key(request) if request.method in _CACHED_METHODS
+            else None
+        )
+        if key is None:
+            return handler_func(request)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires is None or now < entry.expires:
+                    self._hit(key)
+                    return entry.response
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+
+        response = handler_func(request)
+        if type(response) not in (Response, FrozenResponse) or (
+                response.status_code >= 500):
+            return response
+
+        response = response.freeze()
+        entry = _Entry(
+            response,
+            len(response.get_head()) + (response.body_length or 0),
+            None if self._ttl is None else now + self._ttl
+        )
+        with self._lock:
+            self._put(key, entry)
+        return response
+
+
+def _get_size(entry: _Entry) -> int:
+    return entry.size
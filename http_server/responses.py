@@ -1,29 +1,98 @@
 """Tools for constructing responses."""
 
 
-from typing import Any, Union
-from typing import Optional, Tuple  # noqa: F401
+import os
+import secrets
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional
+from typing import Sequence, Tuple, Union
+from typing import Dict  # noqa: F401
 
 from .media_types import MEDIA_TYPES
 from .tokens import HTTP_VERSION, CRLF
 
 
+# A segment of a FileResponse's message body (see FileResponse.get_segments).
+Segment = Union[bytes, Tuple[int, int]]
+
+
 class Response:
-    """A response from the server."""
+    """A response from the server.
+
+    Headers other than Content-Type, Content-Length, and Connection (which the
+    response generates itself) may be given as a sequence of (field name,
+    field value) pairs.
+    """
 
     # https://tools.ietf.org/html/rfc2616#section-6.1.1
+    #
+    # Handlers only need a few of these, but a proxy (see http_server.proxy)
+    # may relay any of them from an upstream server.
     _code_phrases = {
+        100: 'Continue',
+        101: 'Switching Protocols',
         200: 'OK',
+        201: 'Created',
+        202: 'Accepted',
+        203: 'Non-Authoritative Information',
+        204: 'No Content',
+        205: 'Reset Content',
+        206: 'Partial Content',
+        300: 'Multiple Choices',
+        301: 'Moved Permanently',
+        302: 'Found',
+        303: 'See Other',
+        304: 'Not Modified',
+        305: 'Use Proxy',
+        307: 'Temporary Redirect',
+
+        # https://tools.ietf.org/html/rfc7538#section-3
+        308: 'Permanent Redirect',
+
         400: 'Bad Request',
+        401: 'Unauthorized',
+        402: 'Payment Required',
+        403: 'Forbidden',
         404: 'Not Found',
-        500: 'Internal Server Error'
+        405: 'Method Not Allowed',
+        406: 'Not Acceptable',
+        407: 'Proxy Authentication Required',
+        408: 'Request Timeout',
+        409: 'Conflict',
+        410: 'Gone',
+        411: 'Length Required',
+        412: 'Precondition Failed',
+        413: 'Request Entity Too Large',
+        414: 'Request-URI Too Long',
+        415: 'Unsupported Media Type',
+        416: 'Requested Range Not Satisfiable',
+        417: 'Expectation Failed',
+
+        # https://tools.ietf.org/html/rfc6585
+        428: 'Precondition Required',
+        429: 'Too Many Requests',
+        431: 'Request Header Fields Too Large',
+
+        500: 'Internal Server Error',
+        501: 'Not Implemented',
+        502: 'Bad Gateway',
+        503: 'Service Unavailable',
+        504: 'Gateway Timeout',
+        505: 'HTTP Version Not Supported',
+
+        # https://tools.ietf.org/html/rfc6585#section-6
+        511: 'Network Authentication Required'
     }
 
+    # Serialized status lines and Content-Type headers (see
+    # Response._get_head_prefix).
+    _head_prefixes = {}  # type: Dict[Tuple[int, Optional[Tuple[str, str]]], bytes]  # noqa: E501
+
     def __init__(
             self,
             status_code: int,
             content_type: Tuple[str, str] = None,
-            message_body: Union[bytes, str] = None) -> None:
+            message_body: Union[bytes, str] = None,
+            headers: Sequence[Tuple[str, str]] = ()) -> None:
 
         if status_code not in self._code_phrases:
             raise ValueError()
@@ -38,6 +107,7 @@ class Response:
             message_body.encode() if isinstance(message_body, str)
             else message_body
         )  # type: Optional[bytes]
+        self._headers = tuple(headers)
 
     def __eq__(self, other: Any) -> bool:
         if not isinstance(other, Response):
@@ -47,19 +117,111 @@ class Response:
             self._status_code == other._status_code
             and self._content_type == other._content_type
             and self._message_body == other._message_body
+            and self._headers == other._headers
         )
 
-    def get_bytes(self) -> bytes:
-        """Convert the response to bytes."""
+    @property
+    def status_code(self) -> int:
+        """The response's status code."""
+        return self._status_code
+
+    @property
+    def content_type(self) -> Optional[Tuple[str, str]]:
+        """The response's content type."""
+        return self._content_type
+
+    @property
+    def message_body(self) -> Optional[bytes]:
+        """The response's message body, if it is held in memory."""
+        return self._message_body
+
+    @property
+    def headers(self) -> Tuple[Tuple[str, str], ...]:
+        """The headers given when the response was constructed."""
+        return self._headers
+
+    @property
+    def body_length(self) -> Optional[int]:
+        """The length of the response's message body, or None if it has no
+        message body or the length isn't known in advance."""
+        return self._get_body_length()
+
+    def get_bytes(self, keep_alive: Optional[bool] = None) -> bytes:
+        """Convert the response to bytes.
+
+        If keep_alive is given, include a Connection header indicating whether
+        the server will keep the connection open after sending the response.
+        """
+
+        return b''.join(self._get_buffers(keep_alive))
+
+    def get_buffers(self, keep_alive: Optional[bool] = None) -> List[bytes]:
+        """Convert the response to a list of buffers that, concatenated, are
+        the bytes of the response.
+
+        Unlike get_bytes, this does not copy the message body, so the buffers
+        can be sent as they are using socket.socket.sendmsg.
+        """
+
+        return self._get_buffers(keep_alive)
+
+    def get_head(self, keep_alive: Optional[bool] = None) -> bytes:
+        """Convert the response's status line and headers, including the empty
+        line that ends them, to bytes."""
 
         # https://tools.ietf.org/html/rfc2616#section-6
+        content_length = self._get_content_length()
+        if (keep_alive and content_length == b''
+                and self._may_have_body()):
+            # Without a length, the client of a persistent connection would
+            # have to wait for the connection to close to know that the body
+            # is empty (https://tools.ietf.org/html/rfc7230#section-3.3.3).
+            content_length = _EMPTY_CONTENT_LENGTH
         return (
-            self._get_status_line().encode()
-            + self._get_content_type().encode()
-            + self._get_content_length().encode()
-            + self._get_message_body()
+            self._get_head_prefix()
+            + self._get_headers()
+            + content_length
+            + self._get_connection(keep_alive)
+            + _CRLF
         )
 
+    def close(self) -> None:
+        """Release any resources held by the response. Called once the
+        response has been sent."""
+
+    def _get_buffers(self, keep_alive: Optional[bool]) -> List[bytes]:
+        head = self.get_head(keep_alive)
+        if self._message_body:
+            return [head, self._message_body]
+        return [head]
+
+    def freeze(self) -> 'Response':
+        """Return an equivalent response that is serialized only once.
+
+        A handler can return the same frozen response to every request, e.g.
+        for a constant page, without paying for serialization each time.
+        """
+
+        return FrozenResponse(
+            self._status_code,
+            self._content_type,
+            self._message_body,
+            self._headers
+        )
+
+    def _get_head_prefix(self) -> bytes:
+        # The status line and Content-Type header depend only on the status
+        # code and content type, of which there are few combinations, so each
+        # combination is encoded once and then reused.
+        key = (self._status_code, self._content_type)
+        prefix = self._head_prefixes.get(key)
+        if prefix is None:
+            prefix = (
+                self._get_status_line() + self._get_content_type()
+            ).encode()
+            self._head_prefixes[key] = prefix
+        return prefix
+
     def _get_status_line(self) -> str:
         # https://tools.ietf.org/html/rfc2616#section-6.1
         return '{} {} {}{}'.format(
@@ -79,13 +241,331 @@ class Response:
         else:
             return ''
 
-    def _get_content_length(self) -> str:
+    def _get_headers(self) -> bytes:
+        # https://tools.ietf.org/html/rfc2616#section-4.2
+        if self._headers == ():
+            return b''
+        return ''.join(
+            '{}: {}{}'.format(name, value, CRLF)
+            for name, value in self._headers
+        ).encode('latin-1')
+
+    def _get_content_length(self) -> bytes:
         # https://tools.ietf.org/html/rfc2616#section-14.13
+        body_length = self._get_body_length()
+        if body_length is not None:
+            return b'Content-Length: %d\r\n' % body_length
+        else:
+            return b''
+
+    def _get_body_length(self) -> Optional[int]:
         if self._message_body is not None:
-            return 'Content-Length: {}{}'.format(len(self._message_body), CRLF)
+            return len(self._message_body)
         else:
-            return ''
+            return None
+
+    def _may_have_body(self) -> bool:
+        # Responses with these status codes never have a message body
+        # (https://tools.ietf.org/html/rfc7230#section-3.3).
+        return self._status_code >= 200 and self._status_code not in (204, 304)
+
+    @staticmethod
+    def _get_connection(keep_alive: Optional[bool]) -> bytes:
+        # https://tools.ietf.org/html/rfc2616#section-14.10
+        # https://tools.ietf.org/html/rfc2616#section-8.1.2.1
+        if keep_alive is None:
+            return b''
+        return _KEEP_ALIVE if keep_alive else _CLOSE
+
+
+class FrozenResponse(Response):
+    """A response that is serialized only once (see Response.freeze).
+
+    The head is serialized up front for each possible Connection header, and
+    get_buffers pairs it with the message body, so sending a frozen response
+    involves no formatting or copying at all.
+    """
+
+    def __init__(
+            self,
+            status_code: int,
+            content_type: Tuple[str, str] = None,
+            message_body: Union[bytes, str] = None,
+            headers: Sequence[Tuple[str, str]] = ()) -> None:
+
+        super().__init__(status_code, content_type, message_body, headers)
+        self._heads = {
+            keep_alive: Response.get_head(self, keep_alive)
+            for keep_alive in (None, True, False)
+        }
+        self._serialized = {}  # type: Dict[Optional[bool], bytes]
+
+    def get_head(self, keep_alive: Optional[bool] = None) -> bytes:
+        return self._heads[keep_alive]
+
+    def get_bytes(self, keep_alive: Optional[bool] = None) -> bytes:
+        serialized = self._serialized.get(keep_alive)
+        if serialized is None:
+            serialized = super().get_bytes(keep_alive)
+            self._serialized[keep_alive] = serialized
+        return serialized
+
+    def freeze(self) -> Response:
+        return self
+
+
+class FileResponse(Response):
+    """A response whose message body is read from an open file.
+
+    The body is the given number of bytes of the file starting at the given
+    offset, or the rest of the file if no count is given. run_server sends the
+    body using socket.socket.sendfile, which copies it from the file to the
+    socket within the kernel (man 2 sendfile), so the body is never read into
+    memory. The response closes the file once it has been sent.
+    """
+
+    def __init__(
+            self,
+            status_code: int,
+            content_type: Optional[Tuple[str, str]],
+            file: BinaryIO,
+            offset: int = 0,
+            count: Optional[int] = None,
+            headers: Sequence[Tuple[str, str]] = ()) -> None:
+
+        super().__init__(status_code, content_type, headers=headers)
+        if count is None:
+            count = os.fstat(file.fileno()).st_size - offset
+        self.file = file
+        self.offset = offset
+        self.count = count
+
+    def __eq__(self, other: Any) -> bool:
+        return super().__eq__(other) and (
+            isinstance(other, FileResponse)
+            and self.file is other.file
+            and self.get_segments() == other.get_segments()
+        )
+
+    def get_segments(self) -> List[Segment]:
+        """Get the message body as a list of segments, each of which is either
+        bytes or the (offset, count) of a range of the file.
+
+        run_server sends bytes segments as they are and file ranges using
+        socket.socket.sendfile.
+        """
+
+        return [(self.offset, self.count)]
+
+    def close(self) -> None:
+        self.file.close()
+
+    def freeze(self) -> Response:
+        return Response(
+            self._status_code,
+            self._content_type,
+            self._read_body(),
+            self._headers
+        ).freeze()
+
+    def _get_body_length(self) -> int:
+        return sum(
+            len(segment) if isinstance(segment, bytes) else segment[1]
+            for segment in self.get_segments()
+        )
+
+    def _get_buffers(self, keep_alive: Optional[bool]) -> List[bytes]:
+        # Used only if the response is converted to bytes rather than being
+        # sent by run_server.
+        return [self.get_head(keep_alive), self._read_body()]
+
+    def _read_body(self) -> bytes:
+        body = []
+        for segment in self.get_segments():
+            if isinstance(segment, bytes):
+                body.append(segment)
+            else:
+                offset, count = segment
+                self.file.seek(offset)
+                body.append(self.file.read(count))
+        return b''.join(body)
+
+
+class MultipartFileResponse(FileResponse):
+    """A 206 (Partial Content) response whose message body is multiple ranges
+    of an open file, each given as an (offset, count) pair.
+
+    The body is a multipart/byteranges entity in which each part has its own
+    Content-Type and Content-Range headers, and is sent like that of a
+    FileResponse, so the ranges are never read into memory.
+
+    sources:
+    - https://tools.ietf.org/html/rfc7233#section-4.1
+    - https://tools.ietf.org/html/rfc7233#appendix-A
+    - https://tools.ietf.org/html/rfc2046#section-5.1.1
+    """
+
+    def __init__(
+            self,
+            content_type: Tuple[str, str],
+            file: BinaryIO,
+            ranges: Sequence[Tuple[int, int]],
+            size: int,
+            headers: Sequence[Tuple[str, str]] = ()) -> None:
+
+        # The boundary must not occur within any of the parts. A long random
+        # string is all but certain not to.
+        boundary = secrets.token_hex(16)
+
+        super().__init__(206, None, file, 0, size, (
+            tuple(headers)
+            + (('Content-Type',
+                'multipart/byteranges; boundary={}'.format(boundary)),)
+        ))
+
+        self._segments = []  # type: List[Segment]
+        for offset, count in ranges:
+            self._segments.append((
+                '--{}{}'.format(boundary, CRLF)
+                + 'Content-Type: {}{}'.format('/'.join(content_type), CRLF)
+                + 'Content-Range: bytes {}-{}/{}{}'.format(
+                    offset, offset + count - 1, size, CRLF
+                )
+                + CRLF
+            ).encode())
+            self._segments.append((offset, count))
+            self._segments.append(_CRLF)
+        self._segments.append('--{}--{}'.format(boundary, CRLF).encode())
+
+    def get_segments(self) -> List[Segment]:
+        return self._segments
+
+
+class StreamingResponse(Response):
+    """A response whose message body is produced by an iterable (e.g. a
+    generator) of chunks, each of which is bytes or a string.
+
+    The length of the body isn't known in advance, so it is sent using the
+    chunked transfer coding, which marks the end of the body with an empty
+    chunk instead of giving its length in a Content-Length header. run_server
+    sends each chunk as soon as it is produced, and produces the next chunk
+    only once the previous one has been sent, so a handler can start
+    responding before it has generated the whole body, and a large body never
+    has to be held in memory.
+
+    sources:
+    - https://tools.ietf.org/html/rfc2616#section-3.6.1
+    - https://tools.ietf.org/html/rfc2616#section-4.4
+    """
+
+    def __init__(
+            self,
+            status_code: int,
+            content_type: Optional[Tuple[str, str]],
+            chunks: Iterable[Union[bytes, str]],
+            headers: Sequence[Tuple[str, str]] = ()) -> None:
+
+        super().__init__(status_code, content_type, headers=headers)
+        self.chunks = chunks
+
+    def __eq__(self, other: Any) -> bool:
+        return super().__eq__(other) and (
+            isinstance(other, StreamingResponse)
+            and self.chunks is other.chunks
+        )
+
+    def get_chunks(self) -> Iterator[List[bytes]]:
+        """Iterate over the chunks of the message body, encoded using the
+        chunked transfer coding. Each chunk is given as a list of buffers, like
+        those returned by get_buffers.
+
+        The chunks can only be iterated over once.
+        """
+
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if chunk:
+                # An empty chunk would end the body.
+                yield [b'%x\r\n' % len(chunk), chunk, _CRLF]
+        yield [_LAST_CHUNK]
+
+    def close(self) -> None:
+        # Let a generator that didn't finish clean up (see
+        # generator.close).
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+    def freeze(self) -> Response:
+        return Response(
+            self._status_code,
+            self._content_type,
+            b''.join(
+                chunk.encode() if isinstance(chunk, str) else chunk
+                for chunk in self.chunks
+            ),
+            self._headers
+        ).freeze()
+
+    def _get_content_length(self) -> bytes:
+        # Sent in place of Content-Length.
+        return _CHUNKED
+
+    def _get_buffers(self, keep_alive: Optional[bool]) -> List[bytes]:
+        # Used only if the response is converted to bytes rather than being
+        # sent by run_server.
+        buffers = [self.get_head(keep_alive)]
+        for chunk in self.get_chunks():
+            buffers.extend(chunk)
+        return buffers
+
+
+# The status codes of the errors that the server and handlers respond with
+# themselves (see get_error_response).
+ERROR_STATUS_CODES = (
+    400, 404, 405, 408, 413, 414, 431, 500, 501, 502, 503, 504, 505
+)
+
+
+def get_error_response(status_code: int) -> Response:
+    """Get the prebuilt response for one of ERROR_STATUS_CODES.
+
+    Error responses are built and serialized once, when the module is
+    imported, and shared by every request that gets them, so responding to a
+    bad request (e.g. from a scanner sending garbage) costs only a dictionary
+    lookup. They have empty message bodies, with a Content-Length of 0, so
+    that the client can tell where they end even if the connection is kept
+    open.
+    """
+
+    return _ERROR_RESPONSES[status_code]
+
+
+def _create_error_response(status_code: int) -> Response:
+    headers = ()  # type: Tuple[Tuple[str, str], ...]
+    if status_code == 405:
+        # A 405 response must list the allowed methods
+        # (https://tools.ietf.org/html/rfc2616#section-10.4.6): those that
+        # handlers accept by default (see create_handler).
+        headers = (('Allow', 'GET, HEAD'),)
+    response = FrozenResponse(status_code, None, b'', headers)
+    for keep_alive in (None, True, False):
+        response.get_bytes(keep_alive)
+    return response
+
+
+_CRLF = CRLF.encode()
+_CHUNKED = 'Transfer-Encoding: chunked{}'.format(CRLF).encode()
+
+# The empty chunk that ends a chunked body, followed by an empty trailer
+# (https://tools.ietf.org/html/rfc2616#section-3.6.1).
+_LAST_CHUNK = '0{}{}'.format(CRLF, CRLF).encode()
+_EMPTY_CONTENT_LENGTH = 'Content-Length: 0{}'.format(CRLF).encode()
+_KEEP_ALIVE = 'Connection: keep-alive{}'.format(CRLF).encode()
+_CLOSE = 'Connection: close{}'.format(CRLF).encode()
 
-    def _get_message_body(self) -> bytes:
-        return CRLF.encode() + (self._message_body
-                                if self._message_body is not None else b'')
+_ERROR_RESPONSES = {
+    status_code: _create_error_response(status_code)
+    for status_code in ERROR_STATUS_CODES
+}
@@ -1,8 +1,35 @@
 """Tools for running a TCP server."""
 
 
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import signal
 import socket
-from typing import Callable, Tuple
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Iterable, Iterator, List, Tuple
+from typing import Optional, Union, cast
+
+from attr import evolve
+
+from .bodies import EMPTY_BODY
+from .connections import ConnectionReader, Deadline, RequestError
+from .connections import DEFAULT_BODY_TIMEOUT, DEFAULT_HEADER_TIMEOUT
+from .connections import DEFAULT_MAX_HEADERS_LENGTH
+from .connections import DEFAULT_MAX_REQUEST_LINE_LENGTH, DEFAULT_MIN_RATE
+from .handlers import Handler
+from .logs import AccessLog, get_request_line, log_exception
+from .metrics import Metrics, RequestTimer
+from .metrics import BODY_TIMEOUT, HANDLER_TIMEOUT, HEADER_TIMEOUT
+from .metrics import IN_FLIGHT, QUEUE_FULL, QUEUE_TIME, WRITE_TIMEOUT
+from .prefork import is_stopping, run_prefork
+from .requests import Request, parse
+from .responses import FileResponse, Response, StreamingResponse
+from .responses import get_error_response
+from .tokens import HEAD_METHOD, CRLF
 
 
 # General sources:
@@ -13,21 +40,6 @@ from typing import Callable, Tuple
 #     >>> help(socket.socket.listen)
 
 
-# TODO: socket.socket.listen (called below) has an optional backlog parameter
-# that specifies the number of pending connections allowed before the listening
-# socket refuses new connections. I have left it unspecified (it defaults to a
-# reasonable value), but I should test how the server handles many simultaneous
-# incoming connections and consider choosing a custom value for the backlog
-# parameter. I should also consider some form of parallelism (probably
-# multithreading) to allow handling multiple requests simultaneously. The
-# server should return 503 Service Unavailable when it is temporarily
-# overloaded.
-#
-# Sources:
-# - man 2 listen
-# - https://tools.ietf.org/html/rfc2616#section-10.5.4
-
-
 DEFAULT_HOST = 'localhost'
 DEFAULT_PORT = 8080
 DEFAULT_ADDR = (DEFAULT_HOST, DEFAULT_PORT)
@@ -36,7 +48,10 @@ DEFAULT_ADDR = (DEFAULT_HOST, DEFAULT_PORT)
 # HTTP explicitly doesn't specify a minimum or maximum URI length. Various
 # sources seem to indicate that the same goes for total request length.
 #
-# TODO: Return 414 (Request-URI Too Long) if URI too long.
+# This limit applies only to handlers that are not created by create_handler,
+# which receive whatever a single call to recv returns. Requests to handlers
+# created by create_handler are read by a ConnectionReader, which enforces its
+# own limits on the lengths of the request line, headers, and message body.
 #
 # sources:
 # - https://tools.ietf.org/html/rfc2616#section-3.2.1
@@ -45,84 +60,1138 @@ DEFAULT_ADDR = (DEFAULT_HOST, DEFAULT_PORT)
 MAX_REQUEST_LENGTH = 4096
 
 
+# How long (in seconds) a persistent connection may be idle before the server
+# closes it, and how many requests the server serves over a single connection.
+DEFAULT_KEEP_ALIVE_TIMEOUT = 5.0
+DEFAULT_KEEP_ALIVE_MAX = 100
+
+# The maximum length of a request's message body.
+DEFAULT_MAX_BODY_LENGTH = 1024 * 1024
+
+# How long (in seconds) a client may take to receive a response, plus a second
+# for every DEFAULT_MIN_RATE bytes in it (see connections.Deadline).
+DEFAULT_WRITE_TIMEOUT = 10.0
+
+# Files are sent in blocks of this many bytes, so that the write timeout can
+# be checked between them (see _send_response).
+_SENDFILE_BLOCK_SIZE = 1024 * 1024
+
+# The blank line that ends a request's headers, up to which run_async_server
+# reads each request.
+_HEADERS_END = (CRLF + CRLF).encode()
+
+# Concurrency modes for run_server.
+THREAD_MODE = 'thread'
+PROCESS_MODE = 'process'
+PREFORK_MODE = 'prefork'
+
+# How long (in seconds) a stopping worker process in PREFORK_MODE may take to
+# finish serving its connections before it is killed.
+DEFAULT_GRACEFUL_TIMEOUT = 30.0
+
+# Number of accepted connections that may wait for a free worker before the
+# server starts rejecting new connections.
+DEFAULT_QUEUE_SIZE = 16
+
+# socket.socket.listen's backlog parameter is the number of connections that
+# the kernel completes (with the TCP handshake) and queues for the server to
+# accept. Once the queue is full, the kernel ignores new connection requests,
+# and clients retry after a timeout of a second or more, so a backlog that is
+# too small adds seconds of latency during bursts of connections. A large
+# backlog costs little: the connections wait in the kernel, and the server's
+# own queue (queue_size) decides which of them are rejected. Linux silently
+# caps the backlog at net.core.somaxconn (4096 since Linux 5.4).
+#
+# sources:
+# - man 2 listen
+# - https://veithen.io/2014/01/01/how-tcp-backlog-works-in-linux.html
+DEFAULT_BACKLOG = 1024
+
+# How long (in seconds) a client whose request was rejected because the server
+# is overloaded should wait before trying again.
+DEFAULT_RETRY_AFTER = 1
+
+# Sent to clients whose requests are rejected because the server is
+# overloaded. It is serialized once, so that rejecting a request costs as
+# little as possible at the moment when the server has the least time to
+# spare.
+#
+# sources:
+# - https://tools.ietf.org/html/rfc2616#section-10.5.4
+# - https://tools.ietf.org/html/rfc2616#section-14.37
+SERVICE_UNAVAILABLE = Response(
+    503, headers=[('Retry-After', str(DEFAULT_RETRY_AFTER))]
+).get_bytes(keep_alive=False)
+
+
+# A handler for run_async_server (e.g. created by create_async_handler).
+AsyncHandler = Callable[[bytes], Awaitable[bytes]]
+
+
 def run_server(
         handler: Callable[[bytes], bytes],
         address: Tuple[str, int] = DEFAULT_ADDR,
-        verbose: bool = False) -> None:
-    """Run a TCP server at the given address."""
+        verbose: bool = False,
+        workers: int = 0,
+        mode: str = THREAD_MODE,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        backlog: int = DEFAULT_BACKLOG,
+        max_queue_time: Optional[float] = None,
+        max_in_flight: Optional[int] = None,
+        retry_after: int = DEFAULT_RETRY_AFTER,
+        keep_alive_timeout: float = DEFAULT_KEEP_ALIVE_TIMEOUT,
+        keep_alive_max: int = DEFAULT_KEEP_ALIVE_MAX,
+        max_request_line_length: int = DEFAULT_MAX_REQUEST_LINE_LENGTH,
+        max_headers_length: int = DEFAULT_MAX_HEADERS_LENGTH,
+        max_body_length: int = DEFAULT_MAX_BODY_LENGTH,
+        header_timeout: Optional[float] = DEFAULT_HEADER_TIMEOUT,
+        body_timeout: Optional[float] = DEFAULT_BODY_TIMEOUT,
+        handler_timeout: Optional[float] = None,
+        write_timeout: Optional[float] = DEFAULT_WRITE_TIMEOUT,
+        min_rate: float = DEFAULT_MIN_RATE,
+        threads: int = 0,
+        graceful_timeout: float = DEFAULT_GRACEFUL_TIMEOUT,
+        metrics: Optional[Metrics] = None,
+        access_log: Optional[AccessLog] = None) -> None:
+    """Run a TCP server at the given address.
 
-    with create_tcp_socket() as listener:
+    By default, the server handles one connection at a time. If workers is
+    positive, accepted connections are instead handed off to a pool of that
+    many worker threads (mode THREAD_MODE) or worker processes (mode
+    PROCESS_MODE). At most queue_size accepted connections may wait for a free
+    worker; beyond that, the server responds with 503 Service Unavailable.
+    Connections that have not yet been accepted wait in the listening
+    socket's backlog (see DEFAULT_BACKLOG).
 
-        # Normally, calling bind fails if a socket was too recently bound to
-        # the given address. Enabling the socket.SO_REUSEADDR option for our
-        # listening socket allows us to bind it to a recently used address
-        # (e.g. for restarting the server during automated testing). bind still
-        # fails if given the address of an actively listening socket.
-        #
-        # Note that Linux systems allow address reuse only when the option was
-        # enabled during the previous bind operation and is enabled during the
-        # current bind operation (see NOTES in `man 7 socket`).
+    The server can also shed load before it runs a handler, so that the
+    requests it admits keep a stable latency during a spike rather than every
+    request slowing down together. If max_queue_time is given, a connection
+    that waited longer than max_queue_time seconds for a worker is rejected,
+    since its client has likely given up. If max_in_flight is given, a
+    request that arrives while max_in_flight requests are being handled is
+    rejected (in PROCESS_MODE and PREFORK_MODE, the limit applies to each
+    worker process). Rejected requests get a prebuilt 503 Service Unavailable
+    response that asks the client to retry after retry_after seconds.
+
+    In mode PREFORK_MODE, the server instead forks that many worker processes,
+    each of which accepts connections itself and serves them one at a time, or
+    using a pool of the given number of threads (see http_server.prefork). The
+    original process supervises the workers: it replaces workers that exit
+    unexpectedly, replaces every worker on SIGHUP, and on SIGTERM or SIGINT
+    lets the workers finish serving their connections, killing any that take
+    longer than graceful_timeout seconds.
+
+    If the handler was created by create_handler, then connections are
+    persistent: the server keeps reading requests from each connection until
+    the client asks to close it, the connection has been idle for
+    keep_alive_timeout seconds, or keep_alive_max requests have been served.
+    Requests with a request line longer than max_request_line_length, headers
+    longer than max_headers_length, or a message body longer than
+    max_body_length are rejected with 414, 431, or 413, respectively. The
+    handler reads a request's body as it consumes it (see
+    http_server.bodies), and whatever it leaves unread is discarded before
+    the next request is read. The response to a HEAD request is sent without
+    its body.
+
+    Once the first byte of a request has arrived, the rest of its request
+    line and headers must arrive within header_timeout seconds, and its
+    message body within body_timeout seconds; otherwise, the server responds
+    with 408 Request Timeout. A client that doesn't receive its response
+    within write_timeout seconds is disconnected. Each of these limits is
+    extended by a second for every min_rate bytes transferred (see
+    http_server.connections.Deadline). A timeout of None means no limit.
+
+    If handler_timeout is given, handlers run in a separate pool of threads,
+    and the server responds with 503 Service Unavailable and closes the
+    connection if a handler takes longer than handler_timeout seconds. Python
+    can't stop a running thread, so the handler keeps running in the pool,
+    but the worker that is serving the connection moves on. The pool has as
+    many threads as there are workers, so stuck handlers can't pile up
+    without limit: once every thread is stuck, further requests time out
+    without being handled.
+
+    Otherwise (if the handler was not created by create_handler), the server
+    reads a single request of up to MAX_REQUEST_LENGTH bytes from each
+    connection, within header_timeout seconds, and sends the response within
+    write_timeout seconds.
+
+    If metrics is given, the server counts connections, requests, timeouts,
+    and rejections with it and times each phase of serving requests (see
+    http_server.metrics).
+
+    If access_log is given, the server logs each request to it (see
+    http_server.logs). If verbose is true and no access_log is given,
+    requests are logged to standard output in the Common Log Format.
+    """
+
+    if mode not in (THREAD_MODE, PROCESS_MODE, PREFORK_MODE):
+        raise ValueError()
+    if mode == PREFORK_MODE and workers <= 0:
+        raise ValueError()
+
+    if access_log is None and verbose:
+        access_log = AccessLog()
+
+    handler_pool = None  # type: Optional[_HandlerPool]
+    if handler_timeout is not None:
+        # Each worker thread (or, in PROCESS_MODE, each worker process) waits
+        # for one handler at a time.
+        if mode == THREAD_MODE:
+            handler_threads = workers
+        elif mode == PREFORK_MODE:
+            handler_threads = threads
+        else:
+            handler_threads = 1
+        handler_pool = _HandlerPool(max(handler_threads, 1), handler_timeout)
+
+    admission = _Admission(
+        max_queue_time, max_in_flight, retry_after, access_log, metrics
+    )
+
+    serve = functools.partial(
+        _serve_connection,
+        handler=handler,
+        admission=admission,
+        access_log=access_log,
+        keep_alive_timeout=keep_alive_timeout,
+        keep_alive_max=keep_alive_max,
+        max_body_length=max_body_length,
+        header_timeout=header_timeout,
+        write_timeout=write_timeout,
+        min_rate=min_rate,
+        handler_pool=handler_pool,
+        metrics=metrics,
+        create_reader=functools.partial(
+            ConnectionReader,
+            max_request_line_length=max_request_line_length,
+            max_headers_length=max_headers_length,
+            header_timeout=header_timeout,
+            body_timeout=body_timeout,
+            min_rate=min_rate
+        )
+    )
+
+    if mode == PREFORK_MODE:
+        # Each worker process serves the connections it accepts the same way
+        # that run_server does with the given number of worker threads.
+        reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        run_prefork(
+            functools.partial(
+                create_listening_socket, address, reuse_port=reuse_port,
+                backlog=backlog
+            ),
+            functools.partial(
+                _run_prefork_worker,
+                serve=serve,
+                admission=admission,
+                access_log=access_log,
+                workers=threads,
+                mode=THREAD_MODE,
+                queue_size=queue_size
+            ),
+            workers,
+            graceful_timeout,
+            reuse_port,
+            verbose
+        )
+        return
+
+    try:
+        with create_listening_socket(address, backlog=backlog) as listener:
+            _serve_connections(
+                _accept_forever(listener),
+                serve,
+                admission,
+                workers,
+                mode,
+                queue_size
+            )
+    finally:
+        if access_log is not None:
+            access_log.close()
+
+
+# Serves a connected socket, given the socket, the address of the peer, and
+# when the connection was accepted (see time.monotonic).
+_Serve = Callable[[socket.socket, Tuple[str, int], float], None]
+
+# Accepted connections, as pairs of connected sockets and peer addresses.
+_Connections = Iterable[Tuple[socket.socket, Tuple[str, int]]]
+
+
+def _accept_forever(
+        listener: socket.socket) -> Iterator[Tuple[socket.socket, Any]]:
+    while True:
+
+        # Dequeue the first connection request from the listening socket's
+        # queue of pending connections. Create and return a new connected
+        # socket (not in the listening state) and the address of the peer
+        # socket (in this case, a client connecting to our server). The
+        # listening socket is unaffected.
         #
-        # socket.SOL_SOCKET specifies that we're setting an option at the level
-        # of the sockets API (as opposed to e.g. the TCP level).
+        # If the queue is empty, and the listening socket is not marked as
+        # nonblocking, then block execution until a connection is present.
         #
         # sources:
-        # - man 2 setsockopt
-        # - man 7 socket
-        # - https://docs.python.org/3/library/socket.html#example
+        # - man 2 accept
+        yield listener.accept()
+
+
+def _serve_connections(
+        connections: _Connections,
+        serve: _Serve,
+        admission: '_Admission',
+        workers: int,
+        mode: str,
+        queue_size: int) -> None:
+
+    if workers > 0:
+        _run_worker_pool(
+            connections, serve, admission, workers, mode, queue_size
+        )
+    else:
+        for connection, peer in connections:
+            serve(connection, peer, time.monotonic())
+
+
+def _run_prefork_worker(
+        connections: _Connections,
+        serve: _Serve,
+        admission: '_Admission',
+        access_log: Optional[AccessLog],
+        workers: int,
+        mode: str,
+        queue_size: int) -> None:
+    try:
+        _serve_connections(
+            connections, serve, admission, workers, mode, queue_size
+        )
+    finally:
+        # The worker process exits without running the master's cleanup, so
+        # it must write the requests it logged itself.
+        if access_log is not None:
+            access_log.close()
+
+
+def _run_worker_pool(
+        connections: _Connections,
+        serve: _Serve,
+        admission: '_Admission',
+        workers: int,
+        mode: str,
+        queue_size: int) -> None:
+
+    # Each accepted connection occupies one slot until a worker has finished
+    # serving it. There are enough slots for every worker to be busy and for
+    # queue_size connections to be waiting in the executor's queue. When no
+    # slot is free, the server is overloaded and the connection is rejected
+    # immediately rather than being queued indefinitely.
+    slots = threading.BoundedSemaphore(workers + queue_size)
+
+    if mode == PROCESS_MODE:
+        # By default, SIGTERM terminates the server immediately, which would
+        # leave the worker processes running. Exiting normally instead lets
+        # the executor shut down its workers once they finish serving their
+        # current connections.
+        signal.signal(signal.SIGTERM, _exit_on_signal)
+
+    executor = _create_executor(serve, workers, mode)
+
+    with executor:
+        for connection, peer in connections:
+            # The time is taken from the clock that time.monotonic shares
+            # with every process (CLOCK_MONOTONIC, see man 2 clock_gettime),
+            # so a worker process can tell how long the connection waited.
+            accepted = time.monotonic()
+            if not slots.acquire(blocking=False):
+                admission.reject_connection(connection, peer, QUEUE_FULL)
+                continue
+
+            if mode == THREAD_MODE:
+                future = executor.submit(serve, connection, peer, accepted)
+            else:
+                # The connected socket is pickled and sent to a worker
+                # process, which receives a duplicate of the underlying file
+                # descriptor (see multiprocessing.reduction). The duplicate is
+                # made lazily by the executor's feeder thread, so our own copy
+                # must stay open until the worker has finished with it.
+                future = executor.submit(
+                    _serve_in_process, connection, peer, accepted
+                )
+
+            future.add_done_callback(
+                functools.partial(_release_slot, slots, connection)
+            )
+
+
+def _create_executor(
+        serve: _Serve,
+        workers: int,
+        mode: str) -> concurrent.futures.Executor:
+    if mode == THREAD_MODE:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    # Forking (rather than spawning) the worker processes means that the
+    # handler does not need to be picklable, so e.g. lambdas work as handlers
+    # in both modes.
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_init_process_worker,
+        initargs=(serve,)
+    )
+
+
+def _exit_on_signal(signum: int, frame: Any) -> None:
+    sys.exit(128 + signum)
+
+
+def _release_slot(
+        slots: threading.BoundedSemaphore,
+        connection: socket.socket,
+        future: 'concurrent.futures.Future[None]') -> None:
+    connection.close()
+    slots.release()
+
+
+# Set in each worker process by _init_process_worker.
+_process_serve = None  # type: Optional[_Serve]
+
+
+def _init_process_worker(serve: _Serve) -> None:
+    global _process_serve
+    _process_serve = serve
+
+
+def _serve_in_process(
+        connection: socket.socket,
+        peer: Tuple[str, int],
+        accepted: float) -> None:
+    assert _process_serve is not None
+    _process_serve(connection, peer, accepted)
+
+
+class _Admission:
+    # Decides whether to serve connections and requests, and rejects those it
+    # doesn't (see run_server's max_queue_time and max_in_flight).
+
+    def __init__(
+            self,
+            max_queue_time: Optional[float],
+            max_in_flight: Optional[int],
+            retry_after: int,
+            access_log: Optional[AccessLog],
+            metrics: Optional[Metrics]) -> None:
+
+        self._max_queue_time = max_queue_time
+        self._in_flight = (
+            None if max_in_flight is None
+            else threading.BoundedSemaphore(max_in_flight)
+        )  # type: Optional[threading.BoundedSemaphore]
+        self._access_log = access_log
+        self._metrics = metrics
+
+        self.rejection = SERVICE_UNAVAILABLE
+        if retry_after != DEFAULT_RETRY_AFTER:
+            self.rejection = Response(
+                503, headers=[('Retry-After', str(retry_after))]
+            ).get_bytes(keep_alive=False)
+
+    def admit_connection(self, accepted: float) -> bool:
+        # Whether a connection that was accepted at the given time (see
+        # time.monotonic) has not waited too long to be served.
+        return (
+            self._max_queue_time is None
+            or time.monotonic() - accepted <= self._max_queue_time
+        )
+
+    def reject_connection(
+            self,
+            connection: socket.socket,
+            peer: Tuple[str, int],
+            reason: str) -> None:
+
+        with connection:
+            # Discard whatever part of the request has already arrived.
+            # Closing a socket with unread data causes the kernel to reset
+            # the connection (man 7 tcp), and the client might then never see
+            # our response.
+            connection.setblocking(False)
+            try:
+                connection.recv(MAX_REQUEST_LENGTH)
+            except BlockingIOError:
+                pass
+
+            # The response is small enough to fit in the socket's send
+            # buffer, so it is sent without blocking, unless the client has
+            # stopped reading, in which case it doesn't get a response.
+            try:
+                connection.send(self.rejection)
+            except BlockingIOError:
+                pass
+
+        if self._metrics is not None:
+            self._metrics.observe_rejection(reason)
+        if self._access_log is not None:
+            self._access_log.log(peer, b'', 503)
+
+    def acquire_request(self) -> bool:
+        # Whether a request may be handled now. If so, release_request must
+        # be called once it has been.
+        return self._in_flight is None or self._in_flight.acquire(False)
+
+    def release_request(self) -> None:
+        if self._in_flight is not None:
+            self._in_flight.release()
+
+
+def _serve_connection(
+        connection: socket.socket,
+        peer: Tuple[str, int],
+        accepted: float,
+        handler: Callable[[bytes], bytes],
+        admission: _Admission,
+        access_log: Optional[AccessLog],
+        keep_alive_timeout: float,
+        keep_alive_max: int,
+        max_body_length: int,
+        header_timeout: Optional[float],
+        write_timeout: Optional[float],
+        min_rate: float,
+        handler_pool: Optional['_HandlerPool'],
+        metrics: Optional[Metrics],
+        create_reader: Callable[[socket.socket], ConnectionReader]) -> None:
+
+    with connection:
+        if metrics is not None:
+            metrics.observe_connection(time.monotonic() - accepted)
+        if not admission.admit_connection(accepted):
+            admission.reject_connection(connection, peer, QUEUE_TIME)
+            return
+
+        if isinstance(handler, Handler):
+            # recv raises socket.timeout if no data arrives within the timeout
+            # (man 7 socket, SO_RCVTIMEO). The reader waits this long for
+            # each request to begin.
+            connection.settimeout(keep_alive_timeout)
+
+            # A streaming response's head and chunks are sent by separate
+            # calls. With Nagle's algorithm, each small segment would wait
+            # until the client acknowledged the previous one, which a client
+            # that is waiting for the rest of the response delays by up to
+            # 40 ms (delayed ACK). Responses are already gathered into as few
+            # sends as possible (see _send_buffers), so send each at once.
+            #
+            # sources:
+            # - man 7 tcp
+            # - https://tools.ietf.org/html/rfc896
+            # - https://tools.ietf.org/html/rfc1122#section-4.2.3.2
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            _serve_persistent_connection(
+                create_reader(connection), connection, peer, handler,
+                admission, access_log, keep_alive_max, max_body_length,
+                write_timeout, min_rate, handler_pool, metrics
+            )
+            return
+
+        # Receive up to the given number of bytes on a connected socket
+        # (man 2 recv).
+        start = time.perf_counter()
+        try:
+            Deadline(header_timeout).apply(connection)
+            request = connection.recv(MAX_REQUEST_LENGTH)
+        except socket.timeout:
+            if metrics is not None:
+                metrics.observe_timeout(HEADER_TIMEOUT)
+            return
+
+        if not admission.acquire_request():
+            _send_bytes(connection, admission.rejection, write_timeout)
+            if metrics is not None:
+                metrics.observe_rejection(IN_FLIGHT)
+            return
+        try:
+            response = handler(request)
+        finally:
+            admission.release_request()
+
+        # Send data from a connected socket. socket.socket.send, like the
+        # underlying system call (see `man 2 send`), returns the number of
+        # bytes sent, which may be less than the total if the network is
+        # busy. socket.socket.sendall repeatedly sends data until all data has
+        # been sent, or until the socket's timeout has passed in total.
+        try:
+            deadline = Deadline(write_timeout, min_rate)
+            deadline.extend(len(response))
+            deadline.apply(connection)
+            connection.sendall(response)
+        except socket.timeout:
+            if metrics is not None:
+                metrics.observe_timeout(WRITE_TIMEOUT)
+            return
+        if access_log is not None:
+            # The server doesn't know the protocol that a handler not created
+            # by create_handler speaks, so it logs only the first line of the
+            # request and the length of the response.
+            access_log.log(
+                peer, get_request_line(request), None, len(response),
+                time.perf_counter() - start
+            )
+
+
+def _serve_persistent_connection(
+        reader: ConnectionReader,
+        connection: socket.socket,
+        peer: Tuple[str, int],
+        handler: Handler,
+        admission: _Admission,
+        access_log: Optional[AccessLog],
+        keep_alive_max: int,
+        max_body_length: int,
+        write_timeout: Optional[float],
+        min_rate: float,
+        handler_pool: Optional['_HandlerPool'],
+        metrics: Optional[Metrics]) -> None:
+
+    # HTTP/1.1 connections are persistent unless either side says otherwise,
+    # which saves a TCP handshake for every request after the first. Clients
+    # may also pipeline requests, sending several of them without waiting for
+    # each response; the server must respond to them in order. The reader
+    # keeps any bytes received beyond the end of the current request, which
+    # belong to the next pipelined request.
+    #
+    # sources:
+    # - https://tools.ietf.org/html/rfc2616#section-8.1
+
+    for served in range(1, keep_alive_max + 1):
+        try:
+            request_bytes = reader.read_request()
+        except RequestError as error:
+            _send_error(connection, error.status_code, write_timeout)
+            timer = RequestTimer(reader.request_started)
+            timer.mark()
+            if metrics is not None:
+                if error.status_code == 408:
+                    metrics.observe_timeout(HEADER_TIMEOUT)
+                metrics.observe_request(timer, error.status_code)
+            if access_log is not None:
+                # The request line is logged only if it was the problem. It
+                # may be incomplete, or too long to log.
+                access_log.log(
+                    peer, error.request_line, error.status_code, None,
+                    timer.duration
+                )
+            return
+        except socket.timeout:
+            # The connection was idle for too long.
+            return
+
+        if request_bytes is None:
+            # The client closed the connection.
+            return
+
+        # Each phase of serving the request ends with a mark (see
+        # http_server.metrics). Taking the time is cheap enough to do even
+        # when nothing is measured.
+        timer = RequestTimer(reader.request_started)
+        timer.mark()
+
+        request = parse(request_bytes)
+        timer.mark()
+        status_code = None  # type: Optional[int]
+        if request is None:
+            # https://tools.ietf.org/html/rfc2616#section-10.4.1
+            status_code = 400
+        else:
+            # The body isn't read yet. The handler reads it from the
+            # connection as it consumes it (see http_server.bodies).
+            try:
+                body = reader.get_body(request.headers, max_body_length)
+            except RequestError as error:
+                status_code = error.status_code
+            else:
+                if body is not EMPTY_BODY:
+                    request = evolve(request, body=body)
+
+        response = None  # type: Optional[Response]
+        if status_code is None and not admission.acquire_request():
+            # Too many requests are being handled already. Rejecting this one
+            # now is cheaper than making every request wait longer.
+            status_code = 503
+            if metrics is not None:
+                metrics.observe_rejection(IN_FLIGHT)
+        elif status_code is None:
+            assert request is not None
+            try:
+                if handler_pool is None:
+                    response = handler.handle(request)
+                else:
+                    response = handler_pool.handle(handler, request)
+                    if response is None:
+                        status_code = 503
+                        if metrics is not None:
+                            metrics.observe_timeout(HANDLER_TIMEOUT)
+            except RequestError as error:
+                # The handler failed to read the request's body.
+                status_code = error.status_code
+                if metrics is not None and status_code == 408:
+                    metrics.observe_timeout(BODY_TIMEOUT)
+            finally:
+                admission.release_request()
+            timer.mark()
+
+        if response is None:
+            assert status_code is not None
+            if status_code == 503:
+                # https://tools.ietf.org/html/rfc2616#section-10.5.4
+                _send_bytes(connection, admission.rejection, write_timeout)
+            else:
+                _send_error(connection, status_code, write_timeout)
+            if metrics is not None:
+                metrics.observe_request(timer, status_code)
+            if access_log is not None:
+                access_log.log(
+                    peer, get_request_line(request_bytes), status_code, None,
+                    timer.duration
+                )
+            return
+        assert request is not None
+
+        keep_alive = (
+            served < keep_alive_max
+            and not _requests_close(request)
+            and not is_stopping()
+        )
+        if keep_alive:
+            # Whatever the handler didn't read of the body must be read
+            # before the next request can be. If it can't be, the handler's
+            # response is still sent.
+            try:
+                keep_alive = reader.finish_body(request.body)
+            except RequestError as error:
+                keep_alive = False
+                if metrics is not None and error.status_code == 408:
+                    metrics.observe_timeout(BODY_TIMEOUT)
+
+        # https://tools.ietf.org/html/rfc7231#section-4.3.2
+        send_body = request.method != HEAD_METHOD
+        try:
+            sent = _send_response(
+                connection, response, keep_alive,
+                Deadline(write_timeout, min_rate), timer, send_body
+            )
+        except socket.timeout:
+            sent = False
+            if metrics is not None:
+                metrics.observe_timeout(WRITE_TIMEOUT)
+        if metrics is not None:
+            metrics.observe_request(
+                timer, response.status_code, metrics.get_route(request)
+            )
+        if access_log is not None:
+            access_log.log(
+                peer, get_request_line(request_bytes), response.status_code,
+                response.body_length if send_body else None, timer.duration,
+                request
+            )
+
+        if not (sent and keep_alive):
+            return
+
+
+class _HandlerPool:
+    # Runs handlers in a pool of threads, so that the thread serving a
+    # connection can stop waiting for a handler that takes longer than the
+    # timeout (see run_server's handler_timeout).
+
+    def __init__(self, threads: int, timeout: float) -> None:
+        # The pool's threads are started as they are needed, so creating it
+        # before forking worker processes is safe.
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=threads
+        )
+        self._timeout = timeout
+
+    def handle(self, handler: Handler, request: Request) -> Optional[Response]:
+        # Return the handler's response, or None if it timed out.
+        future = self._executor.submit(handler.handle, request)
+        try:
+            return future.result(self._timeout)
+        except concurrent.futures.TimeoutError:
+            # If the handler hasn't started (because the pool's threads are
+            # all busy with handlers that are stuck), it never will. Python
+            # can't stop a running thread, so otherwise the handler keeps
+            # running, and its response is closed without being sent.
+            if not future.cancel():
+                future.add_done_callback(_close_response)
+            return None
+
+
+def _close_response(future: 'concurrent.futures.Future[Response]') -> None:
+    future.result().close()
+
+
+def _send_response(
+        connection: socket.socket,
+        response: Response,
+        keep_alive: bool,
+        deadline: Optional[Deadline] = None,
+        timer: Optional[RequestTimer] = None,
+        send_body: bool = True) -> bool:
+
+    # Return whether the whole response was sent. If not, the connection must
+    # be closed. Raise socket.timeout if the deadline, if given, passes before
+    # the response has been sent. The timer, if given, is marked once the
+    # response has been serialized and again once it has been sent. If
+    # send_body is false (for a HEAD request), only the head is sent,
+    # including the Content-Length that the body would have.
+
+    if deadline is None:
+        deadline = Deadline(None)
+
+    try:
+        if not send_body:
+            head = response.get_head(keep_alive)
+            if timer is not None:
+                timer.mark()
+            _send_buffers(connection, [head], deadline)
+        elif isinstance(response, FileResponse):
+            head = response.get_head(keep_alive)
+            if timer is not None:
+                timer.mark()
+            _send_buffers(connection, [head], deadline)
+
+            for segment in response.get_segments():
+                if isinstance(segment, bytes):
+                    _send_buffers(connection, [segment], deadline)
+                else:
+                    # Copy the range from the file to the socket without
+                    # reading it into memory. socket.socket.sendfile uses
+                    # os.sendfile (see `man 2 sendfile`) and, like
+                    # socket.socket.sendall, repeats the call until everything
+                    # has been sent. It applies the socket's timeout to each
+                    # wait for the socket to become writable rather than to
+                    # the whole range, so the range is sent in blocks and the
+                    # deadline is checked before each.
+                    offset, count = segment
+                    deadline.extend(count)
+                    while count > 0:
+                        # (A count of 0 would send the rest of the file.)
+                        block = min(count, _SENDFILE_BLOCK_SIZE)
+                        deadline.apply(connection)
+                        connection.sendfile(response.file, offset, block)
+                        offset += block
+                        count -= block
+        elif isinstance(response, StreamingResponse):
+            head = response.get_head(keep_alive)
+            if timer is not None:
+                timer.mark()
+            _send_buffers(connection, [head], deadline)
+
+            # Each chunk is produced only after the previous one has been
+            # sent, and sending blocks while the socket's send buffer is full
+            # (man 7 socket, SO_SNDBUF), so a slow client slows down the
+            # handler rather than letting unsent chunks pile up in memory.
+            chunks = response.get_chunks()
+            while True:
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    break
+                except Exception:
+                    # The handler failed partway through the body. It's too
+                    # late to respond with 500, so close the connection
+                    # without sending the last chunk, which tells the client
+                    # that the response is incomplete.
+                    log_exception('Failed to generate a streaming response')
+                    return False
+                _send_buffers(connection, chunk, deadline)
+        else:
+            buffers = response.get_buffers(keep_alive)
+            if timer is not None:
+                timer.mark()
+            _send_buffers(connection, buffers, deadline)
+    finally:
+        response.close()
+
+    if timer is not None:
+        timer.mark()
+    return True
+
+
+def _send_buffers(
+        connection: socket.socket,
+        buffers: List[bytes],
+        deadline: Deadline) -> None:
+    # Send the concatenation of the buffers without actually concatenating
+    # them, which would copy the message body. socket.socket.sendmsg, like the
+    # underlying system call (man 2 sendmsg), gathers the data to send from
+    # multiple buffers. Like socket.socket.send, it may send only some of the
+    # data, so repeat until every buffer has been sent, or until the deadline
+    # has passed.
+    views = [memoryview(buffer) for buffer in buffers if buffer]
+    deadline.extend(sum(len(view) for view in views))
+    while views != []:
+        deadline.apply(connection)
+        sent = connection.sendmsg(views)
+        while sent > 0 and sent >= len(views[0]):
+            sent -= len(views.pop(0))
+        if sent > 0:
+            views[0] = views[0][sent:]
+
+
+def _send_error(
+        connection: socket.socket,
+        status_code: int,
+        write_timeout: Optional[float] = None) -> None:
+    # Respond to a request that the server cannot handle, after which the
+    # server closes the connection. Error responses are prebuilt (see
+    # get_error_response), so this serializes nothing.
+    response = get_error_response(status_code)
+    _send_bytes(
+        connection, response.get_bytes(keep_alive=False), write_timeout
+    )
+
+
+def _send_bytes(
+        connection: socket.socket,
+        data: bytes,
+        write_timeout: Optional[float]) -> None:
+    # Send a short response before closing the connection. A client that
+    # doesn't read the response in time doesn't get it.
+    try:
+        Deadline(write_timeout).apply(connection)
+        connection.sendall(data)
+    except socket.timeout:
+        pass
+
+
+def _requests_close(request: Request) -> bool:
+    # Whether the client included the "close" connection option in the
+    # request (https://tools.ietf.org/html/rfc2616#section-14.10).
+    return any(
+        option.strip().lower() == 'close'
+        for value in request.headers.get_all('Connection')
+        for option in value.split(',')
+    )
+
+
+def run_async_server(
+        handler: Union[AsyncHandler, Callable[[bytes], bytes]],
+        address: Tuple[str, int] = DEFAULT_ADDR,
+        verbose: bool = False,
+        access_log: Optional[AccessLog] = None,
+        header_timeout: Optional[float] = DEFAULT_HEADER_TIMEOUT,
+        handler_timeout: Optional[float] = None,
+        write_timeout: Optional[float] = DEFAULT_WRITE_TIMEOUT,
+        backlog: int = DEFAULT_BACKLOG,
+        max_in_flight: Optional[int] = None,
+        retry_after: int = DEFAULT_RETRY_AFTER) -> None:
+    """Run an asyncio-based TCP server at the given address.
+
+    Rather than dedicating a thread to each connection, the server multiplexes
+    every connection on a single event loop, so idle or slow clients cost
+    little more than their sockets. The handler may be a coroutine function
+    (e.g. created by create_async_handler), which runs on the event loop, or a
+    regular function (e.g. created by create_handler), which runs in the
+    event loop's default thread pool so that it cannot block the loop.
+
+    Unlike run_server, the server serves one request per connection, like
+    run_server with a handler not created by create_handler: it reads the
+    request line and headers (up to the blank line that ends them), passes
+    them to the handler, sends the handler's response, and closes the
+    connection. It doesn't read request bodies. Requests whose headers are
+    longer than MAX_REQUEST_LENGTH bytes get 431 Request Header Fields Too
+    Large, and requests that end before their headers do get 400 Bad
+    Request.
+
+    Requests are logged as by run_server. The server closes the connection
+    if the request doesn't arrive within header_timeout seconds, the handler
+    doesn't respond within handler_timeout seconds, or the response isn't
+    sent within write_timeout seconds (or never, for a timeout of None). A
+    coroutine handler that times out is cancelled; a regular handler keeps
+    running in its thread.
+
+    The event loop accepts every connection that it can, so without a limit,
+    a spike of requests would make every request wait for the others. If
+    max_in_flight is given, requests that arrive while max_in_flight
+    requests are being handled are rejected as by run_server.
+    """
+
+    if access_log is None and verbose:
+        access_log = AccessLog()
+    serve = functools.partial(
+        _serve_async_connection,
+        handler=handler,
+        admission=_Admission(
+            None, max_in_flight, retry_after, access_log, None
+        ),
+        access_log=access_log,
+        header_timeout=header_timeout,
+        handler_timeout=handler_timeout,
+        write_timeout=write_timeout
+    )
+    try:
+        asyncio.run(_run_async_server(serve, address, backlog))
+    finally:
+        if access_log is not None:
+            access_log.close()
+
+
+async def _run_async_server(
+        serve: Callable[
+            [asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]
+        ],
+        address: Tuple[str, int],
+        backlog: int) -> None:
+
+    # asyncio.start_server marks the listening socket as nonblocking and
+    # registers it with the event loop's selector (epoll on Linux), which
+    # notifies the loop whenever a connection is ready to be accepted or a
+    # connected socket is ready to be read from or written to.
+    #
+    # sources:
+    # - man 7 epoll
+    # - https://docs.python.org/3/library/asyncio-stream.html
+    listener = create_listening_socket(address, backlog=backlog)
+    async_server = await asyncio.start_server(
+        serve, sock=listener, limit=MAX_REQUEST_LENGTH
+    )
+    async with async_server:
+        await async_server.serve_forever()
+
+
+async def _serve_async_connection(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        handler: Union[AsyncHandler, Callable[[bytes], bytes]],
+        admission: _Admission,
+        access_log: Optional[AccessLog],
+        header_timeout: Optional[float],
+        handler_timeout: Optional[float],
+        write_timeout: Optional[float]) -> None:
+
+    try:
+        start = time.perf_counter()
+
+        # asyncio.wait_for cancels the awaited operation if it doesn't finish
+        # within the timeout, and raises asyncio.TimeoutError, after which
+        # the connection is closed. StreamReader.readuntil waits for the
+        # blank line that ends the headers, however many reads it takes, and
+        # raises LimitOverrunError if they exceed the reader's limit (see
+        # _run_async_server).
+        try:
+            request = await asyncio.wait_for(
+                reader.readuntil(_HEADERS_END), header_timeout
+            )
+        except (asyncio.LimitOverrunError,
+                asyncio.IncompleteReadError) as error:
+            if isinstance(error, asyncio.IncompleteReadError) and (
+                    not error.partial):
+                # The client closed the connection without sending anything.
+                return
+            # As in ConnectionReader.read_request.
+            status_code = (
+                431 if isinstance(error, asyncio.LimitOverrunError) else 400
+            )
+            writer.write(
+                get_error_response(status_code).get_bytes(keep_alive=False)
+            )
+            await asyncio.wait_for(writer.drain(), write_timeout)
+            if access_log is not None:
+                access_log.log(
+                    writer.get_extra_info('peername'), b'', status_code,
+                    None, time.perf_counter() - start
+                )
+            return
+
+        if not admission.acquire_request():
+            writer.write(admission.rejection)
+            await asyncio.wait_for(writer.drain(), write_timeout)
+            return
+        try:
+            if asyncio.iscoroutinefunction(handler):
+                response = await asyncio.wait_for(
+                    cast(AsyncHandler, handler)(request), handler_timeout
+                )
+            else:
+                response = await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(
+                        None, cast(Callable[[bytes], bytes], handler), request
+                    ),
+                    handler_timeout
+                )
+        finally:
+            admission.release_request()
+
+        # StreamWriter.write buffers the data and StreamWriter.drain waits
+        # until the buffer has been flushed to the socket, the asynchronous
+        # equivalent of socket.socket.sendall.
+        writer.write(response)
+        await asyncio.wait_for(writer.drain(), write_timeout)
+        if access_log is not None:
+            # As for handlers not created by create_handler in run_server,
+            # only the request line and the response's length are logged.
+            access_log.log(
+                writer.get_extra_info('peername'), get_request_line(request),
+                None, len(response), time.perf_counter() - start
+            )
+    except asyncio.TimeoutError:
+        # Closing the transport would wait for buffered data to be sent to a
+        # client that may never receive it. Aborting discards the data.
+        writer.transport.abort()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def create_listening_socket(
+        address: Tuple[str, int],
+        reuse_port: bool = False,
+        backlog: int = DEFAULT_BACKLOG) -> socket.socket:
+    """Create a TCP socket listening at the given address, with room for
+    backlog connections to wait to be accepted (see DEFAULT_BACKLOG).
+
+    If reuse_port is true, other sockets with the same option may listen at
+    the same address, and the kernel distributes incoming connections among
+    them (see SO_REUSEPORT in `man 7 socket`).
+    """
+
+    listener = create_tcp_socket()
+
+    # Normally, calling bind fails if a socket was too recently bound to
+    # the given address. Enabling the socket.SO_REUSEADDR option for our
+    # listening socket allows us to bind it to a recently used address
+    # (e.g. for restarting the server during automated testing). bind still
+    # fails if given the address of an actively listening socket.
+    #
+    # Note that Linux systems allow address reuse only when the option was
+    # enabled during the previous bind operation and is enabled during the
+    # current bind operation (see NOTES in `man 7 socket`).
+    #
+    # socket.SOL_SOCKET specifies that we're setting an option at the level
+    # of the sockets API (as opposed to e.g. the TCP level).
+    #
+    # sources:
+    # - man 2 setsockopt
+    # - man 7 socket
+    # - https://docs.python.org/3/library/socket.html#example
+    try:
         listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         # Assign the given address to the socket (man 2 bind).
         listener.bind(address)
 
         # Mark the socket as one that will be used to accept incoming
         # connection requests (man 2 listen).
-        listener.listen()
-
-        while True:
+        listener.listen(backlog)
+    except OSError:
+        listener.close()
+        raise
 
-            # Dequeue the first connection request from the listening socket's
-            # queue of pending connections. Create and return a new connected
-            # socket (not in the listening state) and the address of the peer
-            # socket (in this case, a client connecting to our server). The
-            # listening socket is unaffected.
-            #
-            # If the queue is empty, and the listening socket is not marked as
-            # nonblocking, then block execution until a connection is present.
-            #
-            # sources:
-            # - man 2 accept
-            connection, address = listener.accept()
-
-            with connection:
-                if verbose:
-                    print('-' * 79)
-                    print('Connection established with {}\n'.format(address))
-
-                # Receive up to the given number of bytes on a connected socket
-                # (man 2 recv).
-                request = connection.recv(MAX_REQUEST_LENGTH)
-                if verbose:
-                    print('Request:\n\n{}\n'.format(request.decode().strip()))
-
-                response = handler(request)
-                if verbose:
-                    try:
-                        logged_response = 'Response:\n\n{}\n\n'.format(
-                            response.decode().strip()
-                        )
-                    except UnicodeDecodeError:
-                        logged_response = 'Response (bytes):\n\n{}\n\n'.format(
-                            response
-                        )
-                    print(logged_response)
-
-                # Send data from a connected socket. socket.socket.send, like
-                # the underlying system call (see `man 2 send`), returns the
-                # number of bytes sent, which may be less than the total if the
-                # network is busy. socket.socket.sendall repeatedly sends data
-                # until all data has been sent.
-                connection.sendall(response)
+    return listener
 
 
 def create_tcp_socket() -> socket.socket:
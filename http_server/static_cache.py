@@ -0,0 +1,453 @@
+"""Tools for caching responses for static files."""
+
+
+import os
+import stat
+import time
+from typing import BinaryIO, Callable, List, Optional, Tuple
+from typing import Dict  # noqa: F401
+
+from attr import attrs, attrib, evolve
+
+from .compression import compress, get_variant_etag, is_compressible
+from .compression import negotiate_encoding, GZIP
+from .conditional import get_validators, is_not_modified, is_range_current
+from .lru import LRUCache
+from .ranges import get_range_response, parse_range
+from .requests import Request
+from .responses import FileResponse, Response
+
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+DEFAULT_REVALIDATE_INTERVAL = 1.0
+
+# The extension of a precompressed sibling of a file (see StaticFileCache).
+PRECOMPRESSED_EXT = '.gz'
+
+
+# Identifies a version of a file. If any of these change, the file must be
+# read again.
+_Signature = Tuple[int, int, int, int]
+
+
+@attrs(frozen=True)
+class _Variant:
+    # A representation of a file, either as it is or compressed using some
+    # content coding.
+
+    etag = attrib()  # type: str
+    response = attrib()  # type: Response
+
+    # The response to a conditional request for this representation (see
+    # StaticFileCache._respond).
+    not_modified = attrib()  # type: Response
+
+
+@attrs(frozen=True)
+class _Entry:
+    signature = attrib()  # type: _Signature
+    content_type = attrib()  # type: Tuple[str, str]
+    message_body = attrib()  # type: bytes
+
+    # The file's validators (see http_server.conditional.get_validators) and
+    # modification time.
+    validators = attrib()  # type: List[Tuple[str, str]]
+    mtime = attrib()  # type: float
+
+    # Whether the file is worth compressing (see
+    # http_server.compression.is_compressible).
+    compressible = attrib()  # type: bool
+
+    # The representations of the file that have been requested so far, by
+    # content coding (None for the uncompressed file).
+    variants = attrib()  # type: Dict[Optional[str], _Variant]
+
+    # The total length of the variants' message bodies.
+    size = attrib()  # type: int
+
+    # When the entry was last checked against the file (see
+    # time.monotonic).
+    checked = attrib()  # type: float
+
+
+class StaticFileCache(LRUCache[str, _Entry]):
+    """An in-memory cache of responses for static files.
+
+    Responses for files of up to max_file_size bytes are kept in memory,
+    frozen (see Response.freeze), so serving a cached file requires no
+    syscalls at all. When the cached responses exceed max_size bytes in
+    total, the least recently used are evicted.
+
+    A cached response is used without checking the file for up to
+    revalidate_interval seconds. After that, the file's metadata is checked
+    with a single stat, and the file is read again if it has changed.
+
+    Every response includes ETag and Last-Modified headers computed from the
+    file's metadata, so that clients can make conditional requests (see
+    http_server.conditional).
+
+    Compressible files (see http_server.compression) are compressed for
+    clients that accept it. Each compressed variant is cached alongside the
+    file, so a file is compressed at most once per content coding. If a file
+    has a gzipped sibling with the same name plus PRECOMPRESSED_EXT that is
+    at least as new as the file, the sibling is used instead of compressing
+    the file. Files too large to cache are sent compressed only if they have
+    such a sibling.
+
+    Range requests (see http_server.ranges) bypass the cache, since the
+    requested ranges are sent straight from the (uncompressed) file.
+    """
+
+    def __init__(
+            self,
+            get_content_type: Callable[[str], Tuple[str, str]],
+            max_size: int = DEFAULT_MAX_SIZE,
+            max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+            revalidate_interval: float = DEFAULT_REVALIDATE_INTERVAL) -> None:
+
+        super().__init__(_get_size, max_size)
+        self._get_content_type = get_content_type
+        self._max_file_size = max_file_size
+        self._revalidate_interval = revalidate_interval
+
+    @property
+    def size(self) -> int:
+        """The total size in bytes of the cached responses' message
+        bodies."""
+        return self._size
+
+    def get(
+            self,
+            path: str,
+            request: Optional[Request] = None) -> Optional[Response]:
+        """Get a 200 response containing the file at the given path, or None
+        if there is no regular file at that path.
+
+        If the request is given and is a conditional request (see
+        http_server.conditional.is_not_modified) for the current version of
+        the file, get a 304 response instead. If it is a range request, get
+        a 206 or 416 response (see http_server.ranges.get_range_response). If
+        the client accepts a compressed response, the file may be compressed.
+        """
+
+        if request is not None and 'Range' in request.headers:
+            return self._get_ranges(path, request)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            fresh = entry is not None and (
+                now - entry.checked < self._revalidate_interval
+            )
+            if fresh:
+                self._hit(path)
+
+        # Respond without holding the lock, which _respond may need in order
+        # to add a variant of the file.
+        if fresh:
+            assert entry is not None
+            return self._respond(path, entry, request)
+
+        if entry is not None:
+            signature = None  # type: Optional[_Signature]
+            try:
+                signature = _get_signature(os.stat(path))
+            except OSError:
+                pass
+            if signature == entry.signature:
+                checked_entry = evolve(entry, checked=now)
+                with self._lock:
+                    self._replace(path, entry, checked_entry)
+                    self.hits += 1
+                return self._respond(path, checked_entry, request)
+
+        with self._lock:
+            self.misses += 1
+        return self._load(path, request, now)
+
+    def _load(
+            self,
+            path: str,
+            request: Optional[Request],
+            now: float) -> Optional[Response]:
+
+        opened = self._open(path)
+        if opened is None:
+            return None
+        requested_file, file_stat = opened
+
+        try:
+            content_type = self._get_content_type(path)
+            if file_stat.st_size > self._max_file_size:
+                # Too large to keep in memory, so send it straight from the
+                # file.
+                with self._lock:
+                    self._remove(path)
+                return _get_file_response(
+                    path, requested_file, file_stat, content_type, request
+                )
+
+            with requested_file:
+                message_body = requested_file.read()
+        except:  # noqa: E722
+            requested_file.close()
+            raise
+
+        validators = get_validators(file_stat)
+        compressible = is_compressible(content_type, len(message_body))
+        identity = _create_variant(
+            validators, None, compressible, content_type, message_body
+        )
+        entry = _Entry(
+            _get_signature(file_stat),
+            content_type,
+            message_body,
+            validators,
+            file_stat.st_mtime,
+            compressible,
+            {None: identity},
+            len(message_body),
+            now
+        )
+        with self._lock:
+            self._put(path, entry)
+        return self._respond(path, entry, request)
+
+    def _respond(
+            self,
+            path: str,
+            entry: _Entry,
+            request: Optional[Request]) -> Response:
+
+        encoding = None  # type: Optional[str]
+        if request is not None and entry.compressible:
+            encoding = negotiate_encoding(request)
+
+        variant = entry.variants.get(encoding)
+        if variant is None:
+            variant = self._add_variant(path, entry, encoding)
+
+        if request is not None and is_not_modified(
+                request, variant.etag, entry.mtime):
+            return variant.not_modified
+        return variant.response
+
+    def _add_variant(
+            self,
+            path: str,
+            entry: _Entry,
+            encoding: Optional[str]) -> _Variant:
+
+        # Compress the file, or read its precompressed sibling. Two threads
+        # may do this at once, in which case the last one's variant is kept.
+
+        assert encoding is not None
+        message_body = None  # type: Optional[bytes]
+        if encoding == GZIP:
+            message_body = _read_precompressed(path, entry.mtime)
+        if message_body is None:
+            message_body = compress(entry.message_body, encoding)
+
+        if len(message_body) < len(entry.message_body):
+            variant = _create_variant(
+                entry.validators,
+                encoding,
+                True,
+                entry.content_type,
+                message_body
+            )
+            size = len(message_body)
+        else:
+            # Compression doesn't help, so clients that accept this coding
+            # get the uncompressed file.
+            variant = entry.variants[None]
+            size = 0
+
+        variants = dict(entry.variants)
+        variants[encoding] = variant
+        with self._lock:
+            self._replace(path, entry, evolve(
+                entry, variants=variants, size=entry.size + size
+            ))
+        return variant
+
+    def _get_ranges(self, path: str, request: Request) -> Optional[Response]:
+        opened = self._open(path)
+        if opened is None:
+            return None
+        requested_file, file_stat = opened
+
+        try:
+            headers = _get_headers(get_validators(file_stat), None, False)
+            etag = dict(headers)['ETag']
+            if is_not_modified(request, etag, file_stat.st_mtime):
+                # A conditional request takes precedence over a range request
+                # (https://tools.ietf.org/html/rfc7233#section-3.1).
+                requested_file.close()
+                return Response(304, headers=headers)
+
+            content_type = self._get_content_type(path)
+            ranges = None  # type: Optional[List[Tuple[int, int]]]
+            if is_range_current(request, etag, file_stat.st_mtime):
+                ranges = parse_range(
+                    request.headers.get('Range', ''), file_stat.st_size
+                )
+            if ranges is None:
+                return FileResponse(
+                    200, content_type, requested_file, headers=headers
+                )
+            return get_range_response(
+                content_type,
+                requested_file,
+                file_stat.st_size,
+                ranges,
+                headers
+            )
+        except:  # noqa: E722
+            requested_file.close()
+            raise
+
+    def _open(self, path: str) -> Optional[Tuple[BinaryIO, os.stat_result]]:
+        # Open the regular file at the given path, or return None if there is
+        # no such file.
+
+        opened = _open_file(path)
+        if opened is None:
+            with self._lock:
+                self._remove(path)
+        return opened
+
+
+def _get_size(entry: _Entry) -> int:
+    return entry.size
+
+
+def _get_file_response(
+        path: str,
+        requested_file: BinaryIO,
+        file_stat: os.stat_result,
+        content_type: Tuple[str, str],
+        request: Optional[Request]) -> Response:
+
+    # Get a response that is sent straight from the file, or from its
+    # precompressed sibling if there is one and the client accepts gzip.
+
+    sibling = None  # type: Optional[Tuple[BinaryIO, os.stat_result]]
+    if is_compressible(content_type, file_stat.st_size):
+        sibling = _open_precompressed(path, file_stat.st_mtime)
+
+    encoding = None  # type: Optional[str]
+    if sibling is not None:
+        if request is not None:
+            encoding = negotiate_encoding(request, (GZIP,))
+        if encoding is None:
+            sibling[0].close()
+        else:
+            requested_file.close()
+            requested_file = sibling[0]
+
+    headers = _get_headers(
+        get_validators(file_stat), encoding, sibling is not None
+    )
+    if request is not None and is_not_modified(
+            request, dict(headers)['ETag'], file_stat.st_mtime):
+        requested_file.close()
+        return Response(304, headers=headers)
+    return FileResponse(200, content_type, requested_file, headers=headers)
+
+
+def _create_variant(
+        validators: List[Tuple[str, str]],
+        encoding: Optional[str],
+        compressible: bool,
+        content_type: Tuple[str, str],
+        message_body: bytes) -> _Variant:
+
+    headers = _get_headers(validators, encoding, compressible)
+    return _Variant(
+        dict(headers)['ETag'],
+        Response(200, content_type, message_body, headers).freeze(),
+        Response(304, headers=headers).freeze()
+    )
+
+
+def _get_headers(
+        validators: List[Tuple[str, str]],
+        encoding: Optional[str],
+        compressible: bool) -> List[Tuple[str, str]]:
+
+    # Get the headers of a response containing a file compressed using the
+    # given content coding (or not compressed, if encoding is None).
+
+    if encoding is None:
+        # Tell clients that they may request ranges of the file
+        # (https://tools.ietf.org/html/rfc7233#section-2.3). Ranges of
+        # compressed files aren't supported.
+        headers = validators + [('Accept-Ranges', 'bytes')]
+    else:
+        headers = [
+            (name, get_variant_etag(value, encoding) if name == 'ETag'
+             else value)
+            for name, value in validators
+        ]
+        headers.append(('Content-Encoding', encoding))
+
+    if compressible:
+        # Whether the response is compressed depends on the request's
+        # Accept-Encoding header
+        # (https://tools.ietf.org/html/rfc7231#section-7.1.4).
+        headers.append(('Vary', 'Accept-Encoding'))
+    return headers
+
+
+def _read_precompressed(path: str, mtime: float) -> Optional[bytes]:
+    opened = _open_precompressed(path, mtime)
+    if opened is None:
+        return None
+    with opened[0] as precompressed_file:
+        return precompressed_file.read()
+
+
+def _open_precompressed(
+        path: str,
+        mtime: float) -> Optional[Tuple[BinaryIO, os.stat_result]]:
+
+    # Open the precompressed sibling of the file at the given path, unless it
+    # is older than the file (which has the given modification time), in
+    # which case it is probably stale.
+
+    opened = _open_file(path + PRECOMPRESSED_EXT)
+    if opened is not None and opened[1].st_mtime < mtime:
+        opened[0].close()
+        return None
+    return opened
+
+
+def _open_file(path: str) -> Optional[Tuple[BinaryIO, os.stat_result]]:
+    try:
+        opened_file = open(path, 'rb')
+    except OSError:
+        return None
+
+    try:
+        # fstat describes the file we actually opened, even if the path has
+        # since been replaced.
+        file_stat = os.fstat(opened_file.fileno())
+    except:  # noqa: E722
+        opened_file.close()
+        raise
+
+    if not stat.S_ISREG(file_stat.st_mode):
+        opened_file.close()
+        return None
+    return opened_file, file_stat
+
+
+def _get_signature(file_stat: os.stat_result) -> _Signature:
+    return (
+        file_stat.st_dev,
+        file_stat.st_ino,
+        file_stat.st_size,
+        file_stat.st_mtime_ns
+    )
@@ -2,6 +2,14 @@
 
 
 GET_METHOD = 'GET'
+HEAD_METHOD = 'HEAD'
+POST_METHOD = 'POST'
+PUT_METHOD = 'PUT'
+DELETE_METHOD = 'DELETE'
+
+# The methods that the server supports
+# (https://tools.ietf.org/html/rfc7231#section-4.3).
+METHODS = (GET_METHOD, HEAD_METHOD, POST_METHOD, PUT_METHOD, DELETE_METHOD)
 
 HTTP_VERSION = 'HTTP/1.1'
 
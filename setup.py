@@ -7,10 +7,12 @@ setuptools.setup(
     name='http_server',
     packages=['http_server'],
     scripts=[
+        os.path.join('scripts', 'jth-bench'),
         os.path.join('scripts', 'jth-default-server'),
         os.path.join('scripts', 'jth-dynamic-css-server'),
-        os.path.join('scripts', 'jth-http-client')
+        os.path.join('scripts', 'jth-http-client'),
+        os.path.join('scripts', 'jth-proxy-server')
     ],
-    install_requires=['attrs>=18.2.0'],
-    python_requires='>=3.5.3'
+    install_requires=['attrs>=19.2.0'],
+    python_requires='>=3.7'
 )
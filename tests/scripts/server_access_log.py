@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+from http_server import server
+from http_server.handlers import create_handler
+from http_server.logs import AccessLog, JSON_FORMAT
+from http_server.media_types import MEDIA_TYPES
+from http_server.requests import Request
+from http_server.responses import Response, get_error_response
+
+
+# The test reads the log from this file.
+LOG_PATH = os.path.join(tempfile.gettempdir(), 'http_server_access_log.jsonl')
+
+
+@create_handler
+def hello_handler(request: Request) -> Response:
+    if request.uri == ['hello']:
+        return Response(200, MEDIA_TYPES['plain'], 'hello')
+    return get_error_response(404)
+
+
+if __name__ == '__main__':
+    with open(LOG_PATH, 'w') as log_file:
+        server.run_server(
+            hello_handler,
+            access_log=AccessLog(
+                log_file, JSON_FORMAT, flush_interval=0.05
+            )
+        )
@@ -0,0 +1,39 @@
+import time
+
+from http_server import server
+from http_server.handlers import create_handler, Router
+from http_server.media_types import MEDIA_TYPES
+from http_server.metrics import Metrics
+from http_server.requests import Request
+from http_server.responses import Response
+
+
+router = Router()
+metrics = Metrics(router.get_route)
+router.add_route('/metrics', metrics.handle)
+
+
+@router.route('/slow')
+def slow_handler(request: Request) -> Response:
+    time.sleep(1)
+    return Response(200, MEDIA_TYPES['plain'], 'slow')
+
+
+@router.route('/hello')
+def hello_handler(request: Request) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], 'hello')
+
+
+if __name__ == '__main__':
+    # Two workers, but only one request handled at a time, and connections
+    # that wait in the queue for more than 300 ms are rejected.
+    server.run_server(
+        create_handler(router),
+        workers=2,
+        mode=server.THREAD_MODE,
+        queue_size=2,
+        max_queue_time=0.3,
+        max_in_flight=1,
+        retry_after=5,
+        metrics=metrics
+    )
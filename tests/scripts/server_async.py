@@ -0,0 +1,12 @@
+import asyncio
+
+from http_server import server
+
+
+async def slow_echo(request: bytes) -> bytes:
+    await asyncio.sleep(0.5)
+    return request
+
+
+if __name__ == '__main__':
+    server.run_async_server(slow_echo)
@@ -0,0 +1,5 @@
+from http_server import server
+
+
+if __name__ == '__main__':
+    server.run_async_server(lambda request: request.upper() * 3)
@@ -0,0 +1,23 @@
+from http_server.cli import run_server_from_command_line
+from http_server.handlers import create_handler, Router
+from http_server.media_types import MEDIA_TYPES
+from http_server.requests import Request
+from http_server.responses import Response
+from http_server.tokens import METHODS
+
+
+router = Router()
+
+
+@router.route('/echo')
+def echo_handler(request: Request) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], request.body.read())
+
+
+if __name__ == '__main__':
+    run_server_from_command_line(
+        create_handler(router, methods=METHODS),
+        'Echo request bodies.',
+        router.get_route,
+        ['--metrics', '--quiet']
+    )
@@ -0,0 +1,31 @@
+import os
+
+from http_server import server
+from http_server.handlers import create_handler
+from http_server.media_types import MEDIA_TYPES
+from http_server.ranges import get_range_response, parse_range
+from http_server.requests import Request
+from http_server.responses import FileResponse, Response
+from http_server.responses import get_error_response
+
+
+@create_handler
+def file_handler(request: Request) -> Response:
+    # Serve files by absolute path.
+    path = os.path.join(os.sep, *request.uri)
+    if not os.path.isfile(path):
+        return get_error_response(404)
+
+    requested_file = open(path, 'rb')
+    ranges = parse_range(
+        request.headers.get('Range', ''), os.path.getsize(path)
+    )
+    if ranges is None:
+        return FileResponse(200, MEDIA_TYPES['plain'], requested_file)
+    return get_range_response(
+        MEDIA_TYPES['plain'], requested_file, os.path.getsize(path), ranges
+    )
+
+
+if __name__ == '__main__':
+    server.run_server(file_handler)
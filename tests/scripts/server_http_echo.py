@@ -0,0 +1,14 @@
+from http_server import server
+from http_server.handlers import create_handler
+from http_server.media_types import MEDIA_TYPES
+from http_server.requests import Request
+from http_server.responses import Response
+
+
+@create_handler
+def echo_handler(request: Request) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], '/'.join(request.uri))
+
+
+if __name__ == '__main__':
+    server.run_server(echo_handler, keep_alive_timeout=1, keep_alive_max=3)
@@ -0,0 +1,20 @@
+from http_server import server
+from http_server.handlers import create_handler, Router
+from http_server.media_types import MEDIA_TYPES
+from http_server.metrics import Metrics
+from http_server.requests import Request
+from http_server.responses import Response
+
+
+router = Router()
+metrics = Metrics(router.get_route)
+router.add_route('/metrics', metrics.handle)
+
+
+@router.route('/hello/{name}')
+def hello_handler(request: Request, name: str) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], 'hello ' + name)
+
+
+if __name__ == '__main__':
+    server.run_server(create_handler(router), metrics=metrics)
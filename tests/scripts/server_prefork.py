@@ -0,0 +1,23 @@
+import os
+import time
+
+from http_server import server
+from http_server.handlers import create_handler
+from http_server.media_types import MEDIA_TYPES
+from http_server.requests import Request
+from http_server.responses import Response
+
+
+@create_handler
+def pid_handler(request: Request) -> Response:
+    # Respond with the worker's process ID, after crashing the worker or
+    # taking a while to respond if asked to.
+    if request.uri == ['crash']:
+        os._exit(1)
+    if request.uri == ['slow']:
+        time.sleep(1)
+    return Response(200, MEDIA_TYPES['plain'], str(os.getpid()))
+
+
+if __name__ == '__main__':
+    server.run_server(pid_handler, workers=2, mode=server.PREFORK_MODE)
@@ -0,0 +1,43 @@
+import threading
+
+from http_server import server
+from http_server.handlers import create_handler, Router
+from http_server.proxy import Proxy
+from http_server.requests import Request
+from http_server.responses import Response
+
+# The echo and streaming servers (see server_http_echo.py and
+# server_streaming.py) run in this process as the upstream servers.
+from server_http_echo import echo_handler
+from server_streaming import streaming_handler
+
+
+ECHO_ADDR = ('127.0.0.1', 8081)
+STREAMING_ADDR = ('127.0.0.1', 8082)
+
+echo_proxy = Proxy([ECHO_ADDR])
+streaming_proxy = Proxy([STREAMING_ADDR])
+
+router = Router()
+
+
+@router.route('/stream/{path*}')
+def stream_handler(request: Request, path: str) -> Response:
+    return streaming_proxy(request)
+
+
+@router.route('/{path*}')
+def echo_proxy_handler(request: Request, path: str) -> Response:
+    return echo_proxy(request)
+
+
+if __name__ == '__main__':
+    for handler, address in ((echo_handler, ECHO_ADDR),
+                             (streaming_handler, STREAMING_ADDR)):
+        threading.Thread(
+            target=server.run_server,
+            args=(handler, address),
+            kwargs={'workers': 4},
+            daemon=True
+        ).start()
+    server.run_server(create_handler(router), workers=4)
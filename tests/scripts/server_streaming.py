@@ -0,0 +1,27 @@
+from typing import Iterator, List
+
+from http_server import server
+from http_server.handlers import create_handler
+from http_server.media_types import MEDIA_TYPES
+from http_server.requests import Request
+from http_server.responses import Response, StreamingResponse
+
+
+@create_handler
+def streaming_handler(request: Request) -> Response:
+    # Respond with the parts of the requested URI as separate chunks, or fail
+    # partway through the body if the URI contains "fail".
+    return StreamingResponse(
+        200, MEDIA_TYPES['plain'], _generate_chunks(request.uri)
+    )
+
+
+def _generate_chunks(parts: List[str]) -> Iterator[str]:
+    for part in parts:
+        if part == 'fail':
+            raise ValueError()
+        yield part
+
+
+if __name__ == '__main__':
+    server.run_server(streaming_handler)
@@ -0,0 +1,14 @@
+import time
+
+from http_server import server
+
+
+def slow_echo(request: bytes) -> bytes:
+    time.sleep(0.5)
+    return request
+
+
+if __name__ == '__main__':
+    server.run_server(
+        slow_echo, workers=2, mode=server.THREAD_MODE, queue_size=0
+    )
@@ -0,0 +1,48 @@
+import time
+
+from http_server import server
+from http_server.handlers import create_handler, Router
+from http_server.media_types import MEDIA_TYPES
+from http_server.metrics import Metrics
+from http_server.requests import Request
+from http_server.responses import Response
+
+
+router = Router()
+metrics = Metrics(router.get_route)
+router.add_route('/metrics', metrics.handle)
+
+
+@router.route('/slow')
+def slow_handler(request: Request) -> Response:
+    time.sleep(2)
+    return Response(200, MEDIA_TYPES['plain'], 'slow')
+
+
+@router.route('/large')
+def large_handler(request: Request) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], b'a' * (32 * 1024 * 1024))
+
+
+@router.route('/hello')
+def hello_handler(request: Request) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], 'hello')
+
+
+@router.route('/echo')
+def echo_handler(request: Request) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], request.body.read())
+
+
+if __name__ == '__main__':
+    # A single thread serves one connection at a time, so a client that
+    # holds its connection would hold up every other client.
+    server.run_server(
+        create_handler(router),
+        header_timeout=0.5,
+        body_timeout=0.5,
+        handler_timeout=0.5,
+        write_timeout=0.5,
+        min_rate=0,
+        metrics=metrics
+    )
@@ -0,0 +1,40 @@
+from http_server import server
+from http_server.handlers import create_handler, Router
+from http_server.media_types import MEDIA_TYPES
+from http_server.requests import Request
+from http_server.responses import Response
+from http_server.tokens import METHODS
+
+
+router = Router()
+
+
+@router.route('/echo')
+def echo_handler(request: Request) -> Response:
+    return Response(200, MEDIA_TYPES['plain'], request.body.read())
+
+
+@router.route('/length')
+def length_handler(request: Request) -> Response:
+    # The body is counted a piece at a time, without holding all of it.
+    length = sum(len(data) for data in request.body)
+    return Response(200, MEDIA_TYPES['plain'], str(length))
+
+
+@router.route('/spool')
+def spool_handler(request: Request) -> Response:
+    with request.body.spool(max_memory_size=16) as spooled:
+        return Response(200, MEDIA_TYPES['plain'], spooled.read())
+
+
+@router.route('/hello')
+def hello_handler(request: Request) -> Response:
+    # The body, if any, is ignored.
+    return Response(200, MEDIA_TYPES['plain'], 'hello')
+
+
+if __name__ == '__main__':
+    server.run_server(
+        create_handler(router, methods=METHODS),
+        max_body_length=1024 * 1024
+    )
@@ -0,0 +1,97 @@
+import unittest
+
+from http_server.bench import create_request, format_report, Histogram
+from http_server.bench import BenchmarkResult
+from http_server.tokens import GET_METHOD, HTTP_VERSION, CRLF
+
+
+class BenchTestCase(unittest.TestCase):
+
+    def test_histogram_percentile(self) -> None:
+        histogram = Histogram()
+        for millis in range(1, 1001):
+            histogram.record(millis / 1000)
+        self.assertEqual(histogram.count, 1000)
+        self.assertEqual(histogram.percentile(50), 0.5)
+        self.assertEqual(histogram.percentile(99), 0.99)
+        self.assertEqual(histogram.percentile(99.9), 0.999)
+        self.assertEqual(histogram.percentile(100), 1.0)
+        self.assertEqual(histogram.percentile(0), 0.001)
+        self.assertAlmostEqual(histogram.mean, 0.5005)
+        self.assertEqual(histogram.max, 1.0)
+
+    def test_histogram_rounding(self) -> None:
+        histogram = Histogram()
+        histogram.record(0.123456)
+        histogram.record(0.000012)
+        self.assertEqual(histogram.percentile(100), 0.123)
+        self.assertEqual(histogram.percentile(50), 0.000012)
+
+        # The maximum is exact.
+        self.assertEqual(histogram.max, 0.123456)
+
+    def test_histogram_empty(self) -> None:
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(99), 0.0)
+        self.assertEqual(histogram.mean, 0.0)
+        self.assertEqual(histogram.get_distribution(), [])
+
+    def test_histogram_update(self) -> None:
+        first = Histogram()
+        second = Histogram()
+        first.record(0.001)
+        second.record(0.003)
+        second.record(0.003)
+        first.update(second)
+        self.assertEqual(first.count, 3)
+        self.assertEqual(first.percentile(50), 0.003)
+        self.assertEqual(first.max, 0.003)
+
+    def test_histogram_distribution(self) -> None:
+        histogram = Histogram()
+        for latency in (0.0005, 0.0015, 0.0016, 0.005):
+            histogram.record(latency)
+        self.assertEqual(
+            histogram.get_distribution(),
+            [(0.001, 1), (0.002, 2), (0.004, 0), (0.008, 1)]
+        )
+
+    def test_create_request(self) -> None:
+        self.assertEqual(
+            create_request('/foo', headers=[('Accept-Encoding', 'gzip')]),
+            (
+                GET_METHOD + ' /foo ' + HTTP_VERSION + CRLF
+                + 'Accept-Encoding: gzip' + CRLF
+                + CRLF
+            ).encode()
+        )
+        self.assertEqual(
+            create_request('/foo', keep_alive=False),
+            (
+                GET_METHOD + ' /foo ' + HTTP_VERSION + CRLF
+                + 'Connection: close' + CRLF
+                + CRLF
+            ).encode()
+        )
+
+    def test_result(self) -> None:
+        histogram = Histogram()
+        histogram.record(0.002)
+        result = BenchmarkResult(
+            2.0, histogram, {200: 1}, {'timeout': 1}, 1, 100
+        )
+        other = BenchmarkResult(
+            1.5, Histogram(), {503: 2}, {'timeout': 2}, 2, 50
+        )
+        other.latencies.record(0.004)
+        other.latencies.record(0.004)
+        result.update(other)
+
+        self.assertEqual(result.requests, 3)
+        self.assertEqual(result.requests_per_second, 1.5)
+        self.assertEqual(result.error_count, 3)
+        self.assertEqual(result.unsuccessful_count, 2)
+        summary = result.to_dict()
+        self.assertEqual(summary['statuses'], {'200': 1, '503': 2})
+        self.assertEqual(summary['p50'], 0.004)
+        self.assertIn('Requests/sec:  1.50', format_report(result))
@@ -0,0 +1,67 @@
+import io
+import unittest
+from typing import List  # noqa: F401
+
+from http_server.bodies import EMPTY_BODY, RequestBody
+
+
+class _PiecesBody(RequestBody):
+    # A body that arrives in the given pieces, like one read from a
+    # connection.
+
+    def __init__(self, *pieces: bytes) -> None:
+        self._pieces = list(pieces)
+
+    @property
+    def complete(self) -> bool:
+        return self._pieces == []
+
+    def _read_some(self, size: int) -> bytes:
+        if not self._pieces:
+            return b''
+        data = self._pieces[0][:size]
+        self._pieces[0] = self._pieces[0][size:]
+        if not self._pieces[0]:
+            del self._pieces[0]
+        return data
+
+
+class RequestBodyTestCase(unittest.TestCase):
+
+    def test_read(self) -> None:
+        body = _PiecesBody(b'01', b'234', b'56789')
+        self.assertEqual(body.read(4), b'0123')
+        self.assertEqual(body.read(0), b'')
+        self.assertEqual(body.read(), b'456789')
+        self.assertTrue(body.complete)
+        self.assertEqual(body.read(), b'')
+
+    def test_iter(self) -> None:
+        pieces = []  # type: List[bytes]
+        for data in _PiecesBody(b'01', b'234'):
+            pieces.append(data)
+        self.assertEqual(pieces, [b'01', b'234'])
+
+    def test_spool(self) -> None:
+        for max_memory_size in (1024, 4):
+            with self.subTest(max_memory_size=max_memory_size):
+                body = _PiecesBody(b'01', b'234', b'56789')
+                with body.spool(max_memory_size) as spooled:
+                    self.assertEqual(spooled.read(), b'0123456789')
+
+    def test_copy_to(self) -> None:
+        file = io.BytesIO()
+        self.assertEqual(_PiecesBody(b'01', b'234').copy_to(file), 5)
+        self.assertEqual(file.getvalue(), b'01234')
+
+    def test_discard(self) -> None:
+        body = _PiecesBody(b'01', b'234')
+        body.discard()
+        self.assertTrue(body.complete)
+
+    def test_empty(self) -> None:
+        self.assertEqual(EMPTY_BODY.length, 0)
+        self.assertTrue(EMPTY_BODY.complete)
+        self.assertEqual(EMPTY_BODY.read(), b'')
+        with EMPTY_BODY.spool() as spooled:
+            self.assertEqual(spooled.read(), b'')
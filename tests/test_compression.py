@@ -0,0 +1,128 @@
+import gzip
+import unittest
+import zlib
+from typing import Iterable, cast
+from typing import List, Union  # noqa: F401
+
+from http_server.compression import compress, compress_chunks
+from http_server.compression import compress_response
+from http_server.compression import get_variant_etag, is_compressible
+from http_server.compression import negotiate_encoding, MIN_LENGTH
+from http_server.requests import parse, Request
+from http_server.responses import Response, StreamingResponse
+
+
+class CompressionTestCase(unittest.TestCase):
+
+    def test_is_compressible(self) -> None:
+        self.assertTrue(is_compressible(('text', 'html'), MIN_LENGTH))
+        self.assertFalse(is_compressible(('text', 'html'), MIN_LENGTH - 1))
+        self.assertFalse(is_compressible(('image', 'png'), MIN_LENGTH))
+        self.assertFalse(is_compressible(None, MIN_LENGTH))
+
+    def test_negotiate_encoding(self) -> None:
+        for accept_encoding, expected in (
+                (None, None),
+                ('', None),
+                ('gzip', 'gzip'),
+                ('deflate', 'deflate'),
+                ('deflate, gzip', 'gzip'),
+                ('gzip;q=0.5, deflate', 'deflate'),
+                ('gzip; q=0, deflate;q=0', None),
+                ('x-gzip', 'gzip'),
+                ('*', 'gzip'),
+                ('*;q=0.1, gzip;q=0', 'deflate'),
+                ('br, identity', None),
+                ('GZIP;Q=1', 'gzip')):
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(
+                    negotiate_encoding(self.get_request(accept_encoding)),
+                    expected
+                )
+
+    def test_compress(self) -> None:
+        message_body = b'hello ' * 1000
+        self.assertEqual(
+            gzip.decompress(compress(message_body, 'gzip')), message_body
+        )
+        self.assertEqual(
+            zlib.decompress(compress(message_body, 'deflate')), message_body
+        )
+
+        # Compression is deterministic.
+        self.assertEqual(
+            compress(message_body, 'gzip'), compress(message_body, 'gzip')
+        )
+
+    def test_compress_response(self) -> None:
+        message_body = b'hello ' * 1000
+        response = compress_response(
+            self.get_request('gzip'),
+            Response(200, ('text', 'plain'), message_body)
+        )
+        self.assertEqual(response, Response(
+            200,
+            ('text', 'plain'),
+            compress(message_body, 'gzip'),
+            [('Vary', 'Accept-Encoding'), ('Content-Encoding', 'gzip')]
+        ))
+
+        response = compress_response(
+            self.get_request(None),
+            Response(200, ('text', 'plain'), message_body)
+        )
+        self.assertEqual(response, Response(
+            200,
+            ('text', 'plain'),
+            message_body,
+            [('Vary', 'Accept-Encoding')]
+        ))
+
+    def test_compress_response_incompressible(self) -> None:
+        for response in (
+                Response(200, ('text', 'plain'), b'short'),
+                Response(200, ('image', 'png'), b'x' * MIN_LENGTH),
+                Response(404)):
+            with self.subTest(response=response):
+                self.assertIs(
+                    compress_response(self.get_request('gzip'), response),
+                    response
+                )
+
+    def test_compress_chunks(self) -> None:
+        chunks = [
+            b'hello ' * 1000, 'world ' * 1000, b''
+        ]  # type: List[Union[bytes, str]]
+        self.assertEqual(
+            gzip.decompress(b''.join(compress_chunks(chunks, 'gzip'))),
+            b''.join(chunk if isinstance(chunk, bytes) else chunk.encode()
+                     for chunk in chunks)
+        )
+
+    def test_compress_streaming_response(self) -> None:
+        response = compress_response(
+            self.get_request('deflate'),
+            StreamingResponse(200, ('text', 'html'), iter(['<p>hi</p>']))
+        )
+        assert isinstance(response, StreamingResponse)
+        self.assertEqual(
+            response.headers,
+            (('Vary', 'Accept-Encoding'), ('Content-Encoding', 'deflate'))
+        )
+        # Compressed chunks are always bytes.
+        self.assertEqual(
+            zlib.decompress(b''.join(cast(Iterable[bytes], response.chunks))),
+            b'<p>hi</p>'
+        )
+
+    def test_get_variant_etag(self) -> None:
+        self.assertEqual(get_variant_etag('"abc"', 'gzip'), '"abc-gzip"')
+
+    @staticmethod
+    def get_request(accept_encoding: str = None) -> Request:
+        headers = ''
+        if accept_encoding is not None:
+            headers = 'Accept-Encoding: {}\r\n'.format(accept_encoding)
+        request = parse('GET / HTTP/1.1\r\n{}\r\n'.format(headers))
+        assert request is not None
+        return request
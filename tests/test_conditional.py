@@ -0,0 +1,118 @@
+import email.utils
+import os
+import tempfile
+import unittest
+from typing import Tuple
+
+from http_server.conditional import get_validators, is_not_modified
+from http_server.conditional import is_range_current
+from http_server.requests import parse, Request
+from http_server.tokens import GET_METHOD, HEAD_METHOD, POST_METHOD
+from http_server.tokens import PUT_METHOD
+
+
+class ConditionalTestCase(unittest.TestCase):
+
+    ETAG = '"abc-3-1"'
+    LAST_MODIFIED = 1000000000.0
+
+    def test_get_validators(self) -> None:
+        with tempfile.NamedTemporaryFile() as temp_file:
+            temp_file.write(b'foo')
+            temp_file.flush()
+            file_stat = os.stat(temp_file.name)
+
+            validators = dict(get_validators(file_stat))
+            self.assertEqual(validators, dict(get_validators(file_stat)))
+            self.assertEqual(
+                validators['ETag'],
+                '"{:x}-3-{:x}"'.format(
+                    file_stat.st_ino, file_stat.st_mtime_ns
+                )
+            )
+            self.assertEqual(
+                validators['Last-Modified'],
+                email.utils.formatdate(file_stat.st_mtime, usegmt=True)
+            )
+
+    def test_unconditional(self) -> None:
+        self.assertFalse(self.is_not_modified())
+
+    def test_if_none_match(self) -> None:
+        self.assertTrue(self.is_not_modified(('If-None-Match', self.ETAG)))
+        self.assertTrue(self.is_not_modified(('If-None-Match', '*')))
+        self.assertTrue(self.is_not_modified(
+            ('If-None-Match', '"foo", W/{}'.format(self.ETAG))
+        ))
+        self.assertFalse(self.is_not_modified(('If-None-Match', '"foo"')))
+
+    def test_if_modified_since(self) -> None:
+        self.assertTrue(self.is_not_modified(
+            ('If-Modified-Since', self.format_date(self.LAST_MODIFIED))
+        ))
+        self.assertTrue(self.is_not_modified(
+            ('If-Modified-Since', self.format_date(self.LAST_MODIFIED + 60))
+        ))
+        self.assertFalse(self.is_not_modified(
+            ('If-Modified-Since', self.format_date(self.LAST_MODIFIED - 60))
+        ))
+        self.assertFalse(self.is_not_modified(
+            ('If-Modified-Since', 'not a date')
+        ))
+
+    def test_if_modified_since_method(self) -> None:
+        header = ('If-Modified-Since', self.format_date(self.LAST_MODIFIED))
+        for method, expected in ((HEAD_METHOD, True), (POST_METHOD, False),
+                                 (PUT_METHOD, False)):
+            with self.subTest(method=method):
+                self.assertEqual(
+                    is_not_modified(
+                        self.get_request(header, method=method), self.ETAG,
+                        self.LAST_MODIFIED
+                    ),
+                    expected
+                )
+
+    def test_if_none_match_precedence(self) -> None:
+        self.assertFalse(self.is_not_modified(
+            ('If-None-Match', '"foo"'),
+            ('If-Modified-Since', self.format_date(self.LAST_MODIFIED))
+        ))
+
+    def test_is_range_current(self) -> None:
+        for headers, expected in (
+                ((), True),
+                ((('If-Range', self.ETAG),), True),
+                ((('If-Range', '"foo"'),), False),
+                ((('If-Range', 'W/' + self.ETAG),), False),
+                ((('If-Range', self.format_date(self.LAST_MODIFIED)),), True),
+                ((('If-Range', self.format_date(self.LAST_MODIFIED - 1)),),
+                 False)):
+            with self.subTest(headers=headers):
+                self.assertEqual(
+                    is_range_current(
+                        self.get_request(*headers),
+                        self.ETAG,
+                        self.LAST_MODIFIED
+                    ),
+                    expected
+                )
+
+    def is_not_modified(self, *headers: Tuple[str, str]) -> bool:
+        return is_not_modified(
+            self.get_request(*headers), self.ETAG, self.LAST_MODIFIED
+        )
+
+    @staticmethod
+    def get_request(
+            *headers: Tuple[str, str],
+            method: str = GET_METHOD) -> Request:
+        request = parse('{} / HTTP/1.1\r\n{}\r\n'.format(method, ''.join(
+            '{}: {}\r\n'.format(name, value) for name, value in headers
+        )))
+        assert request is not None
+        return request
+
+    @staticmethod
+    def format_date(timestamp: float) -> str:
+        return email.utils.formatdate(timestamp, usegmt=True)
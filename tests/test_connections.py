@@ -0,0 +1,400 @@
+import socket
+import threading
+import time
+import unittest
+
+from http_server.bodies import EMPTY_BODY, RequestBody
+from http_server.connections import ConnectionReader, RequestError
+from http_server.requests import Headers, parse
+from http_server.tokens import GET_METHOD, HTTP_VERSION, CRLF
+
+
+class ConnectionReaderTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._server, self._client = socket.socketpair()
+        self._server.settimeout(1)
+
+    def tearDown(self) -> None:
+        self._server.close()
+        self._client.close()
+
+    def test_read_request(self) -> None:
+        request = self.get_request('/foo')
+        self._client.sendall(request)
+        reader = ConnectionReader(self._server)
+        self.assertEqual(reader.read_request(), request)
+
+    def test_read_request_split(self) -> None:
+        # Send the request one byte at a time, so that the reader receives it
+        # in many separate pieces.
+        request = self.get_request('/foo', 'Host: localhost')
+
+        def send() -> None:
+            for i in range(len(request)):
+                self._client.sendall(request[i:i + 1])
+                time.sleep(0.001)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        reader = ConnectionReader(self._server)
+        self.assertEqual(reader.read_request(), request)
+        sender.join()
+
+    def test_read_request_pipelined(self) -> None:
+        requests = tuple(
+            self.get_request('/' + uri) for uri in ('foo', 'bar', 'baz')
+        )
+        self._client.sendall(b''.join(requests))
+        reader = ConnectionReader(self._server)
+        for request in requests:
+            self.assertEqual(reader.read_request(), request)
+
+    def test_read_request_pipelined_compact(self) -> None:
+        # The requests don't fit in the buffer together, so the reader must
+        # move the unconsumed data to make room.
+        requests = tuple(
+            self.get_request('/' + uri * 20) for uri in ('foo', 'bar', 'baz')
+        )
+        self._client.sendall(b''.join(requests))
+        reader = ConnectionReader(self._server, max_headers_length=128)
+        for request in requests:
+            self.assertEqual(reader.read_request(), request)
+
+    def test_request_started(self) -> None:
+        # The time spent waiting for the first byte of a request isn't
+        # counted, but the time spent waiting for the rest of it is.
+        request = self.get_request('/foo')
+
+        def send() -> None:
+            time.sleep(0.2)
+            self._client.sendall(request[:5])
+            time.sleep(0.1)
+            self._client.sendall(request[5:])
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        reader = ConnectionReader(self._server)
+        start = time.perf_counter()
+        self.assertEqual(reader.read_request(), request)
+        end = time.perf_counter()
+        sender.join()
+        self.assertGreater(reader.request_started - start, 0.15)
+        self.assertGreater(end - reader.request_started, 0.05)
+
+    def test_read_request_closed(self) -> None:
+        self._client.sendall(self.get_request('/foo')[:-1])
+        self._client.close()
+        reader = ConnectionReader(self._server)
+        self.assertIsNone(reader.read_request())
+
+    def test_read_request_timeout(self) -> None:
+        self._server.settimeout(0.1)
+        reader = ConnectionReader(self._server)
+        with self.assertRaises(socket.timeout):
+            reader.read_request()
+
+    def test_request_line_too_long(self) -> None:
+        self._client.sendall(self.get_request('/' + 'a' * 100))
+        reader = ConnectionReader(self._server, max_request_line_length=64)
+        self.assertEqual(self.get_status_code(reader), 414)
+
+    def test_request_line_too_long_incomplete(self) -> None:
+        self._client.sendall(b'GET /' + b'a' * 100)
+        reader = ConnectionReader(self._server, max_request_line_length=64)
+        self.assertEqual(self.get_status_code(reader), 414)
+
+    def test_request_line_max_length(self) -> None:
+        request = self.get_request('/' + 'a' * 50)
+        self._client.sendall(request)
+        line_length = request.index(CRLF.encode())
+        reader = ConnectionReader(
+            self._server, max_request_line_length=line_length
+        )
+        self.assertEqual(reader.read_request(), request)
+
+    def test_invalid_request_line(self) -> None:
+        # The request line is rejected as soon as it arrives, without
+        # waiting for the headers.
+        for line, expected in (('GET foo HTTP/1.1', 400),
+                               ('PATCH / HTTP/1.1', 501),
+                               ('GET / HTTP/1.0', 505)):
+            with self.subTest(line=line):
+                server, client = socket.socketpair()
+                with server, client:
+                    server.settimeout(1)
+                    client.sendall((line + CRLF + 'Host: x').encode())
+                    reader = ConnectionReader(server, header_timeout=None)
+                    with self.assertRaises(RequestError) as context:
+                        reader.read_request()
+                    self.assertEqual(
+                        (context.exception.status_code,
+                         context.exception.request_line),
+                        (expected, line.encode())
+                    )
+
+    def test_invalid_request_line_prefix(self) -> None:
+        # Garbage, such as a TLS handshake, is rejected at its first byte.
+        self._client.sendall(b'\x16\x03\x01\x02\x00\x01')
+        reader = ConnectionReader(self._server, header_timeout=None)
+        self.assertEqual(self.get_status_code(reader), 400)
+
+    def test_invalid_pipelined_request(self) -> None:
+        request = self.get_request('/foo')
+        self._client.sendall(request + b'\x00')
+        reader = ConnectionReader(self._server, header_timeout=None)
+        self.assertEqual(reader.read_request(), request)
+        self.assertEqual(self.get_status_code(reader), 400)
+
+    def test_headers_too_long(self) -> None:
+        self._client.sendall(self.get_request('/', 'Cookie: ' + 'a' * 200))
+        reader = ConnectionReader(self._server, max_headers_length=128)
+        self.assertEqual(self.get_status_code(reader), 431)
+
+    def test_header_timeout(self) -> None:
+        # Once a request has started to arrive, the rest of it must arrive
+        # within the header timeout, however long the connection may be idle
+        # between requests.
+        self._client.sendall(b'GET / HTTP/1.1\r\n')
+        reader = ConnectionReader(self._server, header_timeout=0.1)
+        start = time.monotonic()
+        self.assertEqual(self.get_status_code(reader), 408)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_header_timeout_trickle(self) -> None:
+        # A client that keeps sending a byte at a time still has to finish
+        # within the timeout, which is extended by a second for every
+        # min_rate bytes received.
+        request = self.get_request('/foo', 'Host: localhost')
+        stop = threading.Event()
+
+        def send() -> None:
+            for i in range(len(request)):
+                if stop.wait(0.02):
+                    return
+                self._client.sendall(request[i:i + 1])
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        reader = ConnectionReader(
+            self._server, header_timeout=0.2, min_rate=1000
+        )
+        self.assertEqual(self.get_status_code(reader), 408)
+        stop.set()
+        sender.join()
+
+        self._client.close()
+        self._server.close()
+        self._server, self._client = socket.socketpair()
+        self._server.settimeout(1)
+        stop.clear()
+        sender = threading.Thread(target=send)
+        sender.start()
+        reader = ConnectionReader(
+            self._server, header_timeout=0.2, min_rate=10
+        )
+        self.assertEqual(reader.read_request(), request)
+        sender.join()
+
+    def test_idle_timeout_restored(self) -> None:
+        # The reader waits for each request for as long as the connection's
+        # timeout when the reader was created, even after reading a request
+        # under the header timeout has changed it.
+        request = self.get_request('/foo')
+        self._client.sendall(request[:5])
+
+        def send() -> None:
+            time.sleep(0.05)
+            self._client.sendall(request[5:])
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        self._server.settimeout(0.2)
+        reader = ConnectionReader(self._server, header_timeout=5)
+        self.assertEqual(reader.read_request(), request)
+        sender.join()
+
+        start = time.monotonic()
+        with self.assertRaises(socket.timeout):
+            reader.read_request()
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_get_body(self) -> None:
+        request = self.get_request('/foo', 'Content-Length: 10')
+        self._client.sendall(request + b'0123')
+
+        def send() -> None:
+            time.sleep(0.05)
+            self._client.sendall(b'456789' + request)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        reader = ConnectionReader(self._server)
+        body = self.get_body(reader, request)
+        self.assertEqual(body.length, 10)
+        self.assertEqual(body.read(), b'0123456789')
+        self.assertTrue(body.complete)
+        self.assertEqual(reader.read_request(), request)
+        sender.join()
+
+    def test_get_body_empty(self) -> None:
+        for headers in ((), ('Content-Length: 0',)):
+            with self.subTest(headers=headers):
+                request = self.get_request('/foo', *headers)
+                self._client.sendall(request)
+                reader = ConnectionReader(self._server)
+                self.assertIs(self.get_body(reader, request), EMPTY_BODY)
+
+    def test_get_body_chunked(self) -> None:
+        request = self.get_request('/foo', 'Transfer-Encoding: chunked')
+        chunks = (
+            b'5;ext=1\r\nhello\r\n6 \r\n world\r\nA\r\n0123456789\r\n'
+            b'0\r\nX-Trailer: 1\r\n\r\n'
+        )
+
+        def send() -> None:
+            # Send the body a few bytes at a time, so that its chunks are
+            # split between receives.
+            for i in range(0, len(chunks), 3):
+                self._client.sendall(chunks[i:i + 3])
+                time.sleep(0.001)
+            self._client.sendall(request)
+
+        self._client.sendall(request)
+        sender = threading.Thread(target=send)
+        sender.start()
+        reader = ConnectionReader(self._server)
+        body = self.get_body(reader, request)
+        self.assertIsNone(body.length)
+        self.assertEqual(body.read(3), b'hel')
+        self.assertEqual(body.read(), b'lo world0123456789')
+        self.assertTrue(body.complete)
+        self.assertEqual(reader.read_request(), request)
+        sender.join()
+
+    def test_get_body_invalid(self) -> None:
+        for headers, expected in (
+                (('Content-Length: x',), 400),
+                (('Content-Length: 1', 'Content-Length: 1'), 400),
+                (('Content-Length: 1', 'Transfer-Encoding: chunked'), 400),
+                (('Content-Length: 33',), 413),
+                (('Transfer-Encoding: gzip, chunked',), 501)):
+            with self.subTest(headers=headers):
+                request = self.get_request('/foo', *headers)
+                reader = ConnectionReader(self._server)
+                with self.assertRaises(RequestError) as context:
+                    reader.get_body(self.get_headers(request), 32)
+                self.assertEqual(context.exception.status_code, expected)
+
+    def test_get_body_invalid_chunked(self) -> None:
+        for chunks, expected in ((b'x\r\n', 400),
+                                 (b'5\r\nhelloX\r\n', 400),
+                                 (b'21\r\n', 413),
+                                 (b'0\r\nX: ' + b'x' * 100 + b'\r\n', 431)):
+            with self.subTest(chunks=chunks):
+                server, client = socket.socketpair()
+                with server, client:
+                    server.settimeout(1)
+                    request = self.get_request(
+                        '/foo', 'Transfer-Encoding: chunked'
+                    )
+                    client.sendall(request + chunks)
+                    reader = ConnectionReader(server, max_headers_length=100)
+                    body = self.get_body(reader, request)
+                    with self.assertRaises(RequestError) as context:
+                        body.read()
+                    self.assertEqual(context.exception.status_code, expected)
+
+    def test_get_body_timeout(self) -> None:
+        request = self.get_request('/foo', 'Content-Length: 10')
+        self._client.sendall(request + b'01234')
+        reader = ConnectionReader(self._server, body_timeout=0.1)
+        body = self.get_body(reader, request)
+        with self.assertRaises(RequestError) as context:
+            body.read()
+        self.assertEqual(context.exception.status_code, 408)
+
+    def test_get_body_closed(self) -> None:
+        request = self.get_request('/foo', 'Content-Length: 10')
+        self._client.sendall(request + b'01234')
+        self._client.close()
+        reader = ConnectionReader(self._server)
+        body = self.get_body(reader, request)
+        with self.assertRaises(RequestError) as context:
+            body.read()
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_expect_continue(self) -> None:
+        request = self.get_request(
+            '/foo', 'Content-Length: 5', 'Expect: 100-continue'
+        )
+        self._client.sendall(request)
+        reader = ConnectionReader(self._server)
+        body = self.get_body(reader, request)
+        # Nothing is sent until the body is read.
+        self._client.setblocking(False)
+        with self.assertRaises(BlockingIOError):
+            self._client.recv(1024)
+        self._client.setblocking(True)
+
+        self._client.sendall(b'hello')
+        self.assertEqual(body.read(), b'hello')
+        self.assertEqual(
+            self._client.recv(1024),
+            (HTTP_VERSION + ' 100 Continue' + CRLF + CRLF).encode()
+        )
+
+    def test_finish_body(self) -> None:
+        request = self.get_request('/foo', 'Content-Length: 10')
+        self._client.sendall(request + b'0123456789' + request)
+        reader = ConnectionReader(self._server)
+        body = self.get_body(reader, request)
+        self.assertEqual(body.read(3), b'012')
+        self.assertTrue(reader.finish_body(body))
+        self.assertEqual(reader.read_request(), request)
+        self.assertTrue(reader.finish_body(EMPTY_BODY))
+
+    def test_finish_body_timeout(self) -> None:
+        request = self.get_request('/foo', 'Content-Length: 10')
+        self._client.sendall(request + b'01234')
+        reader = ConnectionReader(self._server, body_timeout=0.1)
+        body = self.get_body(reader, request)
+        with self.assertRaises(RequestError) as context:
+            reader.finish_body(body)
+        self.assertEqual(context.exception.status_code, 408)
+
+    def test_finish_body_awaiting_continue(self) -> None:
+        # The client is waiting to be told to send the body, so it's unknown
+        # whether it will send it.
+        request = self.get_request(
+            '/foo', 'Content-Length: 10', 'Expect: 100-continue'
+        )
+        self._client.sendall(request)
+        reader = ConnectionReader(self._server)
+        self.assertFalse(reader.finish_body(self.get_body(reader, request)))
+
+    def get_body(self, reader: ConnectionReader, request: bytes) -> RequestBody:  # noqa: E501
+        # Read a request sent by the client, and get its body.
+        self.assertEqual(reader.read_request(), request)
+        return reader.get_body(self.get_headers(request), 32)
+
+    @staticmethod
+    def get_headers(request: bytes) -> Headers:
+        parsed = parse(request)
+        assert parsed is not None
+        return parsed.headers
+
+    @staticmethod
+    def get_status_code(reader: ConnectionReader) -> int:
+        try:
+            reader.read_request()
+        except RequestError as error:
+            return error.status_code
+        raise AssertionError('RequestError not raised')
+
+    @staticmethod
+    def get_request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
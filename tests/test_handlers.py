@@ -1,9 +1,13 @@
+import asyncio
 import unittest
 
-from http_server.handlers import create_handler
+from http_server.handlers import create_async_handler, create_handler
+from http_server.handlers import Router
 from http_server.requests import parse, Request
-from http_server.responses import Response
-from http_server.tokens import GET_METHOD, HTTP_VERSION, CRLF
+from http_server.response_cache import ResponseCache
+from http_server.responses import Response, get_error_response
+from http_server.tokens import DELETE_METHOD, GET_METHOD, HEAD_METHOD
+from http_server.tokens import POST_METHOD, HTTP_VERSION, CRLF
 
 
 class HandlersTestCase(unittest.TestCase):
@@ -31,12 +35,29 @@ class HandlersTestCase(unittest.TestCase):
             wrapped_handler(request_str.encode()), response_str
         )
 
+    def test_handler_cache(self) -> None:
+        calls = []
+
+        def custom_handler(request: Request) -> Response:
+            calls.append(request.uri)
+            return Response(200, ('text', 'plain'), 'hello')
+
+        cache = ResponseCache()
+        wrapped_handler = create_handler(custom_handler, cache=cache)
+        request_bytes = '{} /hello {}{}'.format(
+            GET_METHOD, HTTP_VERSION, CRLF
+        ).encode()
+        response = wrapped_handler(request_bytes)
+        self.assertEqual(wrapped_handler(request_bytes), response)
+        self.assertEqual(calls, [['hello']])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
     def test_handler_code_500(self) -> None:
         def custom_handler(request: Request) -> Response:
             raise Exception()
 
         request = Request(GET_METHOD, [''], HTTP_VERSION)
-        response = Response(500)
+        response = get_error_response(500)
 
         with self.assertRaises(Exception):
             custom_handler(request)
@@ -46,9 +67,11 @@ class HandlersTestCase(unittest.TestCase):
         request_str = '{} / {}{}'.format(GET_METHOD, HTTP_VERSION, CRLF)
         response_str = response.get_bytes()
 
-        self.assertEqual(
-            wrapped_handler(request_str.encode()), response_str
-        )
+        with self.assertLogs('http_server', 'ERROR') as logs:
+            self.assertEqual(
+                wrapped_handler(request_str.encode()), response_str
+            )
+        self.assertIn('Handler failed to respond to GET /', logs.output[0])
 
     def test_handler_code_400(self) -> None:
         response_200 = Response(200, ('text', 'plain'), '')
@@ -67,6 +90,194 @@ class HandlersTestCase(unittest.TestCase):
         bad_request_str = '{}/ {}{}'.format(GET_METHOD, HTTP_VERSION, CRLF)
         self.assertIsNone(parse(bad_request_str))
         self.assertEqual(
-            Response(400).get_bytes(),
+            get_error_response(400).get_bytes(),
             custom_handler(bad_request_str.encode())
         )
+
+    def test_handler_code_501_505(self) -> None:
+        wrapped_handler = create_handler(
+            lambda request: Response(200, ('text', 'plain'), 'hello')
+        )
+        for request_str, status_code in (
+                ('PATCH / {}{}'.format(HTTP_VERSION, CRLF), 501),
+                ('{} / HTTP/1.0{}'.format(GET_METHOD, CRLF), 505)):
+            with self.subTest(request_str=request_str):
+                self.assertEqual(
+                    wrapped_handler(request_str.encode()),
+                    get_error_response(status_code).get_bytes()
+                )
+
+    def test_handler_methods(self) -> None:
+        def custom_handler(request: Request) -> Response:
+            return Response(200, ('text', 'plain'), request.method)
+
+        wrapped_handler = create_handler(custom_handler)
+        self.assertEqual(wrapped_handler.methods, (GET_METHOD, HEAD_METHOD))
+        self.assertEqual(
+            wrapped_handler(self.get_request_bytes(POST_METHOD)),
+            get_error_response(405).get_bytes()
+        )
+
+        wrapped_handler = create_handler(
+            custom_handler, methods=(GET_METHOD, POST_METHOD)
+        )
+        self.assertEqual(
+            wrapped_handler.methods, (GET_METHOD, POST_METHOD, HEAD_METHOD)
+        )
+        self.assertEqual(
+            wrapped_handler(self.get_request_bytes(POST_METHOD)),
+            Response(200, ('text', 'plain'), POST_METHOD).get_bytes()
+        )
+        self.assertEqual(
+            wrapped_handler(self.get_request_bytes(DELETE_METHOD)),
+            (HTTP_VERSION + ' 405 Method Not Allowed' + CRLF
+             + 'Allow: GET, POST, HEAD' + CRLF
+             + 'Content-Length: 0' + CRLF + CRLF).encode()
+        )
+
+    def test_handler_head(self) -> None:
+        # The handler function sees HEAD, but only the head of its response
+        # is sent.
+        def custom_handler(request: Request) -> Response:
+            return Response(200, ('text', 'plain'), request.method)
+
+        wrapped_handler = create_handler(custom_handler)
+        self.assertEqual(
+            wrapped_handler(self.get_request_bytes(HEAD_METHOD)),
+            Response(200, ('text', 'plain'), HEAD_METHOD).get_head()
+        )
+
+    def test_async_handler(self) -> None:
+        async def custom_handler(request: Request) -> Response:
+            await asyncio.sleep(0)
+            message_body = 'You requested URI {}'.format(request.uri)
+            return Response(200, ('text', 'plain'), message_body)
+
+        wrapped_handler = create_async_handler(custom_handler)
+
+        request_str = (
+            '{} /hello/world {}{}'.format(GET_METHOD, HTTP_VERSION, CRLF)
+        )
+        response = Response(
+            200, ('text', 'plain'), "You requested URI ['hello', 'world']"
+        )
+
+        self.assertEqual(
+            asyncio.run(wrapped_handler(request_str.encode())),
+            response.get_bytes()
+        )
+
+    def test_async_handler_code_400_500(self) -> None:
+        async def custom_handler(request: Request) -> Response:
+            raise Exception()
+
+        wrapped_handler = create_async_handler(custom_handler)
+
+        good_request_str = '{} / {}{}'.format(GET_METHOD, HTTP_VERSION, CRLF)
+        with self.assertLogs('http_server', 'ERROR'):
+            self.assertEqual(
+                asyncio.run(wrapped_handler(good_request_str.encode())),
+                get_error_response(500).get_bytes()
+            )
+
+        bad_request_str = '{}/ {}{}'.format(GET_METHOD, HTTP_VERSION, CRLF)
+        self.assertEqual(
+            asyncio.run(wrapped_handler(bad_request_str.encode())),
+            get_error_response(400).get_bytes()
+        )
+
+    def test_router(self) -> None:
+        router = Router()
+
+        @router.route('/')
+        def home(request: Request) -> Response:
+            return Response(200, ('text', 'plain'), 'home')
+
+        @router.route('/users/{id}')
+        def user(request: Request, id: str) -> Response:
+            return Response(200, ('text', 'plain'), 'user ' + id)
+
+        @router.route('/users/me')
+        def me(request: Request) -> Response:
+            return Response(200, ('text', 'plain'), 'me')
+
+        @router.route('/users/{id}/posts/{post}')
+        def post(request: Request, id: str, post: str) -> Response:
+            return Response(200, ('text', 'plain'), id + ' ' + post)
+
+        @router.route('/static/{path*}')
+        def static(request: Request, path: str) -> Response:
+            return Response(200, ('text', 'plain'), 'static ' + path)
+
+        handler = create_handler(router)
+        for uri, expected in (
+                ('/', 'home'),
+                ('/users/42', 'user 42'),
+                ('/users/me', 'me'),
+                ('/users/42/posts/7', '42 7'),
+                ('/static', 'static '),
+                ('/static/js/pong.js', 'static js/pong.js'),
+                ('/static/js/', 'static js/')):
+            with self.subTest(uri=uri):
+                request_str = '{} {} {}{}'.format(
+                    GET_METHOD, uri, HTTP_VERSION, CRLF
+                )
+                self.assertEqual(
+                    handler(request_str.encode()),
+                    Response(200, ('text', 'plain'), expected).get_bytes()
+                )
+
+        for uri in ('/users', '/users/', '/users/42/posts', '/foo'):
+            with self.subTest(uri=uri):
+                request_str = '{} {} {}{}'.format(
+                    GET_METHOD, uri, HTTP_VERSION, CRLF
+                )
+                self.assertEqual(
+                    handler(request_str.encode()),
+                    get_error_response(404).get_bytes()
+                )
+
+    def test_router_get_route(self) -> None:
+        router = Router()
+        router.add_route('/users/{id}', lambda request, id: Response(200))
+        router.add_route('/{path*}', lambda request, path: Response(200))
+        for uri, expected in (('/users/42', '/users/{id}'),
+                              ('/users', '/{path*}'),
+                              ('/', '/{path*}')):
+            with self.subTest(uri=uri):
+                request = parse('{} {} {}{}'.format(
+                    GET_METHOD, uri, HTTP_VERSION, CRLF
+                ))
+                assert request is not None
+                self.assertEqual(router.get_route(request), expected)
+
+        request = parse('{} / {}{}'.format(GET_METHOD, HTTP_VERSION, CRLF))
+        assert request is not None
+        self.assertIsNone(Router().get_route(request))
+
+    def test_router_backtracking(self) -> None:
+        router = Router()
+        router.add_route('/a/b/c', lambda request: Response(200))
+        router.add_route('/a/{x}/d', lambda request, x: Response(200))
+        router.add_route('/{rest*}', lambda request, rest: Response(200))
+
+        match = router.match(['a', 'b', 'd'])
+        assert match is not None
+        self.assertEqual(match[1], {'x': 'b'})
+
+        match = router.match(['a', 'b', 'e'])
+        assert match is not None
+        self.assertEqual(match[1], {'rest': 'a/b/e'})
+
+    def test_router_invalid_patterns(self) -> None:
+        router = Router()
+        router.add_route('/users/{id}', lambda request, id: Response(200))
+        for pattern in ('users', '/{path*}/foo', '/foo{id}', '/{1}',
+                        '/users/{name}'):
+            with self.subTest(pattern=pattern):
+                with self.assertRaises(ValueError):
+                    router.add_route(pattern, lambda request: Response(200))
+
+    @staticmethod
+    def get_request_bytes(method: str) -> bytes:
+        return '{} / {}{}'.format(method, HTTP_VERSION, CRLF).encode()
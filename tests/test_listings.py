@@ -0,0 +1,187 @@
+import os
+import tempfile
+import time
+import unittest
+from typing import List, Optional
+
+from http_server.listings import get_listing_options, get_page
+from http_server.listings import DirectoryEntry, DirectoryListingCache
+from http_server.listings import ListingOptions
+from http_server.listings import MTIME_SORT, NAME_SORT, SIZE_SORT
+from http_server.requests import parse
+from http_server.tokens import GET_METHOD, HTTP_VERSION, CRLF
+
+
+class DirectoryListingCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = self._dir.name
+        for name, size in (('b', 3), ('c', 1), ('a', 2)):
+            with open(os.path.join(self._path, name), 'wb') as f:
+                f.write(b'x' * size)
+        os.mkdir(os.path.join(self._path, 'd'))
+        self.set_old_mtime(self._path)
+
+    def tearDown(self) -> None:
+        self._dir.cleanup()
+
+    def test_hit_miss(self) -> None:
+        cache = DirectoryListingCache()
+        entries = cache.get(self._path)
+        self.assertEqual(entries, [
+            DirectoryEntry('a', False),
+            DirectoryEntry('b', False),
+            DirectoryEntry('c', False),
+            DirectoryEntry('d', True)
+        ])
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        self.assertIs(cache.get(self._path), entries)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual((len(cache), cache.entry_count), (1, 4))
+
+    def test_not_a_directory(self) -> None:
+        cache = DirectoryListingCache()
+        self.assertIsNone(cache.get(os.path.join(self._path, 'a')))
+        self.assertIsNone(cache.get(os.path.join(self._path, 'missing')))
+        self.assertEqual(len(cache), 0)
+
+    def test_revalidate_modified(self) -> None:
+        cache = DirectoryListingCache(revalidate_interval=0)
+        cache.get(self._path)
+        self.assertIsNotNone(cache.get(self._path))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        open(os.path.join(self._path, 'e'), 'w').close()
+        self.set_old_mtime(self._path, 10)
+        self.assertEqual(self.get_names(cache.get(self._path)), list('abcde'))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_revalidate_interval(self) -> None:
+        cache = DirectoryListingCache(revalidate_interval=60)
+        cache.get(self._path)
+        open(os.path.join(self._path, 'e'), 'w').close()
+        self.set_old_mtime(self._path, 10)
+        self.assertEqual(self.get_names(cache.get(self._path)), list('abcd'))
+
+    def test_revalidate_racy(self) -> None:
+        # A directory modified just before it was read is read again when it
+        # is revalidated, even if its modification time hasn't changed.
+        os.utime(self._path)
+        cache = DirectoryListingCache(revalidate_interval=0)
+        cache.get(self._path)
+        cache.get(self._path)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+        self.set_old_mtime(self._path)
+        cache.get(self._path)
+        cache.get(self._path)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+    def test_revalidate_deleted(self) -> None:
+        path = os.path.join(self._path, 'd')
+        cache = DirectoryListingCache(revalidate_interval=0)
+        self.assertEqual(cache.get(path), [])
+        os.rmdir(path)
+        self.assertIsNone(cache.get(path))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self) -> None:
+        paths = [os.path.join(self._path, name) for name in ('x', 'y', 'z')]
+        for path in paths:
+            os.mkdir(path)
+            for name in ('1', '2'):
+                open(os.path.join(path, name), 'w').close()
+            self.set_old_mtime(path)
+        cache = DirectoryListingCache(max_entries=5)
+
+        cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])  # Now paths[1] is the least recently used.
+        cache.get(paths[2])
+        self.assertEqual(
+            (len(cache), cache.entry_count, cache.evictions), (2, 4, 1)
+        )
+
+        cache.get(paths[1])
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+    def test_large_directory(self) -> None:
+        cache = DirectoryListingCache(max_entries=3)
+        self.assertEqual(len(cache.get(self._path) or []), 4)
+        self.assertEqual(len(cache), 0)
+
+    def test_sort(self) -> None:
+        os.utime(os.path.join(self._path, 'c'), (0, 0))
+        cache = DirectoryListingCache()
+        self.assertEqual(
+            self.get_names(cache.get(self._path, NAME_SORT, True)),
+            list('dcba')
+        )
+        # The directory's size depends on the filesystem, so it isn't
+        # compared.
+        self.assertEqual(
+            [name for name in self.get_names(cache.get(self._path, SIZE_SORT))
+             if name != 'd'],
+            list('cab')
+        )
+        self.assertEqual(
+            self.get_names(cache.get(self._path, MTIME_SORT))[0], 'c'
+        )
+
+        entries = cache.get(self._path, SIZE_SORT)
+        self.assertIs(cache.get(self._path, SIZE_SORT), entries)
+        with self.assertRaises(ValueError):
+            cache.get(self._path, 'color')
+
+    @staticmethod
+    def set_old_mtime(path: str, age: float = 60) -> None:
+        # Make a directory look like it was last modified age seconds ago,
+        # so that its listing isn't racy.
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+    @staticmethod
+    def get_names(entries: Optional[List[DirectoryEntry]]) -> List[str]:
+        assert entries is not None
+        return [entry.name for entry in entries]
+
+
+class ListingOptionsTestCase(unittest.TestCase):
+
+    def test_get_listing_options(self) -> None:
+        for query, expected in (
+                ('', ListingOptions()),
+                ('sort=size&order=desc', ListingOptions(SIZE_SORT, True)),
+                ('page=3&per_page=20', ListingOptions(page=3, page_size=20)),
+                ('sort=color&order=up&page=0&per_page=x', ListingOptions()),
+                ('per_page=1000000', ListingOptions(page_size=10000))):
+            with self.subTest(query=query):
+                request = parse('{} /?{} {}{}'.format(
+                    GET_METHOD, query, HTTP_VERSION, CRLF
+                ))
+                assert request is not None
+                self.assertEqual(get_listing_options(request), expected)
+
+    def test_get_query(self) -> None:
+        options = ListingOptions(MTIME_SORT, True, 2, 50)
+        self.assertEqual(
+            options.get_query(), 'sort=mtime&order=desc&page=2&per_page=50'
+        )
+        self.assertEqual(options.get_query(sort=NAME_SORT, page=1),
+                         'order=desc&per_page=50')
+        self.assertEqual(ListingOptions().get_query(), '')
+
+    def test_get_page(self) -> None:
+        entries = [DirectoryEntry(str(i), False) for i in range(5)]
+        page = get_page(entries, ListingOptions(page=2, page_size=2))
+        self.assertEqual(page.entries, entries[2:4])
+        self.assertEqual((page.number, page.count), (2, 3))
+
+        page = get_page(entries, ListingOptions(page=9, page_size=2))
+        self.assertEqual(page.entries, entries[4:])
+        self.assertEqual((page.number, page.count), (3, 3))
+
+        page = get_page([], ListingOptions())
+        self.assertEqual((page.entries, page.number, page.count), ([], 1, 1))
@@ -0,0 +1,182 @@
+import io
+import json
+import logging
+import unittest
+
+from http_server import logs
+from http_server.logs import AccessLog, get_request_line
+from http_server.logs import COMBINED_FORMAT, JSON_FORMAT
+from http_server.requests import parse
+
+
+class AccessLogTestCase(unittest.TestCase):
+
+    _request = parse(
+        b'GET /index.html HTTP/1.1\r\nReferer: http://example.com/\r\n'
+        b'User-Agent: "test"\r\n\r\n'
+    )
+
+    def test_common_format(self) -> None:
+        file = io.StringIO()
+        access_log = AccessLog(file)
+        access_log.log(
+            ('127.0.0.1', 50000), b'GET /index.html HTTP/1.1', 200, 1234,
+            0.001, self._request
+        )
+        access_log.log(('127.0.0.1', 50001), b'', 400)
+        access_log.close()
+
+        lines = file.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertRegex(
+            lines[0],
+            r'^127\.0\.0\.1 - - \[\d\d/\w+/\d{4}(:\d\d){3} [+-]\d{4}\] '
+            r'"GET /index\.html HTTP/1\.1" 200 1234$'
+        )
+        self.assertTrue(lines[1].endswith('] "" 400 -'))
+
+    def test_combined_format(self) -> None:
+        file = io.StringIO()
+        access_log = AccessLog(file, COMBINED_FORMAT)
+        access_log.log(
+            ('127.0.0.1', 50000), b'GET /index.html HTTP/1.1', 200, 1234,
+            0.001, self._request
+        )
+        access_log.log(('127.0.0.1', 50001), b'', 400)
+        access_log.close()
+
+        lines = file.getvalue().splitlines()
+        self.assertTrue(lines[0].endswith(
+            '"GET /index.html HTTP/1.1" 200 1234 "http://example.com/" '
+            '"\\"test\\""'
+        ))
+        self.assertTrue(lines[1].endswith('"" 400 - "-" "-"'))
+
+    def test_json_format(self) -> None:
+        file = io.StringIO()
+        access_log = AccessLog(file, JSON_FORMAT)
+        access_log.log(
+            ('127.0.0.1', 50000), b'GET /index.html HTTP/1.1', 200, 1234,
+            0.0012345678, self._request
+        )
+        access_log.close()
+
+        entry = json.loads(file.getvalue())
+        del entry['time']
+        self.assertEqual(entry, {
+            'remote_addr': '127.0.0.1',
+            'request': 'GET /index.html HTTP/1.1',
+            'status': 200,
+            'body_bytes': 1234,
+            'duration': 0.001235,
+            'referer': 'http://example.com/',
+            'user_agent': '"test"'
+        })
+
+    def test_escaping(self) -> None:
+        file = io.StringIO()
+        access_log = AccessLog(file)
+        access_log.log(
+            ('127.0.0.1', 50000), b'GET /"\\\n\xff HTTP/1.1', 200
+        )
+        access_log.close()
+
+        self.assertIn(
+            '"GET /\\"\\\\\\x0a\\xff HTTP/1.1" 200 -\n', file.getvalue()
+        )
+        self.assertEqual(file.getvalue().count('\n'), 1)
+
+    def test_sampling(self) -> None:
+        file = io.StringIO()
+        access_log = AccessLog(file, sample_rate=0)
+        for status_code in (200, 404, 500, 503):
+            access_log.log(
+                ('127.0.0.1', 50000), b'GET / HTTP/1.1', status_code
+            )
+        access_log.close()
+
+        # Responses with 5xx status codes are always logged.
+        lines = file.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('" 500 -', lines[0])
+        self.assertIn('" 503 -', lines[1])
+
+    def test_full_queue(self) -> None:
+        file = io.StringIO()
+        access_log = AccessLog(file, flush_interval=60, queue_size=3)
+        for i in range(5):
+            access_log.log(
+                ('127.0.0.1', 50000), 'GET /{} HTTP/1.1'.format(i).encode(),
+                200
+            )
+        self.assertEqual(access_log.dropped, 2)
+        self.assertEqual(file.getvalue(), '')
+
+        access_log.flush()
+        self.assertEqual(len(file.getvalue().splitlines()), 3)
+        access_log.log(('127.0.0.1', 50000), b'GET /5 HTTP/1.1', 200)
+        access_log.close()
+        self.assertIn('GET /5', file.getvalue().splitlines()[3])
+
+    def test_background_flush(self) -> None:
+        file = io.StringIO()
+        access_log = AccessLog(file, flush_interval=0.01)
+        access_log.log(('127.0.0.1', 50000), b'GET / HTTP/1.1', 200)
+        for _ in range(100):
+            if file.getvalue():
+                break
+            access_log._closed.wait(0.01)
+        self.assertEqual(len(file.getvalue().splitlines()), 1)
+        access_log.close()
+
+    def test_invalid_arguments(self) -> None:
+        with self.assertRaises(ValueError):
+            AccessLog(log_format='xml')
+        with self.assertRaises(ValueError):
+            AccessLog(sample_rate=1.5)
+
+    def test_get_request_line(self) -> None:
+        self.assertEqual(
+            get_request_line(b'GET / HTTP/1.1\r\nHost: a\r\n\r\n'),
+            b'GET / HTTP/1.1'
+        )
+        self.assertEqual(get_request_line(b'hello'), b'hello')
+        self.assertEqual(len(get_request_line(b'a' * 5000)), 1024)
+
+
+class LogExceptionTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._limiter = logs._exception_limiter
+        logs._exception_limiter = logs._RateLimiter(2, 60)
+
+    def tearDown(self) -> None:
+        logs._exception_limiter = self._limiter
+
+    def test_rate_limit(self) -> None:
+        with self.assertLogs('http_server', logging.ERROR) as captured:
+            for i in range(5):
+                try:
+                    raise ValueError(i)
+                except ValueError:
+                    logs.log_exception('failure {}'.format(i))
+
+        self.assertEqual(len(captured.records), 2)
+        self.assertEqual(
+            [record.getMessage() for record in captured.records],
+            ['failure 0', 'failure 1']
+        )
+        self.assertIn('ValueError: 0', captured.output[0])
+
+        # Once the window has passed, the next exception is logged with the
+        # number that were suppressed.
+        logs._exception_limiter._window_start -= 60
+        with self.assertLogs('http_server', logging.ERROR) as captured:
+            try:
+                raise ValueError()
+            except ValueError:
+                logs.log_exception('failure')
+        self.assertEqual(
+            captured.records[0].getMessage(),
+            'failure (3 more exceptions were not logged)'
+        )
@@ -0,0 +1,46 @@
+import unittest
+
+from http_server.lru import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_max_size(self) -> None:
+        cache = LRUCache(len, max_size=6)  # type: LRUCache[str, str]
+        with cache._lock:
+            cache._put('a', 'aaa')
+            cache._put('b', 'bb')
+            cache._hit('a')
+            cache._put('c', 'cc')  # b is evicted by c.
+            cache._put('d', 'd' * 7)  # Too large to cache.
+        self.assertEqual(list(cache._entries), ['a', 'c'])
+        self.assertEqual(
+            (len(cache), cache.size, cache.hits, cache.evictions),
+            (2, 5, 1, 1)
+        )
+
+    def test_max_entries(self) -> None:
+        cache = LRUCache(len, max_size=100, max_entries=2)  # type: LRUCache[str, str]  # noqa: E501
+        with cache._lock:
+            for key in ('a', 'b', 'c'):
+                cache._put(key, key)
+        self.assertEqual(list(cache._entries), ['b', 'c'])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_replace_remove(self) -> None:
+        cache = LRUCache(len, max_size=100)  # type: LRUCache[str, str]
+        with cache._lock:
+            cache._put('a', 'aa')
+            cache._replace('a', 'other', 'aaaa')  # Already replaced.
+            self.assertEqual((cache._entries['a'], cache.size), ('aa', 2))
+            old_value = cache._entries['a']
+            cache._replace('a', old_value, 'aaaa')
+            self.assertEqual((cache._entries['a'], cache.size), ('aaaa', 4))
+            cache._remove('a')
+            cache._remove('b')
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+        with cache._lock:
+            cache._put('a', 'aa')
+        cache.clear()
+        self.assertEqual((len(cache), cache.size), (0, 0))
@@ -0,0 +1,142 @@
+import unittest
+
+from http_server.metrics import Histogram, Metrics, RequestTimer
+from http_server.metrics import ACCEPT_PHASE, HANDLE_PHASE, PARSE_PHASE
+from http_server.metrics import READ_PHASE, SEND_PHASE, NO_ROUTE
+from http_server.metrics import HEADER_TIMEOUT, WRITE_TIMEOUT
+from http_server.metrics import IN_FLIGHT, QUEUE_FULL
+from http_server.requests import parse, Request
+from http_server.responses import Response
+from http_server.tokens import GET_METHOD, HTTP_VERSION, CRLF
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def test_histogram(self) -> None:
+        histogram = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.sum, 2.65)
+        self.assertEqual(
+            histogram.get_cumulative_counts(),
+            [('0.1', 2), ('1.0', 3), ('+Inf', 4)]
+        )
+
+    def test_observe_request(self) -> None:
+        metrics = Metrics()
+        timer = RequestTimer(10.0)
+        timer.marks = [10.5, 10.75, 12.0, 12.0, 13.0]
+        metrics.observe_request(timer, 200)
+        self.assertEqual(timer.duration, 3.0)
+
+        for phase, expected in ((READ_PHASE, 0.5), (PARSE_PHASE, 0.25),
+                                (HANDLE_PHASE, 1.25), (SEND_PHASE, 1.0)):
+            with self.subTest(phase=phase):
+                histogram = metrics.get_phase(phase)
+                self.assertEqual(histogram.count, 1)
+                self.assertEqual(histogram.sum, expected)
+
+        # A request that failed early has only some of the phases.
+        timer = RequestTimer(10.0)
+        timer.marks = [10.5]
+        metrics.observe_request(timer, 431)
+        self.assertEqual(metrics.get_phase(READ_PHASE).count, 2)
+        self.assertEqual(metrics.get_phase(PARSE_PHASE).count, 1)
+
+        self.assertEqual(metrics.get_request_count(), 2)
+        self.assertEqual(metrics.get_request_count(200), 1)
+        self.assertEqual(metrics.get_request_count(route=NO_ROUTE), 2)
+
+    def test_observe_connection(self) -> None:
+        metrics = Metrics()
+        metrics.observe_connection(0.002)
+        self.assertEqual(metrics.connections, 1)
+        self.assertEqual(metrics.get_phase(ACCEPT_PHASE).sum, 0.002)
+
+    def test_export(self) -> None:
+        metrics = Metrics(lambda request: '/"quoted"\\')
+        timer = RequestTimer(0.0)
+        timer.marks = [0.001, 0.002, 0.003, 0.004, 0.005]
+        metrics.observe_request(
+            timer, 404, metrics.get_route(self.get_request('/foo'))
+        )
+
+        lines = metrics.export().splitlines()
+        self.assertIn('# TYPE http_server_requests_total counter', lines)
+        self.assertIn(
+            'http_server_requests_total'
+            '{route="/\\"quoted\\"\\\\",status="404"} 1',
+            lines
+        )
+        self.assertIn(
+            'http_server_request_duration_seconds_bucket'
+            '{route="/\\"quoted\\"\\\\",status="404",le="0.005"} 1',
+            lines
+        )
+        self.assertIn(
+            'http_server_request_duration_seconds_bucket'
+            '{route="/\\"quoted\\"\\\\",status="404",le="0.0025"} 0',
+            lines
+        )
+        self.assertIn(
+            'http_server_phase_duration_seconds_count{phase="send"} 1', lines
+        )
+        self.assertIn('http_server_connections_total 0', lines)
+
+    def test_observe_timeout(self) -> None:
+        metrics = Metrics()
+        metrics.observe_timeout(HEADER_TIMEOUT)
+        metrics.observe_timeout(HEADER_TIMEOUT)
+        metrics.observe_timeout(WRITE_TIMEOUT)
+        self.assertEqual(metrics.get_timeout_count(HEADER_TIMEOUT), 2)
+        self.assertEqual(metrics.get_timeout_count(WRITE_TIMEOUT), 1)
+
+        lines = metrics.export().splitlines()
+        self.assertIn('# TYPE http_server_timeouts_total counter', lines)
+        for line in (
+                'http_server_timeouts_total{kind="header"} 2',
+                'http_server_timeouts_total{kind="body"} 0',
+                'http_server_timeouts_total{kind="handler"} 0',
+                'http_server_timeouts_total{kind="write"} 1'):
+            with self.subTest(line=line):
+                self.assertIn(line, lines)
+
+    def test_observe_rejection(self) -> None:
+        metrics = Metrics()
+        metrics.observe_rejection(QUEUE_FULL)
+        metrics.observe_rejection(IN_FLIGHT)
+        metrics.observe_rejection(IN_FLIGHT)
+        self.assertEqual(metrics.get_rejection_count(QUEUE_FULL), 1)
+        self.assertEqual(metrics.get_rejection_count(IN_FLIGHT), 2)
+
+        lines = metrics.export().splitlines()
+        self.assertIn('# TYPE http_server_rejections_total counter', lines)
+        for line in (
+                'http_server_rejections_total{reason="queue_full"} 1',
+                'http_server_rejections_total{reason="queue_time"} 0',
+                'http_server_rejections_total{reason="in_flight"} 2'):
+            with self.subTest(line=line):
+                self.assertIn(line, lines)
+
+    def test_wrap(self) -> None:
+        metrics = Metrics(lambda request: '/{path*}')
+        handler_func = metrics.wrap(lambda request: Response(404))
+
+        request = self.get_request('/metrics')
+        response = handler_func(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.message_body, metrics.export().encode())
+        self.assertEqual(metrics.get_route(request), '/metrics')
+
+        request = self.get_request('/metrics/foo')
+        self.assertEqual(handler_func(request).status_code, 404)
+        self.assertEqual(metrics.get_route(request), '/{path*}')
+
+    @staticmethod
+    def get_request(uri: str) -> Request:
+        request = parse('{} {} {}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF, CRLF
+        ))
+        assert request is not None
+        return request
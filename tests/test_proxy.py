@@ -0,0 +1,373 @@
+import re
+import socket
+import threading
+import unittest
+from typing import Callable, Tuple
+from typing import List  # noqa: F401
+
+from attr import evolve
+
+from http_server.connections import ConnectionReader
+from http_server.proxy import Proxy, ProxyResponse
+from http_server.proxy import LEAST_CONNECTIONS, ROUND_ROBIN
+from http_server.requests import parse, Request
+from http_server.responses import get_error_response
+from http_server.server import create_tcp_socket
+from http_server.tokens import GET_METHOD, HEAD_METHOD, POST_METHOD
+from http_server.tokens import HTTP_VERSION, CRLF
+
+
+# Gets the upstream response to a request, and whether to close the
+# connection after sending it.
+_Respond = Callable[[bytes], Tuple[bytes, bool]]
+
+
+class _Upstream:
+    # An upstream server that runs in a thread and records the requests it
+    # receives.
+
+    def __init__(self, respond: _Respond) -> None:
+        self._respond = respond
+        self._listener = create_tcp_socket()
+        self._listener.bind(('127.0.0.1', 0))
+        self._listener.listen(8)
+        self.address = self._listener.getsockname()
+        self.requests = []  # type: List[bytes]
+        self.connection_count = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self) -> None:
+        self._listener.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            self.connection_count += 1
+            threading.Thread(
+                target=self._serve, args=(connection,), daemon=True
+            ).start()
+
+    def _serve(self, connection: socket.socket) -> None:
+        with connection:
+            buffer = b''
+            while True:
+                end = buffer.find(b'\r\n\r\n')
+                if end != -1:
+                    # The request's body, if any, is recorded along with
+                    # its head.
+                    head = buffer[:end + 4].lower()
+                    if b'transfer-encoding: chunked' in head:
+                        body_end = buffer.find(b'\r\n0\r\n\r\n', end)
+                        end = -1 if body_end == -1 else body_end + 3
+                    else:
+                        match = re.search(rb'content-length: ([0-9]+)', head)
+                        if match is not None:
+                            end += int(match.group(1))
+                            if end + 4 > len(buffer):
+                                end = -1
+                if end == -1:
+                    data = connection.recv(4096)
+                    if not data:
+                        return
+                    buffer += data
+                    continue
+                request, buffer = buffer[:end + 4], buffer[end + 4:]
+                self.requests.append(request)
+                response, close = self._respond(request)
+                connection.sendall(response)
+                if close:
+                    return
+
+
+def _respond_ok(request: bytes) -> Tuple[bytes, bool]:
+    return (
+        b'HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n'
+        b'Content-Length: 5\r\n\r\nhello'
+    ), False
+
+
+class ProxyTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._upstreams = []  # type: List[_Upstream]
+
+    def tearDown(self) -> None:
+        for upstream in self._upstreams:
+            upstream.close()
+
+    def test_forward(self) -> None:
+        def respond(request: bytes) -> Tuple[bytes, bool]:
+            return (
+                b'HTTP/1.1 201 Created\r\n'
+                b'Content-Type: text/plain\r\n'
+                b'Connection: keep-alive, X-Secret\r\n'
+                b'Keep-Alive: timeout=5\r\n'
+                b'X-Secret: 1\r\n'
+                b'X-Custom: a\r\n'
+                b'  b\r\n'
+                b'Content-Length: 5\r\n\r\nhello'
+            ), False
+
+        upstream = self.start_upstream(respond)
+        proxy = Proxy([upstream.address])
+        response = proxy(self.get_request(
+            '/foo/bar?x=1', 'Host: example.com', 'Connection: keep-alive',
+            'Accept: */*'
+        ))
+        self.assertEqual(response.get_bytes(), (
+            HTTP_VERSION + ' 201 Created' + CRLF
+            + 'Content-Type: text/plain' + CRLF
+            + 'X-Custom: a b' + CRLF
+            + 'Via: 1.1 http_server' + CRLF
+            + 'Content-Length: 5' + CRLF
+            + CRLF + 'hello'
+        ).encode())
+        self.assertEqual(upstream.requests, [(
+            GET_METHOD + ' /foo/bar?x=1 ' + HTTP_VERSION + CRLF
+            + 'host: example.com' + CRLF
+            + 'accept: */*' + CRLF
+            + 'Via: 1.1 http_server' + CRLF + CRLF
+        ).encode()])
+
+    def test_reuse(self) -> None:
+        upstream = self.start_upstream(_respond_ok)
+        proxy = Proxy([upstream.address])
+        for _ in range(3):
+            response = proxy(self.get_request('/'))
+            self.assertTrue(response.get_bytes().endswith(b'hello'))
+            response.close()
+        self.assertEqual(upstream.connection_count, 1)
+        self.assertEqual(proxy.get_connection_counts(), [(0, 1)])
+
+    def test_chunked(self) -> None:
+        def respond(request: bytes) -> Tuple[bytes, bool]:
+            return (
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n'
+            ), False
+
+        upstream = self.start_upstream(respond)
+        proxy = Proxy([upstream.address])
+        response = proxy(self.get_request('/'))
+        self.assertIsInstance(response, ProxyResponse)
+        self.assertIsNone(response.body_length)
+        self.assertTrue(response.get_bytes().endswith(
+            b'Transfer-Encoding: chunked\r\n\r\n'
+            b'5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n'
+        ))
+        self.assertEqual(proxy.get_connection_counts(), [(0, 1)])
+
+    def test_read_to_end(self) -> None:
+        def respond(request: bytes) -> Tuple[bytes, bool]:
+            return b'HTTP/1.0 200 OK\r\n\r\nhello', True
+
+        upstream = self.start_upstream(respond)
+        proxy = Proxy([upstream.address])
+        response = proxy(self.get_request('/'))
+        self.assertTrue(response.get_bytes().endswith(
+            b'Transfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n'
+        ))
+        self.assertEqual(proxy.get_connection_counts(), [(0, 0)])
+
+    def test_no_body(self) -> None:
+        def respond(request: bytes) -> Tuple[bytes, bool]:
+            return b'HTTP/1.1 304 Not Modified\r\nETag: "a"\r\n\r\n', False
+
+        upstream = self.start_upstream(respond)
+        proxy = Proxy([upstream.address])
+        response = proxy(self.get_request('/'))
+        self.assertEqual(response.get_bytes(), (
+            HTTP_VERSION + ' 304 Not Modified' + CRLF + 'ETag: "a"' + CRLF
+            + 'Via: 1.1 http_server' + CRLF + CRLF
+        ).encode())
+        self.assertEqual(proxy.get_connection_counts(), [(0, 1)])
+
+    def test_stale_connection(self) -> None:
+        # The upstream server closes each connection after responding,
+        # without saying so, so the pooled connection is found to be closed
+        # when the next request is sent on it.
+        upstream = self.start_upstream(
+            lambda request: (_respond_ok(request)[0], True)
+        )
+        proxy = Proxy([upstream.address])
+        for _ in range(2):
+            response = proxy(self.get_request('/'))
+            self.assertEqual(response.status_code, 200)
+            response.get_bytes()
+        self.assertEqual(upstream.connection_count, 2)
+
+    def test_incomplete_body(self) -> None:
+        # A response that isn't read completely doesn't return its connection
+        # to the pool.
+        upstream = self.start_upstream(_respond_ok)
+        proxy = Proxy([upstream.address])
+        response = proxy(self.get_request('/'))
+        self.assertEqual(proxy.get_connection_counts(), [(1, 0)])
+        response.close()
+        self.assertEqual(proxy.get_connection_counts(), [(0, 0)])
+
+    def test_body(self) -> None:
+        upstream = self.start_upstream(_respond_ok)
+        proxy = Proxy([upstream.address])
+        for headers, body, forwarded in (
+                (('Content-Length: 5', 'Expect: 100-continue'), b'hello',
+                 'Content-Length: 5' + CRLF + CRLF + 'hello'),
+                (('Transfer-Encoding: chunked',),
+                 b'2\r\nhe\r\n3\r\nllo\r\n0\r\n\r\n',
+                 'Transfer-Encoding: chunked' + CRLF + CRLF
+                 + '2' + CRLF + 'he' + CRLF + '3' + CRLF + 'llo' + CRLF
+                 + '0' + CRLF + CRLF)):
+            with self.subTest(headers=headers):
+                request = self.get_request_with_body(
+                    POST_METHOD, body, *headers
+                )
+                response = proxy(request)
+                self.assertTrue(response.get_bytes().endswith(b'hello'))
+                self.assertEqual(upstream.requests[-1], (
+                    POST_METHOD + ' /upload ' + HTTP_VERSION + CRLF
+                    + 'Via: 1.1 http_server' + CRLF + forwarded
+                ).encode())
+
+    def test_no_retry(self) -> None:
+        # Requests that mustn't be sent twice are sent on new connections,
+        # which are then kept for requests that may be.
+        upstream = self.start_upstream(_respond_ok)
+        proxy = Proxy([upstream.address])
+        for _ in range(2):
+            proxy(self.get_request_with_body(POST_METHOD, b'')).get_bytes()
+        self.assertEqual(upstream.connection_count, 2)
+        proxy(self.get_request('/')).get_bytes()
+        self.assertEqual(upstream.connection_count, 2)
+
+    def test_head(self) -> None:
+        # The response to HEAD has no body, even though its headers say how
+        # long the body would be, so the connection is reused at once.
+        upstream = self.start_upstream(
+            lambda request: (_respond_ok(request)[0][:-len('hello')], False)
+        )
+        proxy = Proxy([upstream.address])
+        request = parse('{} / {}{}{}'.format(
+            HEAD_METHOD, HTTP_VERSION, CRLF, CRLF
+        ))
+        assert request is not None
+        response = proxy(request)
+        self.assertEqual(response.body_length, 5)
+        self.assertEqual(proxy.get_connection_counts(), [(0, 1)])
+        self.assertEqual(proxy(self.get_request('/')).status_code, 200)
+        self.assertEqual(upstream.connection_count, 1)
+
+    def test_round_robin(self) -> None:
+        upstreams = [self.start_upstream(_respond_ok) for _ in range(2)]
+        proxy = Proxy([upstream.address for upstream in upstreams])
+        for _ in range(4):
+            proxy(self.get_request('/')).get_bytes()
+        self.assertEqual(
+            [len(upstream.requests) for upstream in upstreams], [2, 2]
+        )
+
+    def test_least_connections(self) -> None:
+        for balancer, expected in ((ROUND_ROBIN, [2, 1]),
+                                   (LEAST_CONNECTIONS, [1, 2])):
+            with self.subTest(balancer=balancer):
+                upstreams = [
+                    self.start_upstream(_respond_ok) for _ in range(2)
+                ]
+                proxy = Proxy(
+                    [upstream.address for upstream in upstreams], balancer
+                )
+                # The first response is still being relayed when the third
+                # request arrives.
+                held = proxy(self.get_request('/'))
+                proxy(self.get_request('/')).get_bytes()
+                proxy(self.get_request('/')).get_bytes()
+                held.close()
+                self.assertEqual(
+                    [len(upstream.requests) for upstream in upstreams],
+                    expected
+                )
+
+    def test_connection_refused(self) -> None:
+        upstream = self.start_upstream(_respond_ok)
+        proxy = Proxy([self.get_unused_address(), upstream.address])
+        for _ in range(2):
+            self.assertEqual(proxy(self.get_request('/')).status_code, 200)
+
+        proxy = Proxy([self.get_unused_address()])
+        self.assertIs(proxy(self.get_request('/')), get_error_response(502))
+
+    def test_bad_gateway(self) -> None:
+        for response in (b'garbage\r\n\r\n',
+                         b'HTTP/1.1 299 Whatever\r\n\r\n',
+                         b'HTTP/1.1 200 OK\r\nContent-Length: x\r\n\r\n'):
+            with self.subTest(response=response):
+                def respond(
+                        request: bytes,
+                        response: bytes = response) -> Tuple[bytes, bool]:
+                    return response, True
+
+                upstream = self.start_upstream(respond)
+                proxy = Proxy([upstream.address])
+                self.assertEqual(
+                    proxy(self.get_request('/')).status_code, 502
+                )
+                self.assertEqual(proxy.get_connection_counts(), [(0, 0)])
+
+    def test_gateway_timeout(self) -> None:
+        listener = create_tcp_socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1)
+        with listener:
+            # The connection is accepted by the kernel, but never answered.
+            proxy = Proxy([listener.getsockname()], timeout=0.2)
+            self.assertIs(
+                proxy(self.get_request('/')), get_error_response(504)
+            )
+
+    def test_invalid_arguments(self) -> None:
+        with self.assertRaises(ValueError):
+            Proxy([])
+        with self.assertRaises(ValueError):
+            Proxy([('127.0.0.1', 8080)], 'random')
+
+    def start_upstream(self, respond: _Respond) -> _Upstream:
+        upstream = _Upstream(respond)
+        self._upstreams.append(upstream)
+        return upstream
+
+    @staticmethod
+    def get_unused_address() -> Tuple[str, int]:
+        with create_tcp_socket() as unused:
+            unused.bind(('127.0.0.1', 0))
+            address = unused.getsockname()  # type: Tuple[str, int]
+            return address
+
+    def get_request_with_body(
+            self, method: str, body: bytes, *headers: str) -> Request:
+        # Get a request to /upload whose body is read from a connection, as
+        # the server would read it.
+        server_socket, client = socket.socketpair()
+        self.addCleanup(server_socket.close)
+        self.addCleanup(client.close)
+        server_socket.settimeout(1)
+        client.sendall(body)
+        request = parse('{} /upload {}{}{}{}'.format(
+            method, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ))
+        assert request is not None
+        reader = ConnectionReader(server_socket)
+        return evolve(
+            request, body=reader.get_body(request.headers, 1024)
+        )
+
+    @staticmethod
+    def get_request(uri: str, *headers: str) -> Request:
+        request = parse('{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ))
+        assert request is not None
+        return request
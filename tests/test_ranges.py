@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+
+from http_server.ranges import get_range_response, parse_range, MAX_RANGES
+from http_server.responses import FileResponse, MultipartFileResponse
+from http_server.responses import Response
+
+
+class RangesTestCase(unittest.TestCase):
+
+    def test_parse_range(self) -> None:
+        self.assertEqual(parse_range('bytes=0-9', 100), [(0, 10)])
+        self.assertEqual(parse_range('bytes=90-', 100), [(90, 10)])
+        self.assertEqual(parse_range('bytes=-10', 100), [(90, 10)])
+        self.assertEqual(
+            parse_range('bytes=0-0, 5-9,-1', 100), [(0, 1), (5, 5), (99, 1)]
+        )
+
+    def test_parse_range_truncated(self) -> None:
+        self.assertEqual(parse_range('bytes=90-200', 100), [(90, 10)])
+        self.assertEqual(parse_range('bytes=-200', 100), [(0, 100)])
+
+    def test_parse_range_unsatisfiable(self) -> None:
+        self.assertEqual(parse_range('bytes=100-', 100), [])
+        self.assertEqual(parse_range('bytes=-0', 100), [])
+        self.assertEqual(parse_range('bytes=0-9', 0), [])
+        self.assertEqual(parse_range('bytes=200-300,0-9', 100), [(0, 10)])
+
+    def test_parse_range_invalid(self) -> None:
+        for value in ('', 'bytes', 'bytes=', 'items=0-9', 'bytes=9-0',
+                      'bytes=a-b', 'bytes=-', 'bytes=+1-2', 'bytes=0-9;'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_range(value, 100))
+
+    def test_parse_range_too_many(self) -> None:
+        value = 'bytes=' + ','.join(['0-0'] * (MAX_RANGES + 1))
+        self.assertIsNone(parse_range(value, 100))
+
+    def test_get_range_response(self) -> None:
+        with tempfile.TemporaryFile() as body_file:
+            body_file.write(b'here is some text')
+            response = get_range_response(
+                ('text', 'plain'), body_file, 17, [(5, 2)]
+            )
+            self.assertIsInstance(response, FileResponse)
+            self.assertEqual(
+                response.get_bytes(),
+                Response(
+                    206,
+                    ('text', 'plain'),
+                    'is',
+                    [('Content-Range', 'bytes 5-6/17')]
+                ).get_bytes()
+            )
+
+    def test_get_range_response_multipart(self) -> None:
+        with tempfile.TemporaryFile() as body_file:
+            body_file.write(b'here is some text')
+            response = get_range_response(
+                ('text', 'plain'), body_file, 17, [(0, 4), (13, 4)]
+            )
+            self.assertIsInstance(response, MultipartFileResponse)
+            head, body = response.get_bytes().split(b'\r\n\r\n', 1)
+            self.assertIn(
+                'Content-Length: {}'.format(len(body)).encode(), head
+            )
+            boundary = head.split(b'boundary=')[1].split(b'\r\n')[0]
+            self.assertEqual(body, (
+                b'--' + boundary + b'\r\n'
+                + b'Content-Type: text/plain\r\n'
+                + b'Content-Range: bytes 0-3/17\r\n\r\n'
+                + b'here\r\n'
+                + b'--' + boundary + b'\r\n'
+                + b'Content-Type: text/plain\r\n'
+                + b'Content-Range: bytes 13-16/17\r\n\r\n'
+                + b'text\r\n'
+                + b'--' + boundary + b'--\r\n'
+            ))
+
+    def test_get_range_response_unsatisfiable(self) -> None:
+        with tempfile.TemporaryFile() as body_file:
+            response = get_range_response(
+                ('text', 'plain'), body_file, 17, []
+            )
+            self.assertTrue(body_file.closed)
+        self.assertEqual(
+            response,
+            Response(416, None, b'', [('Content-Range', 'bytes */17')])
+        )
+        self.assertIn(b'Content-Length: 0', response.get_bytes())
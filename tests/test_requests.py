@@ -1,6 +1,8 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Tuple
 
+from http_server.requests import check_request_line, is_request_line_prefix
 from http_server.requests import parse, Request
 from http_server.tokens import GET_METHOD, HTTP_VERSION, CRLF
 
@@ -49,6 +51,23 @@ class RequestsTestCase(unittest.TestCase):
             *self.get_actual_expected('/foo/bar//////', ['foo', 'bar', ''])
         )
 
+    def test_parse_uri_with_query(self) -> None:
+        request = parse(self.get_request_str('/foo/bar?a=1&b=/?'))
+        assert request is not None
+        self.assertEqual(request.uri, ['foo', 'bar'])
+        self.assertEqual(request.query, 'a=1&b=/?')
+
+    def test_parse_uri_with_empty_query(self) -> None:
+        request = parse(self.get_request_str('/foo/?'))
+        assert request is not None
+        self.assertEqual(request.uri, ['foo', ''])
+        self.assertEqual(request.query, '')
+
+    def test_parse_uri_without_query(self) -> None:
+        request = parse(self.get_request_str('/foo'))
+        assert request is not None
+        self.assertEqual(request.query, '')
+
     def test_parse_ignores_trailing_chars(self) -> None:
         request_str = (
             self.get_request_str('/foo')
@@ -138,6 +157,120 @@ class RequestsTestCase(unittest.TestCase):
     def test_only_method_space_uri_space_version(self) -> None:
         self.assertIsNone(parse(GET_METHOD + ' / ' + HTTP_VERSION))
 
+    def test_parse_bytes(self) -> None:
+        request_bytes = self.get_request_str('/foo/bar').encode()
+        expected = self.get_request(['foo', 'bar'])
+        self.assertEqual(parse(request_bytes), expected)
+        self.assertEqual(parse(memoryview(request_bytes)), expected)
+
+    def test_parse_non_ascii(self) -> None:
+        self.assertIsNone(parse(self.get_request_str('/λ')))
+        self.assertIsNone(parse(self.get_request_str('/foo/λ')))
+
+    def test_parse_concurrent(self) -> None:
+        uris = tuple('/{}/{}'.format(i, 'x' * i) for i in range(100))
+
+        def parse_uri(uri: str) -> Optional[Request]:
+            return parse(self.get_request_str(uri))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            actual = tuple(executor.map(parse_uri, uris))
+
+        expected = tuple(
+            self.get_request([str(i), 'x' * i] if i > 0 else ['0', ''])
+            for i in range(100)
+        )
+        self.assertEqual(actual, expected)
+
+    def test_parse_headers(self) -> None:
+        request = parse(
+            self.get_request_str('/foo')
+            + 'Host: localhost:8080' + CRLF
+            + 'ACCEPT:text/html,  text/plain  ' + CRLF
+            + 'accept: image/png' + CRLF
+            + 'X-Folded: first' + CRLF
+            + '  second' + CRLF
+            + 'not a header' + CRLF
+            + 'X-Empty:' + CRLF
+            + CRLF
+            + 'Ignored: body'
+        )
+        assert request is not None
+        headers = request.headers
+
+        self.assertEqual(headers.get('Host'), 'localhost:8080')
+        self.assertEqual(headers.get('host'), 'localhost:8080')
+        self.assertEqual(
+            headers.get_all('Accept'), ['text/html,  text/plain', 'image/png']
+        )
+        self.assertEqual(
+            headers.get('Accept'), 'text/html,  text/plain, image/png'
+        )
+        self.assertEqual(headers.get('X-Folded'), 'first second')
+        self.assertEqual(headers.get('X-Empty'), '')
+        self.assertIsNone(headers.get('Ignored'))
+        self.assertEqual(headers.get('Ignored', 'default'), 'default')
+        self.assertEqual(headers.get_all('Ignored'), [])
+        self.assertIn('HOST', headers)
+        self.assertNotIn('not a header', headers)
+        self.assertEqual(
+            set(headers), {'host', 'accept', 'x-folded', 'x-empty'}
+        )
+        self.assertEqual(len(headers), 4)
+
+    def test_parse_no_headers(self) -> None:
+        request = parse(self.get_request_str('/foo'))
+        assert request is not None
+        self.assertEqual(len(request.headers), 0)
+        self.assertIsNone(request.headers.get('Host'))
+
+    def test_parse_headers_ignored_by_eq(self) -> None:
+        request = parse(
+            self.get_request_str('/foo') + 'Host: localhost' + CRLF + CRLF
+        )
+        self.assertEqual(request, self.get_request(['foo']))
+
+    def test_check_request_line(self) -> None:
+        for line, expected in (
+                ('POST /foo HTTP/1.1', None),
+                ('GET /foo?x=1 HTTP/1.1', None),
+                ('PATCH /foo HTTP/1.1', 501),
+                ('BREW /pot HTTP/1.1', 501),
+                ('GET /foo HTTP/1.0', 505),
+                ('GET /foo HTTP/2.0', 505),
+                ('GET foo HTTP/1.1', 400),
+                ('GET /foo HTTP/1.1 ', 400),
+                ('GET  /foo HTTP/1.1', 400),
+                ('G(T /foo HTTP/1.1', 400),
+                ('GET /foo HTTP/11', 400),
+                ('', 400)):
+            with self.subTest(line=line):
+                request = (line + CRLF + CRLF).encode()
+                self.assertEqual(check_request_line(request), expected)
+                self.assertEqual(
+                    parse(request) is not None, expected is None
+                )
+
+    def test_check_request_line_in_buffer(self) -> None:
+        buffer = bytearray(b'\r\n' + self.get_request_str('/').encode() + b'x')
+        self.assertIsNone(check_request_line(buffer, 2, len(buffer) - 1))
+        self.assertEqual(check_request_line(buffer, 0, len(buffer) - 1), 400)
+        self.assertEqual(check_request_line(buffer, 2, len(buffer) - 2), 400)
+
+    def test_is_request_line_prefix(self) -> None:
+        for prefix, expected in ((b'G', True),
+                                 (b'GET /foo HTT', True),
+                                 (b'GET /foo HTTP/1.1\r', True),
+                                 (b'\x16\x03\x01\x02\x00', False),
+                                 (b'\x00', False),
+                                 (b' GET', False),
+                                 (b'GET /\xff', False),
+                                 (b'GET /\r\r', False)):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    is_request_line_prefix(prefix, 0, len(prefix)), expected
+                )
+
     @classmethod
     def get_actual_expected(
             cls,
@@ -0,0 +1,123 @@
+import time
+import unittest
+from typing import List  # noqa: F401
+
+from http_server.requests import Request
+from http_server.response_cache import get_request_key, ResponseCache
+from http_server.responses import FrozenResponse, Response
+from http_server.tokens import GET_METHOD, HEAD_METHOD, POST_METHOD
+from http_server.tokens import HTTP_VERSION
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._calls = []  # type: List[str]
+
+    def test_hit_miss(self) -> None:
+        cache = ResponseCache()
+        response = cache.get(self.get_request('a'), self.handler_func)
+        self.assertIsInstance(response, FrozenResponse)
+        self.assertEqual(response.message_body, b'/a')
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        self.assertIs(cache.get(self.get_request('a'), self.handler_func),
+                      response)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(self._calls, ['a'])
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(
+            cache.size, len(response.get_head()) + len(b'/a')
+        )
+
+    def test_key(self) -> None:
+        self.assertEqual(
+            get_request_key(self.get_request('a', 'b')),
+            get_request_key(self.get_request('a', 'b'))
+        )
+        self.assertNotEqual(
+            get_request_key(self.get_request('a', 'b')),
+            get_request_key(self.get_request('a', 'b', query='c'))
+        )
+
+        cache = ResponseCache(
+            get_key=lambda request: None if request.query else request.uri[0]
+        )
+        cache.get(self.get_request('a'), self.handler_func)
+        cache.get(self.get_request('a', ''), self.handler_func)
+        cache.get(self.get_request('a', query='b'), self.handler_func)
+        cache.get(self.get_request('a', query='b'), self.handler_func)
+        self.assertEqual(self._calls, ['a', 'a', 'a'])
+        self.assertEqual(len(cache), 1)
+
+    def test_lru_eviction(self) -> None:
+        cache = ResponseCache(max_entries=2)
+        for uri in ('a', 'b', 'a', 'c'):  # b is evicted by c.
+            cache.get(self.get_request(uri), self.handler_func)
+        self.assertEqual((len(cache), cache.evictions), (2, 1))
+
+        cache.get(self.get_request('a'), self.handler_func)
+        cache.get(self.get_request('b'), self.handler_func)
+        self.assertEqual(self._calls, ['a', 'b', 'c', 'b'])
+
+    def test_max_size(self) -> None:
+        size = len(self.handler_func(self.get_request('a')).get_head()) + 2
+        cache = ResponseCache(max_size=size * 2)
+        for uri in ('a', 'b', 'c'):
+            cache.get(self.get_request(uri), self.handler_func)
+        self.assertEqual((len(cache), cache.size, cache.evictions),
+                         (2, size * 2, 1))
+
+        cache = ResponseCache(max_size=size - 1)
+        cache.get(self.get_request('a'), self.handler_func)
+        self.assertEqual(len(cache), 0)
+
+    def test_ttl(self) -> None:
+        cache = ResponseCache(ttl=0.1)
+        cache.get(self.get_request('a'), self.handler_func)
+        cache.get(self.get_request('a'), self.handler_func)
+        time.sleep(0.15)
+        cache.get(self.get_request('a'), self.handler_func)
+        self.assertEqual(self._calls, ['a', 'a'])
+        self.assertEqual(
+            (cache.hits, cache.misses, cache.expirations), (1, 2, 1)
+        )
+
+    def test_uncacheable(self) -> None:
+        def handler_func(request: Request) -> Response:
+            self._calls.append(request.uri[0])
+            return Response(503)
+
+        cache = ResponseCache()
+        cache.get(self.get_request('a'), handler_func)
+        cache.get(self.get_request('a'), handler_func)
+        self.assertEqual(self._calls, ['a', 'a'])
+        self.assertEqual(len(cache), 0)
+
+    def test_methods(self) -> None:
+        # HEAD shares GET's entry, and other methods aren't cached.
+        cache = ResponseCache()
+        response = cache.get(self.get_request('a'), self.handler_func)
+        self.assertIs(
+            cache.get(
+                self.get_request('a', method=HEAD_METHOD), self.handler_func
+            ),
+            response
+        )
+        cache.get(self.get_request('a', method=POST_METHOD), self.handler_func)
+        cache.get(self.get_request('a', method=POST_METHOD), self.handler_func)
+        self.assertEqual(self._calls, ['a', 'a', 'a'])
+        self.assertEqual(len(cache), 1)
+
+    def handler_func(self, request: Request) -> Response:
+        self._calls.append(request.uri[0])
+        return Response(
+            200, ('text', 'plain'), '/' + '/'.join(request.uri)
+        )
+
+    @staticmethod
+    def get_request(
+            *uri: str,
+            query: str = '',
+            method: str = GET_METHOD) -> Request:
+        return Request(method, list(uri), HTTP_VERSION, query=query)
@@ -1,6 +1,10 @@
+import tempfile
 import unittest
+from typing import Iterator
+from typing import List, Union  # noqa: F401
 
-from http_server.responses import Response
+from http_server.responses import FileResponse, Response, StreamingResponse
+from http_server.responses import get_error_response, ERROR_STATUS_CODES
 from http_server.tokens import HTTP_VERSION, CRLF
 
 
@@ -74,3 +78,189 @@ class ResponsesTestCase(unittest.TestCase):
             + CRLF + 'λ'
         ).encode()
         self.assertEqual(response.get_bytes(), expected)
+
+    def test_response_get_bytes_keep_alive(self) -> None:
+        response = Response(200, ('text', 'plain'), 'hi')
+        expected = (
+            HTTP_VERSION + ' 200 OK' + CRLF
+            + 'Content-Type: text/plain' + CRLF
+            + 'Content-Length: 2' + CRLF
+            + 'Connection: keep-alive' + CRLF
+            + CRLF + 'hi'
+        ).encode()
+        self.assertEqual(response.get_bytes(keep_alive=True), expected)
+
+    def test_response_get_bytes_close(self) -> None:
+        response = Response(200)
+        expected = (
+            HTTP_VERSION + ' 200 OK' + CRLF
+            + 'Connection: close' + CRLF
+            + CRLF
+        ).encode()
+        self.assertEqual(response.get_bytes(keep_alive=False), expected)
+
+    def test_response_get_bytes_keep_alive_no_message_body(self) -> None:
+        # The client can't tell where a response without a Content-Length
+        # ends until the connection closes, so a persistent connection needs
+        # one even when there's no body, unless the status code rules one
+        # out.
+        self.assertEqual(Response(404).get_bytes(keep_alive=True), (
+            HTTP_VERSION + ' 404 Not Found' + CRLF
+            + 'Content-Length: 0' + CRLF
+            + 'Connection: keep-alive' + CRLF
+            + CRLF
+        ).encode())
+        for status_code in (100, 204, 304):
+            with self.subTest(status_code=status_code):
+                self.assertNotIn(
+                    b'Content-Length',
+                    Response(status_code).get_bytes(keep_alive=True)
+                )
+
+    def test_response_get_bytes_headers(self) -> None:
+        response = Response(
+            304, headers=[('ETag', '"abc"'), ('Cache-Control', 'no-cache')]
+        )
+        expected = (
+            HTTP_VERSION + ' 304 Not Modified' + CRLF
+            + 'ETag: "abc"' + CRLF
+            + 'Cache-Control: no-cache' + CRLF
+            + CRLF
+        ).encode()
+        self.assertEqual(response.get_bytes(), expected)
+        self.assertEqual(response.freeze().get_bytes(), expected)
+
+    def test_response_get_buffers(self) -> None:
+        message_body = b'here is some text'
+        response = Response(200, ('text', 'plain'), message_body)
+        buffers = response.get_buffers(keep_alive=True)
+        self.assertEqual(b''.join(buffers), response.get_bytes(True))
+
+        # The message body is not copied.
+        self.assertIs(buffers[-1], message_body)
+
+    def test_response_get_buffers_no_message_body(self) -> None:
+        response = Response(200)
+        self.assertEqual(response.get_buffers(), [response.get_bytes()])
+
+    def test_response_freeze(self) -> None:
+        response = Response(200, ('text', 'plain'), 'here is some text')
+        frozen = response.freeze()
+        self.assertEqual(frozen, response)
+        self.assertIs(frozen.freeze(), frozen)
+        for keep_alive in (None, True, False):
+            self.assertEqual(
+                frozen.get_bytes(keep_alive), response.get_bytes(keep_alive)
+            )
+            self.assertIs(
+                frozen.get_bytes(keep_alive), frozen.get_bytes(keep_alive)
+            )
+            self.assertEqual(
+                b''.join(frozen.get_buffers(keep_alive)),
+                response.get_bytes(keep_alive)
+            )
+            self.assertIs(
+                frozen.get_head(keep_alive), frozen.get_head(keep_alive)
+            )
+
+    def test_get_error_response(self) -> None:
+        for status_code in ERROR_STATUS_CODES:
+            with self.subTest(status_code=status_code):
+                response = get_error_response(status_code)
+                self.assertIs(get_error_response(status_code), response)
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(response.body_length, 0)
+                self.assertIs(
+                    response.get_bytes(keep_alive=False),
+                    response.get_bytes(keep_alive=False)
+                )
+
+        self.assertEqual(get_error_response(405).get_bytes(False), (
+            HTTP_VERSION + ' 405 Method Not Allowed' + CRLF
+            + 'Allow: GET, HEAD' + CRLF
+            + 'Content-Length: 0' + CRLF
+            + 'Connection: close' + CRLF + CRLF
+        ).encode())
+        with self.assertRaises(KeyError):
+            get_error_response(200)
+
+    def test_file_response(self) -> None:
+        with tempfile.TemporaryFile() as body_file:
+            body_file.write(b'here is some text')
+            body_file.flush()
+            response = FileResponse(200, ('text', 'plain'), body_file)
+            self.assertEqual(
+                response.get_bytes(),
+                Response(200, ('text', 'plain'), 'here is some text')
+                .get_bytes()
+            )
+            self.assertEqual(
+                response.freeze(),
+                Response(200, ('text', 'plain'), 'here is some text')
+            )
+
+            response.close()
+            self.assertTrue(body_file.closed)
+
+    def test_file_response_offset_count(self) -> None:
+        with tempfile.TemporaryFile() as body_file:
+            body_file.write(b'here is some text')
+            body_file.flush()
+            response = FileResponse(200, ('text', 'plain'), body_file, 5, 7)
+            self.assertEqual(
+                response.get_head(),
+                (
+                    HTTP_VERSION + ' 200 OK' + CRLF
+                    + 'Content-Type: text/plain' + CRLF
+                    + 'Content-Length: 7' + CRLF
+                    + CRLF
+                ).encode()
+            )
+            self.assertEqual(
+                response.get_bytes(), response.get_head() + b'is some'
+            )
+
+            rest = FileResponse(200, ('text', 'plain'), body_file, 5)
+            self.assertEqual(rest.count, 12)
+
+    def test_streaming_response(self) -> None:
+        chunks = [
+            b'here is', '', ' some text'
+        ]  # type: List[Union[bytes, str]]
+        response = StreamingResponse(200, ('text', 'plain'), iter(chunks))
+        expected = (
+            HTTP_VERSION + ' 200 OK' + CRLF
+            + 'Content-Type: text/plain' + CRLF
+            + 'Transfer-Encoding: chunked' + CRLF
+            + 'Connection: keep-alive' + CRLF
+            + CRLF
+            + '7' + CRLF + 'here is' + CRLF
+            + 'a' + CRLF + ' some text' + CRLF
+            + '0' + CRLF + CRLF
+        ).encode()
+        self.assertEqual(response.get_bytes(keep_alive=True), expected)
+
+    def test_streaming_response_freeze(self) -> None:
+        response = StreamingResponse(
+            200, ('text', 'plain'), iter(['here is', ' some text'])
+        )
+        self.assertEqual(
+            response.freeze(),
+            Response(200, ('text', 'plain'), 'here is some text')
+        )
+
+    def test_streaming_response_close(self) -> None:
+        closed = []
+
+        def generate_chunks() -> Iterator[bytes]:
+            try:
+                yield b'foo'
+                yield b'bar'
+            finally:
+                closed.append(True)
+
+        response = StreamingResponse(200, None, generate_chunks())
+        chunks = response.get_chunks()
+        next(chunks)
+        response.close()
+        self.assertEqual(closed, [True])
@@ -1,10 +1,18 @@
+import json
 import os
+import signal
+import socket
 import subprocess
+import tempfile
 import time
 import unittest
-from typing import Iterable
+from typing import Iterable, List, Set
 
 from http_server import server
+from http_server.bench import create_request, run_benchmark, PROTOCOL_ERROR
+from http_server.responses import Response, get_error_response
+from http_server.tokens import GET_METHOD, HEAD_METHOD, POST_METHOD
+from http_server.tokens import PUT_METHOD, HTTP_VERSION, CRLF
 
 
 class ServerTestCase(unittest.TestCase):
@@ -97,6 +105,43 @@ class ServerTestCase(unittest.TestCase):
                 # responses.
                 yield client.recv(1024)
 
+    @staticmethod
+    def _send_concurrent_requests(requests: Iterable[bytes]) -> List[bytes]:
+        # Send every request before receiving any of the responses, so that
+        # the server must handle the connections simultaneously.
+        clients = []
+        for request in requests:
+            client = server.create_tcp_socket()
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(request)
+            clients.append(client)
+
+        responses = []
+        for client in clients:
+            with client:
+                responses.append(client.recv(1024))
+        return responses
+
+    @staticmethod
+    def _recv_all(client: socket.socket) -> bytes:
+        # Receive until the server closes the connection.
+        chunks = []
+        chunk = client.recv(1024)
+        while chunk != b'':
+            chunks.append(chunk)
+            chunk = client.recv(1024)
+        return b''.join(chunks)
+
+    @staticmethod
+    def _recv_exactly(client: socket.socket, length: int) -> bytes:
+        data = b''
+        while len(data) < length:
+            chunk = client.recv(length - len(data))
+            if chunk == b'':
+                break
+            data += chunk
+        return data
+
 
 class ServerEchoTestCase(ServerTestCase):
     # Test a server that, for each request, sends back an identical response.
@@ -133,3 +178,911 @@ class ServerTripleCapsTestCase(ServerTestCase):
         self.assertEqual(
             responses, tuple(request.upper() * 3 for request in requests)
         )
+
+
+class ServerWorkerPoolTestCase(ServerTestCase):
+    # Test a server whose handler takes 500 ms to echo each request, with a
+    # pool of two workers and no queue for waiting connections.
+
+    def _test_concurrent(self) -> None:
+        requests = (b'first', b'second')
+        start = time.monotonic()
+        responses = self._send_concurrent_requests(requests)
+        self.assertEqual(tuple(responses), requests)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def _test_overloaded(self) -> None:
+        requests = (b'first', b'second', b'third')
+        responses = self._send_concurrent_requests(requests)
+        self.assertEqual(responses[:2], [b'first', b'second'])
+        self.assertEqual(responses[2], server.SERVICE_UNAVAILABLE)
+
+
+class ServerThreadPoolTestCase(ServerWorkerPoolTestCase):
+
+    _script = 'server_thread_pool.py'
+
+    def test_thread_pool_concurrent(self) -> None:
+        self._test_concurrent()
+
+    def test_thread_pool_overloaded(self) -> None:
+        self._test_overloaded()
+
+    def test_thread_pool_bench(self) -> None:
+        # Connections beyond the two that the workers are serving are
+        # rejected, and the rejections are counted by status code.
+        result = run_benchmark(
+            [b'hello'], concurrency=3, duration=1.2, raw=True
+        )
+        self.assertGreaterEqual(result.statuses[0], 4)
+        self.assertGreater(result.statuses[503], 0)
+
+
+class ServerProcessPoolTestCase(ServerWorkerPoolTestCase):
+
+    _script = 'server_process_pool.py'
+
+    def test_process_pool_concurrent(self) -> None:
+        self._test_concurrent()
+
+    def test_process_pool_overloaded(self) -> None:
+        self._test_overloaded()
+
+
+class ServerAsyncTestCase(ServerTestCase):
+    # Test an asyncio-based server whose coroutine handler waits 500 ms before
+    # echoing each request.
+
+    _script = 'server_async.py'
+
+    # The server reads each request up to the blank line that ends its
+    # headers.
+    _async_requests = tuple(
+        request + b'\r\n\r\n'
+        for request in ServerTestCase._multiple_requests
+    )
+
+    def test_async_concurrent(self) -> None:
+        requests = self._async_requests
+        start = time.monotonic()
+        responses = self._send_concurrent_requests(requests)
+        self.assertEqual(tuple(responses), requests)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_async_split_request(self) -> None:
+        # A request that arrives in more than one piece is read whole.
+        request = b'GET /hello HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(request[:20])
+            time.sleep(0.1)
+            client.sendall(request[20:])
+            self.assertEqual(self._recv_all(client), request)
+
+    def test_async_bad_requests(self) -> None:
+        for request, status_line in (
+                (b'x' * server.MAX_REQUEST_LENGTH * 2,
+                 b'HTTP/1.1 431 Request Header Fields Too Large\r\n'),
+                (b'GET /hello HTTP/1.1\r\n', b'HTTP/1.1 400 Bad Request\r\n')):
+            with self.subTest(status_line=status_line):
+                with server.create_tcp_socket() as client:
+                    client.connect(server.DEFAULT_ADDR)
+                    client.sendall(request)
+                    # The request is incomplete once the client stops
+                    # sending.
+                    client.shutdown(socket.SHUT_WR)
+                    response = self._recv_all(client)
+                self.assertTrue(response.startswith(status_line))
+
+
+class ServerAsyncTripleCapsTestCase(ServerTestCase):
+    # Test an asyncio-based server with a regular (non-coroutine) handler.
+
+    _script = 'server_async_triple_caps.py'
+
+    def test_async_triple_caps_multiple(self) -> None:
+        requests = ServerAsyncTestCase._async_requests
+        responses = tuple(self._send_requests(requests))
+        self.assertEqual(
+            responses, tuple(request.upper() * 3 for request in requests)
+        )
+
+
+class ServerKeepAliveTestCase(ServerTestCase):
+    # Test a server with an HTTP handler that echoes the requested URI, using
+    # persistent connections with a 1 s idle timeout and at most 3 requests
+    # per connection.
+
+    _script = 'server_http_echo.py'
+
+    @staticmethod
+    def _request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+    @staticmethod
+    def _response(body: str, keep_alive: bool) -> bytes:
+        return Response(200, ('text', 'plain'), body).get_bytes(keep_alive)
+
+    def test_keep_alive_sequential(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            for uri in ('foo', 'bar'):
+                client.sendall(self._request('/' + uri))
+                expected = self._response(uri, True)
+                self.assertEqual(
+                    self._recv_exactly(client, len(expected)), expected
+                )
+
+    def test_keep_alive_pipelined(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request('/foo')
+                + self._request('/bar')
+                + self._request('/baz', 'Connection: close')
+            )
+            self.assertEqual(
+                self._recv_all(client),
+                self._response('foo', True)
+                + self._response('bar', True)
+                + self._response('baz', False)
+            )
+
+    def test_keep_alive_max(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(b''.join(self._request('/foo') for _ in range(4)))
+            self.assertEqual(
+                self._recv_all(client),
+                self._response('foo', True) * 2 + self._response('foo', False)
+            )
+
+    def test_keep_alive_bench(self) -> None:
+        # Each connection carries three requests before the server closes it.
+        result = run_benchmark(
+            [create_request('/foo'), create_request('/bar')],
+            concurrency=1,
+            duration=0.5
+        )
+        self.assertEqual(result.errors, {})
+        self.assertEqual(result.statuses, {200: result.requests})
+        self.assertEqual(result.connections, -(-result.requests // 3))
+
+        result = run_benchmark(
+            [create_request('/foo', keep_alive=False)],
+            concurrency=1,
+            duration=0.5,
+            keep_alive=False
+        )
+        self.assertEqual(result.connections, result.requests)
+
+    def test_keep_alive_timeout(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request('/foo'))
+            start = time.monotonic()
+            self.assertEqual(
+                self._recv_all(client), self._response('foo', True)
+            )
+            self.assertGreater(time.monotonic() - start, 0.9)
+
+    def test_body_too_long(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request('/foo', 'Content-Length: 99999999'))
+            self.assertEqual(
+                self._recv_all(client),
+                get_error_response(413).get_bytes(keep_alive=False)
+            )
+
+    def test_bad_request_closes_connection(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(b'GET foo HTTP/1.1' + (CRLF * 2).encode())
+            self.assertEqual(
+                self._recv_all(client),
+                get_error_response(400).get_bytes(keep_alive=False)
+            )
+
+    def test_garbage_rejected_at_once(self) -> None:
+        # The server doesn't wait for the rest of a request that can't be
+        # valid, e.g. a TLS handshake sent to an HTTP port.
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(b'\x16\x03\x01\x02\x00\x01\x00\x01\xfc\x03\x03')
+            start = time.monotonic()
+            self.assertEqual(
+                self._recv_all(client),
+                get_error_response(400).get_bytes(keep_alive=False)
+            )
+            self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_method_not_implemented(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(b'PATCH /foo HTTP/1.1' + CRLF.encode())
+            self.assertEqual(
+                self._recv_all(client),
+                get_error_response(501).get_bytes(keep_alive=False)
+            )
+
+
+class ServerStreamingTestCase(ServerTestCase):
+    # Test a server that responds with the parts of the requested URI as the
+    # chunks of a chunked message body.
+
+    _script = 'server_streaming.py'
+
+    def test_streaming(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            for _ in range(2):
+                client.sendall('{} /foo/barbaz {}{}{}'.format(
+                    GET_METHOD, HTTP_VERSION, CRLF, CRLF
+                ).encode())
+                expected = (
+                    HTTP_VERSION + ' 200 OK' + CRLF
+                    + 'Content-Type: text/plain' + CRLF
+                    + 'Transfer-Encoding: chunked' + CRLF
+                    + 'Connection: keep-alive' + CRLF
+                    + CRLF
+                    + '3' + CRLF + 'foo' + CRLF
+                    + '6' + CRLF + 'barbaz' + CRLF
+                    + '0' + CRLF + CRLF
+                ).encode()
+                self.assertEqual(
+                    self._recv_exactly(client, len(expected)), expected
+                )
+
+    def test_streaming_bench(self) -> None:
+        result = run_benchmark(
+            [create_request('/foo/barbaz'), create_request('/foo/fail')],
+            concurrency=2,
+            duration=0.5
+        )
+        self.assertGreater(result.statuses[200], 0)
+        self.assertGreater(result.errors[PROTOCOL_ERROR], 0)
+
+    def test_streaming_failure(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall('{} /foo/fail {}{}{}'.format(
+                GET_METHOD, HTTP_VERSION, CRLF, CRLF
+            ).encode())
+
+            # The connection is closed without the last chunk.
+            self.assertTrue(self._recv_all(client).endswith(
+                (CRLF + '3' + CRLF + 'foo' + CRLF).encode()
+            ))
+
+
+class ServerFileTestCase(ServerTestCase):
+    # Test a server that responds with the contents of the file at the
+    # requested (absolute) path.
+
+    _script = 'server_file.py'
+
+    def test_large_file(self) -> None:
+        contents = os.urandom(5 * 1024 * 1024)
+        with tempfile.NamedTemporaryFile() as requested_file:
+            requested_file.write(contents)
+            requested_file.flush()
+
+            request = '{} {} {}{}Connection: close{}{}'.format(
+                GET_METHOD, requested_file.name, HTTP_VERSION, CRLF, CRLF, CRLF
+            ).encode()
+            with server.create_tcp_socket() as client:
+                client.connect(server.DEFAULT_ADDR)
+                client.sendall(request)
+                response = self._recv_all(client)
+
+        expected_head = (
+            HTTP_VERSION + ' 200 OK' + CRLF
+            + 'Content-Type: text/plain' + CRLF
+            + 'Content-Length: {}'.format(len(contents)) + CRLF
+            + 'Connection: close' + CRLF
+            + CRLF
+        ).encode()
+        self.assertEqual(response[:len(expected_head)], expected_head)
+        self.assertTrue(response[len(expected_head):] == contents)
+
+    def test_not_found_keep_alive(self) -> None:
+        # The 404 has an explicit empty body, so the connection can carry
+        # the next request without waiting for a timeout.
+        request = '{} /nonexistent/file {}{}{}'.format(
+            GET_METHOD, HTTP_VERSION, CRLF, CRLF
+        ).encode()
+        expected = (
+            HTTP_VERSION + ' 404 Not Found' + CRLF
+            + 'Content-Length: 0' + CRLF
+            + 'Connection: keep-alive' + CRLF
+            + CRLF
+        ).encode()
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.settimeout(1)
+            for _ in range(2):
+                client.sendall(request)
+                self.assertEqual(
+                    self._recv_exactly(client, len(expected)), expected
+                )
+
+    def test_ranges(self) -> None:
+        contents = os.urandom(1024 * 1024)
+        with tempfile.NamedTemporaryFile() as requested_file:
+            requested_file.write(contents)
+            requested_file.flush()
+
+            request = '{} {} {}{}Range: bytes=10-19,-5{}{}'.format(
+                GET_METHOD, requested_file.name, HTTP_VERSION, CRLF, CRLF, CRLF
+            ).encode()
+            with server.create_tcp_socket() as client:
+                client.connect(server.DEFAULT_ADDR)
+                client.sendall(request)
+                head = self._recv_head(client)
+                length = int(
+                    head.split(b'Content-Length: ')[1].split(b'\r\n')[0]
+                )
+                body = self._recv_exactly(client, length)
+
+        self.assertTrue(head.startswith(
+            (HTTP_VERSION + ' 206 Partial Content' + CRLF).encode()
+        ))
+        self.assertIn(b'multipart/byteranges', head)
+        self.assertEqual(len(body), length)
+        self.assertIn(
+            b'Content-Range: bytes 10-19/1048576\r\n\r\n' + contents[10:20],
+            body
+        )
+        self.assertIn(
+            b'Content-Range: bytes 1048571-1048575/1048576\r\n\r\n'
+            + contents[-5:],
+            body
+        )
+
+    def _recv_head(self, client: socket.socket) -> bytes:
+        head = b''
+        while not head.endswith(b'\r\n\r\n'):
+            chunk = client.recv(1)
+            if chunk == b'':
+                break
+            head += chunk
+        return head
+
+
+class ServerPreforkTestCase(ServerTestCase):
+    # Test a pre-forking server with 2 worker processes, each of which
+    # responds with its process ID.
+
+    _script = 'server_prefork.py'
+
+    def test_prefork(self) -> None:
+        pids = self._get_pids()
+        self.assertNotIn(self._server.pid, pids)
+        self.assertLessEqual(len(pids), 2)
+
+    def test_restart_crashed_worker(self) -> None:
+        self.assertEqual(self._get_response('/crash'), b'')
+
+        # The worker crashed soon after starting, so the master waits a
+        # second before replacing it.
+        time.sleep(1.5)
+        pids = self._get_pids()
+        self.assertLessEqual(len(pids), 2)
+        self.assertEqual(self._server.poll(), None)
+
+    def test_reload(self) -> None:
+        old_pids = self._get_pids()
+        self._server.send_signal(signal.SIGHUP)
+        self._wait()
+        new_pids = self._get_pids()
+        self.assertEqual(old_pids & new_pids, set())
+        self.assertEqual(self._server.poll(), None)
+
+    def test_graceful_shutdown(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request('/slow'))
+            self._wait()
+            self._server.terminate()
+            response = self._recv_all(client)
+        self.assertTrue(response.startswith(
+            (HTTP_VERSION + ' 200 OK' + CRLF).encode()
+        ))
+        self.assertEqual(self._server.wait(5), 0)
+
+    def _get_pids(self) -> Set[int]:
+        # Get the process IDs of the workers that respond to a number of
+        # requests.
+        return {
+            int(self._get_response('/').split(b'\r\n\r\n')[1])
+            for _ in range(10)
+        }
+
+    def _get_response(self, uri: str) -> bytes:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request(uri, 'Connection: close'))
+            return self._recv_all(client)
+
+    @staticmethod
+    def _request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+
+class ServerMetricsTestCase(ServerTestCase):
+    # Test a server that counts requests by route and serves the counts at
+    # /metrics.
+
+    _script = 'server_metrics.py'
+
+    def test_metrics(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request('/hello/foo') + self._request('/hello/bar')
+                + self._request('/nowhere')
+                + self._request('/metrics', 'Connection: close')
+            )
+            lines = self._recv_all(client).decode().splitlines()
+
+        for expected in (
+                'http_server_connections_total 1',
+                'http_server_requests_total'
+                '{route="/hello/{name}",status="200"} 2',
+                'http_server_requests_total{route="",status="404"} 1',
+                'http_server_phase_duration_seconds_count{phase="read"} 3',
+                'http_server_phase_duration_seconds_count{phase="send"} 3'):
+            with self.subTest(expected=expected):
+                self.assertIn(expected, lines)
+
+    @staticmethod
+    def _request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+
+class ServerCLIMetricsTestCase(ServerTestCase):
+    # Test a server run from the command line with --metrics, whose handler
+    # accepts every method.
+
+    _script = 'server_cli_metrics.py'
+
+    def test_metrics(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request(POST_METHOD, '/echo', 'Content-Length: 5')
+                + b'hello'
+                + self._request(GET_METHOD, '/metrics', 'Connection: close')
+            )
+            response = self._recv_all(client)
+
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'\r\n\r\nhello', response)
+        self.assertIn(
+            b'http_server_requests_total{route="/echo",status="200"} 1',
+            response
+        )
+
+    @staticmethod
+    def _request(method: str, uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            method, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+
+class ServerAccessLogTestCase(ServerTestCase):
+    # Test a server that logs requests as JSON lines to a file.
+
+    _script = 'server_access_log.py'
+
+    _log_path = os.path.join(
+        tempfile.gettempdir(), 'http_server_access_log.jsonl'
+    )
+
+    def test_access_log(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request('/hello', 'User-Agent: test')
+                + self._request('/nowhere', 'Connection: close')
+            )
+            self._recv_all(client)
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(b'not a request\r\n\r\n')
+            self._recv_all(client)
+
+        # Wait for the log to be flushed.
+        time.sleep(0.3)
+        with open(self._log_path) as f:
+            entries = [json.loads(line) for line in f]
+
+        self.assertEqual(
+            [(entry['request'], entry['status'], entry['body_bytes'])
+             for entry in entries],
+            [
+                ('GET /hello HTTP/1.1', 200, 5),
+                ('GET /nowhere HTTP/1.1', 404, 0),
+                ('not a request', 400, None),
+            ]
+        )
+        self.assertEqual(entries[0]['user_agent'], 'test')
+        self.assertEqual(entries[0]['remote_addr'], '127.0.0.1')
+        self.assertGreater(entries[0]['duration'], 0)
+
+    @staticmethod
+    def _request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+
+class ServerTimeoutsTestCase(ServerTestCase):
+    # Test a single-threaded server with short timeouts, which must not let
+    # one slow client hold up the others.
+
+    _script = 'server_timeouts.py'
+
+    def test_header_timeout(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(b'GET /hello HTTP/1.1\r\n')
+            response = self._recv_all(client)
+        self.assertTrue(response.startswith(
+            (HTTP_VERSION + ' 408 Request Timeout' + CRLF).encode()
+        ))
+        self.assertIn(b'Connection: close', response)
+        self._assert_timeouts('header')
+
+    def test_body_timeout(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request('/echo', 'Content-Length: 10') + b'01234'
+            )
+            response = self._recv_all(client)
+        self.assertTrue(response.startswith(
+            (HTTP_VERSION + ' 408 Request Timeout' + CRLF).encode()
+        ))
+        self._assert_timeouts('body')
+
+    def test_ignored_body_timeout(self) -> None:
+        # The handler's response doesn't wait for the body, but the
+        # connection can't be reused without it.
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request('/hello', 'Content-Length: 10') + b'01234'
+            )
+            response = self._recv_all(client)
+        self.assertTrue(response.startswith(
+            (HTTP_VERSION + ' 200 OK' + CRLF).encode()
+        ))
+        self.assertIn(b'Connection: close', response)
+        self._assert_timeouts('body')
+
+    def test_body(self) -> None:
+        # The body is discarded, so the next request is read from the right
+        # place.
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request('/hello', 'Content-Length: 10') + b'0123456789'
+                + self._request('/hello', 'Connection: close')
+            )
+            response = self._recv_all(client)
+        self.assertEqual(response.count(b' 200 OK' + CRLF.encode()), 2)
+
+    def test_handler_timeout(self) -> None:
+        start = time.monotonic()
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request('/slow'))
+            response = self._recv_all(client)
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertTrue(response.startswith(
+            (HTTP_VERSION + ' 503 Service Unavailable' + CRLF).encode()
+        ))
+
+        # The slow handler is still running in the server's only handler
+        # thread, so the next request times out without being handled.
+        self.assertTrue(self._get('/hello').startswith(
+            (HTTP_VERSION + ' 503 Service Unavailable' + CRLF).encode()
+        ))
+        time.sleep(1.5)
+        self._assert_timeouts('handler', 2)
+
+    def test_write_timeout(self) -> None:
+        # A client that never reads its response is disconnected, after which
+        # the server serves other clients.
+        with server.create_tcp_socket() as client:
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request('/large'))
+            time.sleep(1)
+            self.assertEqual(
+                self._get('/hello', 'Connection: close').split(b'\r\n')[0],
+                (HTTP_VERSION + ' 200 OK').encode()
+            )
+        self._assert_timeouts('write')
+
+    def _assert_timeouts(self, kind: str, count: int = 1) -> None:
+        metrics = self._get('/metrics', 'Connection: close').decode()
+        self.assertIn(
+            'http_server_timeouts_total{{kind="{}"}} {}'.format(kind, count),
+            metrics.splitlines()
+        )
+
+    def _get(self, uri: str, *headers: str) -> bytes:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request(uri, *headers))
+            return self._recv_all(client)
+
+    @staticmethod
+    def _request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+
+class ServerAdmissionTestCase(ServerTestCase):
+    # Test a server that handles one request at a time and rejects
+    # connections that wait too long for a worker.
+
+    _script = 'server_admission.py'
+
+    def test_max_in_flight(self) -> None:
+        with server.create_tcp_socket() as slow_client:
+            slow_client.connect(server.DEFAULT_ADDR)
+            slow_client.sendall(self._request('/slow', 'Connection: close'))
+            time.sleep(0.2)
+
+            # The other worker is free, but the slow request is still being
+            # handled.
+            response = self._get('/hello', 'Connection: close')
+            self.assertTrue(response.startswith(
+                (HTTP_VERSION + ' 503 Service Unavailable' + CRLF).encode()
+            ))
+            self.assertIn(b'Retry-After: 5' + CRLF.encode(), response)
+
+            self.assertTrue(self._recv_all(slow_client).startswith(
+                (HTTP_VERSION + ' 200 OK' + CRLF).encode()
+            ))
+        self._assert_rejections('in_flight')
+
+    def test_max_queue_time(self) -> None:
+        with server.create_tcp_socket() as slow_client, \
+                server.create_tcp_socket() as idle_client:
+            slow_client.connect(server.DEFAULT_ADDR)
+            slow_client.sendall(self._request('/slow', 'Connection: close'))
+            idle_client.connect(server.DEFAULT_ADDR)
+            time.sleep(0.2)
+
+            # Both workers are busy, so this connection waits in the queue
+            # until the slow request has been served, which is too long.
+            response = self._get('/hello', 'Connection: close')
+            self.assertTrue(response.startswith(
+                (HTTP_VERSION + ' 503 Service Unavailable' + CRLF).encode()
+            ))
+            self.assertIn(b'Retry-After: 5' + CRLF.encode(), response)
+            self._recv_all(slow_client)
+        self._assert_rejections('queue_time')
+
+    def _assert_rejections(self, reason: str) -> None:
+        metrics = self._get('/metrics', 'Connection: close').decode()
+        self.assertIn(
+            'http_server_rejections_total{{reason="{}"}} 1'.format(reason),
+            metrics.splitlines()
+        )
+
+    def _get(self, uri: str, *headers: str) -> bytes:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request(uri, *headers))
+            return self._recv_all(client)
+
+    @staticmethod
+    def _request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+
+class ServerUploadTestCase(ServerTestCase):
+    # Test a server whose handlers accept every method and read request
+    # bodies.
+
+    _script = 'server_upload.py'
+
+    def test_upload(self) -> None:
+        spooled = b'x' * 100
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request(POST_METHOD, '/echo', 'Content-Length: 5')
+                + b'hello'
+                + self._request(
+                    PUT_METHOD, '/length', 'Transfer-Encoding: chunked'
+                )
+                + b'3\r\nabc\r\n4;x=y\r\ndefg\r\n0\r\n\r\n'
+                + self._request(
+                    POST_METHOD, '/spool', 'Content-Length: 100',
+                    'Connection: close'
+                )
+                + spooled
+            )
+            response = self._recv_all(client)
+        for body in (b'hello', b'7', spooled):
+            with self.subTest(body=body):
+                self.assertIn(
+                    'Content-Length: {}'.format(len(body)).encode()
+                    + (CRLF + 'Connection: ').encode(), response
+                )
+                self.assertIn(body, response)
+
+    def test_expect_continue(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request(
+                POST_METHOD, '/echo', 'Content-Length: 5',
+                'Expect: 100-continue', 'Connection: close'
+            ))
+            continue_response = (
+                HTTP_VERSION + ' 100 Continue' + CRLF + CRLF
+            ).encode()
+            self.assertEqual(
+                self._recv_exactly(client, len(continue_response)),
+                continue_response
+            )
+            client.sendall(b'hello')
+            response = self._recv_all(client)
+        self.assertTrue(response.startswith(
+            (HTTP_VERSION + ' 200 OK' + CRLF).encode()
+        ))
+        self.assertTrue(response.endswith(b'hello'))
+
+    def test_ignored_body(self) -> None:
+        # The body that the handler ignores is discarded, so the next
+        # request is read from the right place.
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request(POST_METHOD, '/hello', 'Content-Length: 10')
+                + b'0123456789'
+                + self._request(GET_METHOD, '/hello', 'Connection: close')
+            )
+            response = self._recv_all(client)
+        self.assertEqual(response.count(b' 200 OK' + CRLF.encode()), 2)
+
+    def test_head(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request(HEAD_METHOD, '/hello')
+                + self._request(GET_METHOD, '/hello', 'Connection: close')
+            )
+            response = self._recv_all(client)
+        head = (
+            HTTP_VERSION + ' 200 OK' + CRLF
+            + 'Content-Type: text/plain' + CRLF
+            + 'Content-Length: 5' + CRLF
+        )
+        self.assertEqual(response, (
+            head + 'Connection: keep-alive' + CRLF + CRLF
+            + head + 'Connection: close' + CRLF + CRLF + 'hello'
+        ).encode())
+
+    def test_body_too_large(self) -> None:
+        for headers in (('Content-Length: 2000000',),
+                        ('Transfer-Encoding: chunked',)):
+            with self.subTest(headers=headers):
+                with server.create_tcp_socket() as client:
+                    client.connect(server.DEFAULT_ADDR)
+                    client.sendall(
+                        self._request(POST_METHOD, '/echo', *headers)
+                        + b'200000\r\n'
+                    )
+                    response = self._recv_all(client)
+                self.assertEqual(
+                    response, get_error_response(413).get_bytes(False)
+                )
+
+    def test_invalid_body(self) -> None:
+        for headers, expected in (
+                (('Content-Length: 5', 'Transfer-Encoding: chunked'), 400),
+                (('Transfer-Encoding: gzip',), 501)):
+            with self.subTest(headers=headers):
+                with server.create_tcp_socket() as client:
+                    client.connect(server.DEFAULT_ADDR)
+                    client.sendall(
+                        self._request(POST_METHOD, '/echo', *headers)
+                    )
+                    response = self._recv_all(client)
+                self.assertEqual(
+                    response, get_error_response(expected).get_bytes(False)
+                )
+
+    @staticmethod
+    def _request(method: str, uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            method, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
+
+
+class ServerProxyTestCase(ServerTestCase):
+    # Test a server that forwards requests to the echo and streaming servers,
+    # which run as its upstream servers.
+
+    _script = 'server_proxy.py'
+
+    def test_proxy(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            for uri in ('/hello', '/hello/world'):
+                client.sendall(self._request(uri))
+                body = uri[1:]
+                expected = (
+                    HTTP_VERSION + ' 200 OK' + CRLF
+                    + 'Content-Type: text/plain' + CRLF
+                    + 'Via: 1.1 http_server' + CRLF
+                    + 'Content-Length: {}'.format(len(body)) + CRLF
+                    + 'Connection: keep-alive' + CRLF
+                    + CRLF + body
+                ).encode()
+                self.assertEqual(
+                    self._recv_exactly(client, len(expected)), expected
+                )
+
+    def test_proxy_streaming(self) -> None:
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(
+                self._request('/stream/foo/barbaz', 'Connection: close')
+            )
+            response = self._recv_all(client)
+        head, _, body = response.partition((CRLF + CRLF).encode())
+        self.assertIn(b'Transfer-Encoding: chunked', head)
+        self.assertIn(b'barbaz', body)
+        self.assertTrue(body.endswith(('0' + CRLF + CRLF).encode()))
+
+    def test_proxy_streaming_failure(self) -> None:
+        # The upstream server closes the connection partway through the
+        # body, so the proxy does the same.
+        with server.create_tcp_socket() as client:
+            client.connect(server.DEFAULT_ADDR)
+            client.sendall(self._request('/stream/foo/fail'))
+            response = self._recv_all(client)
+        self.assertIn(b'foo', response)
+        self.assertFalse(response.endswith(('0' + CRLF + CRLF).encode()))
+
+    def test_proxy_bench(self) -> None:
+        result = run_benchmark(
+            [create_request('/hello'), create_request('/hello/world')],
+            concurrency=4,
+            duration=0.5
+        )
+        self.assertGreater(result.statuses[200], 0)
+        self.assertEqual(result.error_count, 0)
+
+    @staticmethod
+    def _request(uri: str, *headers: str) -> bytes:
+        return '{} {} {}{}{}{}'.format(
+            GET_METHOD, uri, HTTP_VERSION, CRLF,
+            ''.join(header + CRLF for header in headers), CRLF
+        ).encode()
@@ -0,0 +1,290 @@
+import gzip
+import os
+import tempfile
+import unittest
+from typing import Tuple
+
+from http_server.conditional import get_validators
+from http_server.requests import parse, Request
+from http_server.responses import FileResponse, Response
+from http_server.static_cache import StaticFileCache
+
+
+class StaticFileCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self._dir.cleanup()
+
+    def test_hit_miss(self) -> None:
+        path = self.write_file('foo.txt', b'foo')
+        cache = StaticFileCache(self.get_content_type)
+
+        response = cache.get(path)
+        self.assertEqual(response, self.get_response(path, b'foo'))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        self.assertIs(cache.get(path), response)
+        self.assertIs(cache.get(path), response)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertEqual((len(cache), cache.size), (1, 3))
+
+    def test_not_a_file(self) -> None:
+        cache = StaticFileCache(self.get_content_type)
+        self.assertIsNone(cache.get(os.path.join(self._dir.name, 'missing')))
+        self.assertIsNone(cache.get(self._dir.name))
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction(self) -> None:
+        paths = [
+            self.write_file(name, b'x' * 10) for name in ('a', 'b', 'c')
+        ]
+        cache = StaticFileCache(self.get_content_type, max_size=25)
+
+        cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])  # Now paths[1] is the least recently used.
+        cache.get(paths[2])
+        self.assertEqual((len(cache), cache.size, cache.evictions), (2, 20, 1))
+
+        cache.get(paths[0])
+        cache.get(paths[2])
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+
+        cache.get(paths[1])
+        self.assertEqual(cache.misses, 4)
+
+    def test_large_file(self) -> None:
+        path = self.write_file('large', b'x' * 100)
+        cache = StaticFileCache(self.get_content_type, max_file_size=99)
+
+        response = cache.get(path)
+        assert response is not None
+        try:
+            self.assertIsInstance(response, FileResponse)
+            self.assertEqual(
+                response.get_bytes(),
+                self.get_response(path, b'x' * 100).get_bytes()
+            )
+        finally:
+            response.close()
+        self.assertEqual(len(cache), 0)
+
+    def test_revalidate_modified(self) -> None:
+        path = self.write_file('foo.txt', b'foo')
+        cache = StaticFileCache(self.get_content_type, revalidate_interval=0)
+        first = cache.get(path)
+
+        # Unchanged, so the cached response is still valid.
+        self.assertIs(cache.get(path), first)
+
+        self.write_file('foo.txt', b'bar')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(cache.get(path), self.get_response(path, b'bar'))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_revalidate_interval(self) -> None:
+        path = self.write_file('foo.txt', b'foo')
+        cache = StaticFileCache(self.get_content_type, revalidate_interval=60)
+        first = cache.get(path)
+
+        # The file is not checked again until the interval has passed.
+        self.write_file('foo.txt', b'bar')
+        self.assertIs(cache.get(path), first)
+
+    def test_revalidate_deleted(self) -> None:
+        path = self.write_file('foo.txt', b'foo')
+        cache = StaticFileCache(self.get_content_type, revalidate_interval=0)
+        cache.get(path)
+        os.remove(path)
+        self.assertIsNone(cache.get(path))
+        self.assertEqual(len(cache), 0)
+
+    def test_not_modified(self) -> None:
+        path = self.write_file('foo.txt', b'foo')
+        cache = StaticFileCache(self.get_content_type)
+        validators = dict(get_validators(os.stat(path)))
+        not_modified = self.get_not_modified(path)
+
+        request = self.get_request('If-None-Match', validators['ETag'])
+        self.assertEqual(cache.get(path, request), not_modified)
+        self.assertEqual(cache.get(path, request), not_modified)
+
+        request = self.get_request(
+            'If-Modified-Since', validators['Last-Modified']
+        )
+        self.assertEqual(cache.get(path, request), not_modified)
+
+        request = self.get_request('If-None-Match', '"other"')
+        self.assertEqual(
+            cache.get(path, request), self.get_response(path, b'foo')
+        )
+
+    def test_large_file_not_modified(self) -> None:
+        path = self.write_file('large', b'x' * 100)
+        cache = StaticFileCache(self.get_content_type, max_file_size=99)
+        validators = dict(get_validators(os.stat(path)))
+
+        request = self.get_request('If-None-Match', validators['ETag'])
+        self.assertEqual(
+            cache.get(path, request),
+            self.get_not_modified(path)
+        )
+
+    def test_range(self) -> None:
+        path = self.write_file('foo.txt', b'foo bar')
+        cache = StaticFileCache(self.get_content_type)
+        etag = dict(get_validators(os.stat(path)))['ETag']
+
+        response = cache.get(path, self.get_request('Range', 'bytes=4-'))
+        assert response is not None
+        try:
+            self.assertEqual(response.status_code, 206)
+            self.assertTrue(response.get_bytes().endswith(b'\r\n\r\nbar'))
+        finally:
+            response.close()
+        self.assertEqual(len(cache), 0)
+
+        # If the file has changed, the whole file is sent.
+        request = parse(
+            'GET / HTTP/1.1\r\nRange: bytes=4-\r\nIf-Range: "old"\r\n\r\n'
+        )
+        response = cache.get(path, request)
+        assert response is not None
+        try:
+            self.assertEqual(response.status_code, 200)
+        finally:
+            response.close()
+
+        request = parse(
+            'GET / HTTP/1.1\r\nRange: bytes=4-\r\nIf-Range: {}\r\n\r\n'
+            .format(etag)
+        )
+        response = cache.get(path, request)
+        assert response is not None
+        try:
+            self.assertEqual(response.status_code, 206)
+        finally:
+            response.close()
+
+    def test_range_unsatisfiable(self) -> None:
+        path = self.write_file('foo.txt', b'foo bar')
+        cache = StaticFileCache(self.get_content_type)
+        response = cache.get(path, self.get_request('Range', 'bytes=7-'))
+        assert response is not None
+        self.assertEqual(response.status_code, 416)
+
+    def test_compressed(self) -> None:
+        contents = b'hello ' * 1000
+        path = self.write_file('foo.txt', contents)
+        cache = StaticFileCache(self.get_content_type)
+        request = self.get_request('Accept-Encoding', 'gzip')
+
+        response = cache.get(path, request)
+        assert response is not None
+        self.assertIn(('Content-Encoding', 'gzip'), response.headers)
+        self.assertIn(('Vary', 'Accept-Encoding'), response.headers)
+        assert response.message_body is not None
+        self.assertEqual(gzip.decompress(response.message_body), contents)
+
+        # The compressed variant is cached alongside the uncompressed file.
+        self.assertIs(cache.get(path, request), response)
+        self.assertEqual(
+            cache.size, len(contents) + len(response.message_body)
+        )
+        uncompressed = cache.get(path)
+        assert uncompressed is not None
+        self.assertEqual(uncompressed.message_body, contents)
+        self.assertIn(('Vary', 'Accept-Encoding'), uncompressed.headers)
+
+        # The compressed variant has its own entity tag.
+        etag = dict(response.headers)['ETag']
+        self.assertNotEqual(etag, dict(uncompressed.headers)['ETag'])
+        not_modified = cache.get(path, parse(
+            'GET / HTTP/1.1\r\nAccept-Encoding: gzip\r\n'
+            'If-None-Match: {}\r\n\r\n'.format(etag)
+        ))
+        assert not_modified is not None
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_compressed_after_uncompressed(self) -> None:
+        contents = b'hello ' * 1000
+        path = self.write_file('foo.txt', contents)
+        cache = StaticFileCache(self.get_content_type)
+
+        # The compressed variant is added to a fresh cached entry.
+        self.assertIsNotNone(cache.get(path))
+        response = cache.get(path, self.get_request('Accept-Encoding', 'gzip'))
+        assert response is not None
+        self.assertIn(('Content-Encoding', 'gzip'), response.headers)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_precompressed(self) -> None:
+        contents = b'hello ' * 1000
+        path = self.write_file('foo.txt', contents)
+        precompressed = gzip.compress(contents, 1)
+        self.write_file('foo.txt.gz', precompressed)
+        cache = StaticFileCache(self.get_content_type)
+
+        response = cache.get(path, self.get_request('Accept-Encoding', 'gzip'))
+        assert response is not None
+        self.assertEqual(response.message_body, precompressed)
+
+    def test_large_file_precompressed(self) -> None:
+        contents = b'hello ' * 1000
+        path = self.write_file('foo.txt', contents)
+        precompressed = gzip.compress(contents)
+        self.write_file('foo.txt.gz', precompressed)
+        cache = StaticFileCache(self.get_content_type, max_file_size=100)
+
+        response = cache.get(path, self.get_request('Accept-Encoding', 'gzip'))
+        assert response is not None
+        try:
+            self.assertIsInstance(response, FileResponse)
+            self.assertIn(('Content-Encoding', 'gzip'), response.headers)
+            self.assertTrue(response.get_bytes().endswith(precompressed))
+        finally:
+            response.close()
+
+        response = cache.get(path)
+        assert response is not None
+        try:
+            self.assertNotIn(('Content-Encoding', 'gzip'), response.headers)
+            self.assertIn(('Vary', 'Accept-Encoding'), response.headers)
+            self.assertTrue(response.get_bytes().endswith(contents))
+        finally:
+            response.close()
+
+    def write_file(self, name: str, contents: bytes) -> str:
+        path = os.path.join(self._dir.name, name)
+        with open(path, 'wb') as written_file:
+            written_file.write(contents)
+        return path
+
+    def get_response(self, path: str, message_body: bytes) -> Response:
+        return Response(
+            200,
+            self.get_content_type(path),
+            message_body,
+            get_validators(os.stat(path)) + [('Accept-Ranges', 'bytes')]
+        )
+
+    @staticmethod
+    def get_not_modified(path: str) -> Response:
+        headers = get_validators(os.stat(path)) + [('Accept-Ranges', 'bytes')]
+        return Response(304, headers=headers)
+
+    @staticmethod
+    def get_request(name: str, value: str) -> Request:
+        request = parse('GET / HTTP/1.1\r\n{}: {}\r\n\r\n'.format(
+            name, value
+        ))
+        assert request is not None
+        return request
+
+    @staticmethod
+    def get_content_type(path: str) -> Tuple[str, str]:
+        return ('text', 'plain')